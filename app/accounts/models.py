@@ -3,7 +3,10 @@ Contains models for Account
 """
 
 # SQL Model imports
-from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel import Field, SQLModel, Relationship, Index
+
+# SQLAlchemy imports
+from sqlalchemy import Column, Integer, text
 
 # Standard library imports
 import uuid
@@ -14,17 +17,28 @@ from datetime import date
 from ..properties.models import Property
 
 
+# Row version, bumped by the ORM on every update and used for ETags
+account_version = Column("version", Integer, nullable=False, server_default="1")
+
+
 class Account(SQLModel, table=True):
 
     # Table arguments
     __tablename__ = "accounts"
 
+    __mapper_args__ = {"version_id_col": account_version}
+
+    __table_args__ = (
+        Index("ix_accounts_created_id", "created", "id"),
+    )
+
     # Main fields
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     fname: str 
     lname: str
     email: str
-    created: date = Field(default=date.today())
+    created: date | None = Field(default=None, nullable=False, sa_column_kwargs={"server_default": text("CURRENT_DATE")})
+    version: int = Field(default=1, sa_column=account_version)
 
     # Relationships
     properties: list[Property] = Relationship(back_populates="account", sa_relationship_kwargs={"cascade": "delete"})
@@ -41,6 +55,10 @@ class AccountRead(SQLModel):
     email: str
     created: date
 
+class AccountBatchRead(SQLModel):
+    items: list[AccountRead]
+    missing: list[uuid.UUID]
+
 class AccountUpdate(SQLModel):
     fname: str | None = None
     lname: str | None = None
@@ -3,23 +3,52 @@ Contains routes to access Accounts
 """
 
 # FastAPI imports
-from fastapi import APIRouter, Depends, Query, Path, Body, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Path, Body, HTTPException, Request, Response
 
 # SQLModel imports
 from sqlmodel import Session, select
 
 # Model imports
-from .models import Account, AccountCreate, AccountRead, AccountUpdate
+from .models import Account, AccountBatchRead, AccountCreate, AccountRead, AccountUpdate
+from ..properties.models import Property
+from ..property_images.models import PropertyImage
+
+# Blob reference counting imports
+from ..property_images.blobs import release_images
+
+# Blob deletion imports
+from ..property_images.deletions import process_blob_deletions
 
 # Dependency imports
-from ..dependencies import get_session
+from ..dependencies import get_session, get_cache
+
+# Cache imports
+from ..cache import Cache
+
+# Routing imports
+from ..routing import AppRoute
+
+# Pagination imports
+from ..pagination import paginate, NEXT_CURSOR_HEADER
+
+# Batch get imports
+from ..batch import BatchGetRequest, get_by_ids, parse_ids
+
+# Conditional request imports
+from ..conditional import make_etag, make_list_etag, not_modified, not_modified_response, check_if_match
+
+# Write imports
+from ..writes import insert_returning, update_returning
+
+# Serialization imports
+from ..serialization import field_columns, json_response, parse_fields, row_names, rows_response
 
 # Standard library imports
 import uuid
 
 
 # Initializing router
-router = APIRouter(prefix="/accounts")
+router = APIRouter(prefix="/accounts", route_class=AppRoute)
 
 
 ### HTTP GET FUNCTIONS ###
@@ -28,30 +57,91 @@ router = APIRouter(prefix="/accounts")
 def get_all_accounts(
     *,
     session: Session = Depends(get_session),
-    offset: int = Query(default=0),
+    request: Request,
+    response: Response,
+    cursor: str | None = Query(default=None),
+    offset: int | None = Query(default=None),
     limit: int = Query(default=100, lte=100),
+    fields: list[str] = Query(default=[]),
 ):
-
-    # Get list of accounts
-    accounts = session.exec(select(Account).offset(offset).limit(limit)).all()
+    """
+    Get a page of accounts
+
+    fields=id,email returns only those fields of each account.
+    """
+
+    # Get page of accounts as column tuples, selecting only the fields asked for
+    projection: list[str] | None = parse_fields(fields, Account, AccountRead)
+    accounts = paginate(session, select(*field_columns(Account, AccountRead, projection, Account.created)),
+                        response=response,
+                        sort_column=Account.created,
+                        id_column=Account.id,
+                        cursor=cursor,
+                        offset=offset,
+                        limit=limit)
+
+    # Skip the body if the client already has this page
+    etag: str = make_list_etag(accounts, response.headers.get(NEXT_CURSOR_HEADER), *(projection or []))
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
 
     # Return list of accounts
-    return accounts
+    return rows_response(accounts, projection or row_names(Account, AccountRead), response)
+
+
+@router.get("/batch", response_model=AccountBatchRead)
+def get_accounts_by_ids(
+    *,
+    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    ids: str = Query()
+):
+    """
+    Get several accounts by a comma separated list of ids
+
+    Accounts come back in the order asked for. Ids with no account
+    are listed under missing instead of failing the request.
+    """
+
+    # Get the accounts in one query
+    accounts, missing = get_by_ids(session, Account, parse_ids(ids))
+
+    # Skip the body if the client already has these versions
+    etag: str = make_list_etag(accounts, *missing)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+
+    # Return the accounts found and the ids that weren't
+    return AccountBatchRead(items=accounts, missing=missing)
 
 
 @router.get("/{account_id}", response_model=AccountRead)
 def get_account_by_id(
     *,
     session: Session = Depends(get_session),
-    account_id: uuid.UUID = Path()
+    request: Request,
+    response: Response,
+    account_id: uuid.UUID = Path(),
+    fields: list[str] = Query(default=[])
 ):
-    # Get account and check if it exists
-    account = session.get(Account, account_id)
+    # Get account, with only the fields asked for, and check if it exists
+    projection: list[str] | None = parse_fields(fields, Account, AccountRead)
+    account = session.execute(select(*field_columns(Account, AccountRead, projection))
+                              .where(Account.id == account_id)).one_or_none()
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
 
+    # Skip the body if the client already has this version
+    etag: str = make_etag(account.id, account.version, *(projection or []))
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+
     # Return back account
-    return account
+    return json_response(dict(zip(projection or row_names(Account, AccountRead), account)), response)
 
 
 ### HTTP POST FUNCTIONS ###
@@ -62,16 +152,31 @@ def create_account(
     session: Session = Depends(get_session),
     account: AccountCreate = Body()
 ):
-    # Create account by using from_orm function
-    db_account = Account.from_orm(account)
+    # Insert the account and read it back in one statement
+    row = insert_returning(session, Account, AccountRead, account.dict())
 
     # Commit to DBMS
-    session.add(db_account)
     session.commit()
-    session.refresh(db_account)
 
     # Return back account
-    return db_account
+    return AccountRead.parse_obj(row._mapping)
+
+
+@router.post("/batch", response_model=AccountBatchRead)
+def get_accounts_by_ids_post(
+    *,
+    session: Session = Depends(get_session),
+    batch: BatchGetRequest = Body()
+):
+    """
+    Get several accounts by ids sent in the body, for lists too long for a URL
+    """
+
+    # Get the accounts in one query
+    accounts, missing = get_by_ids(session, Account, batch.ids)
+
+    # Return the accounts found and the ids that weren't
+    return AccountBatchRead(items=accounts, missing=missing)
 
 
 ### HTTP PATCH FUNCTIONS ###
@@ -80,6 +185,8 @@ def create_account(
 def update_account(
     *,
     session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
     account_id: uuid.UUID = Path(),
     account: AccountUpdate = Body()
 ):
@@ -89,18 +196,19 @@ def update_account(
     if not db_account:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    # Update account data
-    account_data = account.dict(exclude_unset=True)
-    for key, value in account_data.items():
-        setattr(db_account, key, value)
+    # Check the client is editing the latest version
+    check_if_match(request, make_etag(db_account.id, db_account.version))
+
+    # Update account data and read it back in one statement
+    row = update_returning(session, Account, AccountRead, account_id, db_account.version,
+                           account.dict(exclude_unset=True))
 
     # Commit to DBMS
-    session.add(db_account)
     session.commit()
-    session.refresh(db_account)
 
-    # Return back account
-    return db_account
+    # Return back account with its new version
+    response.headers["ETag"] = make_etag(row.id, row.version)
+    return AccountRead.parse_obj(row._mapping)
 
 
 ### HTTP DELETE FUNCTIONS ###
@@ -109,6 +217,9 @@ def update_account(
 def delete_account(
     *,
     session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
+    background_tasks: BackgroundTasks,
+    request: Request,
     account_id: uuid.UUID = Path()
 ):
 
@@ -117,9 +228,29 @@ def delete_account(
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    # Commit to DBMS
+    # Check the client is deleting the latest version
+    check_if_match(request, make_etag(account.id, account.version))
+
+    # Remember the properties and images the delete cascades to
+    property_ids = session.exec(select(Property.id).where(Property.owner_id == account_id)).all()
+    images = session.exec(select(PropertyImage.checksum, PropertyImage.path)
+                          .join(Property, PropertyImage.property_id == Property.id)
+                          .where(Property.owner_id == account_id)).all()
+
+    # Delete the account and release its images' stored files
     session.delete(account)
+    queued: bool = release_images(session, images)
+
+    # Commit to DBMS
     session.commit()
 
+    # Drop cached copies of the deleted properties
+    for property_id in property_ids:
+        cache.invalidate(f"property:{property_id}", f"property_images:{property_id}", f"property_reviews:{property_id}")
+
+    # Delete unreferenced files once the response is sent
+    if queued:
+        background_tasks.add_task(process_blob_deletions)
+
     # Return back an OK response
     return {"ok": True}
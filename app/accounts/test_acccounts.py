@@ -15,6 +15,10 @@ from ..main import app
 # Model imports
 from ..accounts.models import AccountCreate
 
+# Standard library imports
+import uuid
+from datetime import date
+
 # Create new client
 client: TestClient = TestClient(app)
 
@@ -99,6 +103,45 @@ class TestAccounts:
         accounts: list = response.json()
         assert len(accounts) == 3
 
+    def test_get_all_accounts_cursor(self):
+
+        # Make two more accounts so there are three in total
+        for fname in ("Mayank", "Brett"):
+            create_account(
+                AccountCreate(
+                    fname=fname,
+                    lname="Test",
+                    email=f"{fname}@cornell.edu"
+                ),
+                client_instance=client
+            )
+
+        # First page should have two accounts and a cursor
+        response = client.get("/api/accounts/", params={"limit": 2})
+        assert response.status_code == 200
+        first_page: list = response.json()
+        assert len(first_page) == 2
+        cursor: str = response.headers["X-Next-Cursor"]
+
+        # Second page should have the last account and no cursor
+        response = client.get("/api/accounts/", params={"limit": 2, "cursor": cursor})
+        assert response.status_code == 200
+        second_page: list = response.json()
+        assert len(second_page) == 1
+        assert "X-Next-Cursor" not in response.headers
+
+        # Pages should not overlap
+        ids: set = {account["id"] for account in first_page + second_page}
+        assert len(ids) == 3
+
+        # Offset paging is still supported
+        response = client.get("/api/accounts/", params={"offset": 2})
+        assert len(response.json()) == 1
+
+        # Garbage cursors are rejected
+        response = client.get("/api/accounts/", params={"cursor": "garbage"})
+        assert response.status_code == 400
+
     def test_get_account(self):
 
         # Call get on the stored account in the class
@@ -112,6 +155,63 @@ class TestAccounts:
         assert fetched_account["email"] == self.account["email"]
         assert fetched_account["created"] == self.account["created"]
 
+    def test_get_account_conditional(self):
+
+        # First get returns the account and its ETag
+        response = client.get(f"/api/accounts/{self.account['id']}")
+        etag: str = response.headers["ETag"]
+
+        # Asking again with the ETag returns an empty 304
+        response = client.get(f"/api/accounts/{self.account['id']}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        # Lists have ETags too
+        response = client.get("/api/accounts/")
+        response = client.get("/api/accounts/", headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+
+        # Updating with the current ETag works and returns a new ETag
+        response = client.patch(f"/api/accounts/{self.account['id']}", json={"fname": "Mahee"}, headers={"If-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+        # The old ETag no longer matches for reads or writes
+        response = client.get(f"/api/accounts/{self.account['id']}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        response = client.delete(f"/api/accounts/{self.account['id']}", headers={"If-Match": etag})
+        assert response.status_code == 412
+
+    def test_get_accounts_by_ids(self):
+
+        # Make a second account and an id nobody has
+        other: dict = create_account(
+            AccountCreate(
+                fname="Mayank",
+                lname="Rao",
+                email="ms3293@cornell.edu"
+            ),
+            client_instance=client
+        )
+        missing: str = str(uuid.uuid4())
+
+        # Accounts come back in the order asked for, once each, with unknown ids listed
+        ids: list[str] = [other["id"], missing, self.account["id"], other["id"]]
+        response = client.get("/api/accounts/batch", params={"ids": ",".join(ids)})
+        assert response.status_code == 200
+        assert [account["id"] for account in response.json()["items"]] == [other["id"], self.account["id"]]
+        assert response.json()["missing"] == [missing]
+
+        # The same works with the ids in the body
+        response = client.post("/api/accounts/batch", json={"ids": ids})
+        assert [account["id"] for account in response.json()["items"]] == [other["id"], self.account["id"]]
+
+        # Malformed ids and too many ids are rejected
+        response = client.get("/api/accounts/batch", params={"ids": "not-an-id"})
+        assert response.status_code == 422
+        response = client.post("/api/accounts/batch", json={"ids": [str(uuid.uuid4()) for _ in range(101)]})
+        assert response.status_code == 422
+
     ### TEST HTTP POST FUNCTIONS ###
 
     def test_create_account(self):
@@ -121,6 +221,9 @@ class TestAccounts:
         assert self.account["lname"] == "Aeron"
         assert self.account["email"] == "maa368@cornell.edu"
 
+        # The database dates the row when it is written
+        assert self.account["created"] == date.today().isoformat()
+
     ### TEST HTTP PATCH FUNCTIONS ###
 
     def test_update_account(self):
@@ -0,0 +1,188 @@
+"""
+Contains the process wide Azure Blob container clients
+
+Building a ContainerClient parses the connection string and creates a
+new HTTP pipeline and connection pool, so one client is shared by every
+request instead. It keeps TLS connections to storage warm, retries
+transient failures with short exponential backoff and records how long
+each storage call takes.
+
+The async client is optional and needs aiohttp. When it is installed,
+and the app runs on the async engine, images are streamed from storage
+on the event loop.
+"""
+
+# Azure Blob imports
+from azure.storage.blob import ContainerClient, ExponentialRetry
+from azure.core.pipeline.transport import RequestsTransport
+
+# Requests imports
+import requests
+from requests.adapters import HTTPAdapter
+
+# Metrics imports
+from .metrics import Histogram
+
+# Settings import
+from .config import settings
+
+# Standard library imports
+import threading
+import time
+from typing import Any
+
+# Shared clients, created on first use or at startup
+_container_client: ContainerClient | None = None
+_async_container_client: Any = None
+_lock = threading.Lock()
+
+# Latency of each storage operation, e.g. "PUT block" or "GET blob"
+_latency: dict[str, Histogram] = {}
+_latency_lock = threading.Lock()
+
+
+def _operation_name(http_request: Any) -> str:
+    """
+    Name a storage call by its method and its comp parameter, if any
+    """
+    return f"{http_request.method} {http_request.query.get('comp', 'blob')}"
+
+
+def _start_timer(request: Any) -> None:
+    """
+    Raw request hook, called before each attempt is sent
+    """
+    request.context["latency_start"] = time.perf_counter()
+
+
+def _stop_timer(response: Any) -> None:
+    """
+    Raw response hook, called after each attempt returns
+    """
+    start: float | None = response.context.get("latency_start")
+    if start is None:
+        return
+    name: str = _operation_name(response.http_request)
+    with _latency_lock:
+        histogram: Histogram = _latency.setdefault(name, Histogram())
+    histogram.observe(time.perf_counter() - start)
+
+
+def _client_kwargs() -> dict:
+    """
+    Get the retry, timeout and hook options shared by the sync and async clients
+    """
+    return {
+        "retry_policy": ExponentialRetry(
+            initial_backoff=settings.azure_storage_retry_backoff,
+            increment_base=2,
+            retry_total=settings.azure_storage_retry_total,
+            random_jitter_range=1,
+        ),
+        "connection_timeout": settings.azure_storage_connection_timeout,
+        "read_timeout": settings.azure_storage_read_timeout,
+        "raw_request_hook": _start_timer,
+        "raw_response_hook": _stop_timer,
+    }
+
+
+def create_container_client() -> ContainerClient:
+    """
+    Build a container client on a pooled requests session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.azure_storage_pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    kwargs: dict = _client_kwargs()
+    return ContainerClient.from_connection_string(
+        conn_str=settings.azure_storage_connection_string,
+        container_name=settings.azure_storage_container_name,
+        transport=RequestsTransport(
+            session=session,
+            session_owner=True,
+            connection_timeout=kwargs.pop("connection_timeout"),
+            read_timeout=kwargs.pop("read_timeout"),
+        ),
+        **kwargs,
+    )
+
+
+def get_container_client() -> ContainerClient:
+    """
+    Get the shared container client, creating it if needed
+    """
+    global _container_client
+    with _lock:
+        if _container_client is None:
+            _container_client = create_container_client()
+        return _container_client
+
+
+def get_async_container_client() -> Any:
+    """
+    Get the shared async container client, or None if it isn't running
+    """
+    return _async_container_client
+
+
+async def open_container_clients() -> None:
+    """
+    Create the shared clients at startup
+
+    The async client has to be made on the event loop it will run on, so
+    it is only ever created here.
+    """
+    global _async_container_client
+    if not settings.use_azure_blob:
+        return
+    get_container_client()
+    if not settings.use_async_engine:
+        return
+    try:
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+        from azure.storage.blob.aio import ContainerClient as AsyncContainerClient
+    except ImportError:
+        return
+    kwargs: dict = _client_kwargs()
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=settings.azure_storage_pool_size))
+    _async_container_client = AsyncContainerClient.from_connection_string(
+        conn_str=settings.azure_storage_connection_string,
+        container_name=settings.azure_storage_container_name,
+        transport=AioHttpTransport(
+            session=session,
+            session_owner=True,
+            connection_timeout=kwargs.pop("connection_timeout"),
+            read_timeout=kwargs.pop("read_timeout"),
+        ),
+        **kwargs,
+    )
+
+
+async def close_container_clients() -> None:
+    """
+    Close the shared clients and their connections at shutdown
+    """
+    global _container_client, _async_container_client
+    with _lock:
+        if _container_client is not None:
+            _container_client.close()
+            _container_client = None
+    if _async_container_client is not None:
+        await _async_container_client.close()
+        _async_container_client = None
+
+
+def get_storage_stats() -> dict:
+    """
+    Get the storage client settings and the latency of each operation
+    """
+    with _latency_lock:
+        latency: dict = {name: histogram.snapshot() for name, histogram in sorted(_latency.items())}
+    return {
+        "pool_size": settings.azure_storage_pool_size,
+        "retry_total": settings.azure_storage_retry_total,
+        "async_client": _async_container_client is not None,
+        "latency_seconds": latency,
+    }
@@ -0,0 +1,59 @@
+"""
+Contains helpers for the batch get-by-ids routes
+
+Clients holding a list of ids (e.g. the posters of a page of reviews)
+fetch them with one request and one "WHERE id = ANY(:ids)" query rather
+than one request each. The ids are sent as a single array parameter, so
+the statement is the same whatever the number of ids.
+"""
+
+# FastAPI imports
+from fastapi import HTTPException
+
+# SQLModel imports
+from sqlmodel import Session, SQLModel, Field, select
+
+# SQLAlchemy imports
+from sqlalchemy import any_, bindparam, cast
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+
+# Settings import
+from .config import settings
+
+# Standard library imports
+import uuid
+
+
+class BatchGetRequest(SQLModel):
+    ids: list[uuid.UUID] = Field(min_items=1)
+
+
+def parse_ids(ids: str) -> list[uuid.UUID]:
+    """
+    Parse a comma separated list of ids, raising a 422 if one is malformed
+    """
+    try:
+        return [uuid.UUID(id.strip()) for id in ids.split(",") if id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be a comma separated list of UUIDs")
+
+
+def get_by_ids(session: Session, model: type[SQLModel], ids: list[uuid.UUID]) -> tuple[list, list[uuid.UUID]]:
+    """
+    Get the rows with the given ids in the order asked for, and the ids not found
+
+    Repeated ids are returned once. Raises a 422 for more than
+    batch_get_max_ids ids.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > settings.batch_get_max_ids:
+        raise HTTPException(status_code=422, detail=f"Between 1 and {settings.batch_get_max_ids} ids are allowed")
+
+    # Fetch every row at once
+    rows = session.exec(select(model).where(
+        model.id == any_(cast(bindparam("ids", ids, type_=ARRAY(UUID(as_uuid=True))), ARRAY(UUID(as_uuid=True))))
+    )).all()
+
+    # Put them back in the order asked for
+    by_id: dict = {row.id: row for row in rows}
+    return [by_id[id] for id in ids if id in by_id], [id for id in ids if id not in by_id]
@@ -0,0 +1,247 @@
+"""
+Contains helpers for the bulk write routes
+
+A bulk body is NDJSON (one object per line) or a JSON array. NDJSON is
+read from the request as it is written, so any number of items can be
+sent with flat memory. A JSON array has to be parsed whole, so it is
+limited to max_bulk_array_bytes. Items are validated and written a chunk
+at a time, each chunk with one multi-row
+INSERT ... RETURNING in its own transaction. Invalid items are reported
+by their index and never stop the rest of the batch. If a chunk's write
+still fails in the database, e.g. because a row it references was just
+deleted, it is retried one item at a time so only the bad items fail.
+"""
+
+# FastAPI imports
+from fastapi import HTTPException, Request
+
+# SQLModel imports
+from sqlmodel import Session, SQLModel, select
+
+# SQLAlchemy imports
+from sqlalchemy.exc import DBAPIError
+
+# Pydantic imports
+from pydantic import ValidationError
+
+# Cache imports
+from .cache import Cache
+
+# Routing imports
+from .routing import call_async
+
+# Settings import
+from .config import settings
+
+# Standard library imports
+import uuid
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator
+
+# Third party imports
+import orjson
+
+# Content type of newline delimited JSON bodies
+NDJSON_MEDIA_TYPE: str = "application/x-ndjson"
+
+# Writes a chunk of validated (index, item) pairs, adding the cache tags
+# it touches to the set, and returns (index, id, created) for each row
+BulkWriter = Callable[[Session, list[tuple[int, Any]], set[str]], list[tuple[int, uuid.UUID, bool]]]
+
+
+class BulkError(SQLModel):
+    index: int
+    detail: Any
+
+
+class BulkResult(SQLModel):
+    created: int = 0
+    updated: int = 0
+    ids: list[uuid.UUID | None] = []
+    errors: list[BulkError] = []
+
+
+def _is_ndjson(content_type: str | None) -> bool:
+    return (content_type or "").split(";")[0].strip() == NDJSON_MEDIA_TYPE
+
+
+async def _next_chunk(stream: AsyncIterator[bytes]) -> bytes | None:
+    return await anext(stream, None)
+
+
+def _request_chunks(request: Request) -> Iterator[bytes]:
+    """
+    Read a request body from a sync endpoint, one received chunk at a time
+    """
+    stream: AsyncIterator[bytes] = request.stream()
+    while (chunk := call_async(_next_chunk, stream)) is not None:
+        yield chunk
+
+
+def iter_ndjson_lines(chunks: Iterable[bytes]) -> Iterator[bytes | None]:
+    """
+    Split a stream of chunks into its non-blank lines
+
+    Lines longer than max_bulk_line_bytes are yielded as None and never
+    held in memory past the limit.
+    """
+    limit: int = settings.max_bulk_line_bytes
+    pending: bytearray = bytearray()
+    too_long: bool = False
+
+    def line() -> Iterator[bytes | None]:
+        if too_long:
+            yield None
+        elif pending.strip():
+            yield bytes(pending)
+
+    for chunk in chunks:
+        start: int = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            if not too_long and len(pending) + end - start > limit:
+                too_long = True
+            if not too_long:
+                pending += chunk[start:end]
+            yield from line()
+            pending.clear()
+            too_long = False
+            start = end + 1
+        if not too_long:
+            pending += chunk[start:]
+            if len(pending) > limit:
+                too_long = True
+                pending.clear()
+    yield from line()
+
+
+def iter_ndjson_items(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Yield the raw items of an NDJSON stream, or the error each line failed with
+    """
+    for line in iter_ndjson_lines(chunks):
+        if line is None:
+            yield ValueError(f"Line is longer than {settings.max_bulk_line_bytes} bytes")
+            continue
+        try:
+            yield orjson.loads(line)
+        except orjson.JSONDecodeError as error:
+            yield ValueError(f"Invalid JSON: {error}")
+
+
+async def read_bulk_body(request: Request) -> Iterator[Any]:
+    """
+    Get the raw items of a bulk request body
+
+    NDJSON items are read from the request as the endpoint consumes them.
+    A JSON array is read and parsed here, cut off with a 413 once it is
+    larger than max_bulk_array_bytes. One that doesn't parse has no items
+    to report on, so it is rejected as a whole with a 400.
+    """
+    if _is_ndjson(request.headers.get("content-type")):
+        return iter_ndjson_items(_request_chunks(request))
+
+    body: bytearray = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > settings.max_bulk_array_bytes:
+            raise HTTPException(status_code=413, detail=f"JSON array bodies are limited to "
+                                f"{settings.max_bulk_array_bytes} bytes, send larger batches as NDJSON")
+    try:
+        items = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    return iter(items)
+
+
+def _check_references(session: Session, items: list[tuple[int, Any]], references: dict) -> dict[int, str]:
+    """
+    Find the items pointing at rows that don't exist, with one query per reference
+    """
+    errors: dict[int, str] = {}
+    for field, column in references.items():
+        wanted: set = {getattr(item, field) for _, item in items}
+        found: set = set(session.exec(select(column).where(column.in_(wanted))).all())
+        for index, item in items:
+            if getattr(item, field) not in found:
+                errors.setdefault(index, f"{field} {getattr(item, field)} does not exist")
+    return errors
+
+
+def _db_error(error: DBAPIError) -> str:
+    """
+    Get the first line of a database error, which names the problem
+    """
+    return str(error.orig).strip().splitlines()[0]
+
+
+def run_bulk(
+    session: Session,
+    cache: Cache,
+    body: Iterator[Any],
+    schema: type[SQLModel],
+    write: BulkWriter,
+    references: dict | None = None,
+) -> BulkResult:
+    """
+    Validate and write every item of a bulk body, a chunk at a time
+
+    body is the iterator of raw items from read_bulk_body. references maps item fields to the primary key columns they point at,
+    so missing rows are reported per item instead of failing the INSERT.
+    """
+    result: BulkResult = BulkResult()
+    items: Iterator[tuple[int, Any]] = enumerate(body)
+
+    while chunk := list(islice(items, settings.bulk_chunk_size)):
+
+        # Validate the chunk
+        valid: list[tuple[int, Any]] = []
+        for index, raw in chunk:
+            result.ids.append(None)
+            if isinstance(raw, Exception):
+                result.errors.append(BulkError(index=index, detail=str(raw)))
+                continue
+            try:
+                valid.append((index, schema.parse_obj(raw)))
+            except ValidationError as error:
+                result.errors.append(BulkError(index=index, detail=error.errors()))
+
+        # Drop the items referencing missing rows
+        if valid and references:
+            missing: dict[int, str] = _check_references(session, valid, references)
+            result.errors.extend(BulkError(index=index, detail=detail) for index, detail in missing.items())
+            valid = [(index, item) for index, item in valid if index not in missing]
+        if not valid:
+            session.rollback()
+            continue
+
+        # Write the chunk at once, or item by item if the database rejects it
+        tags: set[str] = set()
+        try:
+            with session.begin_nested():
+                written = write(session, valid, tags)
+        except DBAPIError:
+            written = []
+            for index, item in valid:
+                try:
+                    with session.begin_nested():
+                        written += write(session, [(index, item)], tags)
+                except DBAPIError as error:
+                    result.errors.append(BulkError(index=index, detail=_db_error(error)))
+
+        # Commit to DBMS
+        session.commit()
+        if tags:
+            cache.invalidate(*tags)
+
+        # Record what happened to each item
+        for index, id, created in written:
+            result.ids[index] = id
+            if created:
+                result.created += 1
+            else:
+                result.updated += 1
+
+    result.errors.sort(key=lambda error: error.index)
+    return result
@@ -0,0 +1,217 @@
+"""
+Contains the response cache used by read routes
+
+Entries are keyed by the request parameters plus the current version of
+every tag they depend on, e.g. "property:<id>". Write routes invalidate
+by bumping tag versions after they commit, which orphans every entry built
+from older data without having to find and delete those entries. Orphans
+then age out through the LRU or the TTL.
+"""
+
+# Settings import
+from .config import settings
+
+# Standard library imports
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable
+
+# Third party imports
+import orjson
+
+
+class Cache:
+    """
+    Base cache, which also acts as the disabled cache
+    """
+
+    def __init__(self) -> None:
+        self._stats: defaultdict = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        return False, None
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def versions(self, tags: list[str]) -> list[int]:
+        return [0] * len(tags)
+
+    def invalidate(self, *tags: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return 0
+
+    def get_or_load(self, namespace: str, key: str, tags: list[str], loader: Callable[[], Any]) -> Any:
+        """
+        Get a value from the cache, or load and store it on a miss
+
+        The value must be JSON serializable. Exceptions from the loader,
+        such as a 404, are passed through and nothing is stored.
+        """
+
+        # Build the full key out of the tag versions
+        versions: list[int] = self.versions(tags)
+        full_key: str = f"{namespace}:{key}|" + ",".join(f"{tag}@{version}" for tag, version in zip(tags, versions))
+
+        # Try the cache first
+        hit, value = self.get(full_key)
+        with self._stats_lock:
+            self._stats[namespace]["hits" if hit else "misses"] += 1
+        if hit:
+            return value
+
+        # Load and store on a miss
+        value = loader()
+        self.set(full_key, value)
+        return value
+
+    def get_stats(self) -> dict:
+        """
+        Get hit and miss counters for each namespace
+        """
+        with self._stats_lock:
+            return {
+                "backend": type(self).__name__,
+                "size": self.size(),
+                "namespaces": {namespace: dict(counts) for namespace, counts in self._stats.items()},
+            }
+
+
+class LRUCache(Cache):
+    """
+    In-process LRU cache with a TTL
+
+    Each worker process has its own copy, so invalidations made by one
+    worker are not seen by the others until the TTL runs out. Use the
+    Redis backend when running more than one worker.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        super().__init__()
+        self.max_entries: int = max_entries
+        self.ttl_seconds: float = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Tag versions are bounded too. Tags that are not tracked use the
+        # floor version, which moves past every issued version whenever a
+        # tag is dropped, so entries built on a dropped tag can never match
+        self._tags: OrderedDict = OrderedDict()
+        self._counter: int = 0
+        self._floor: int = 0
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, tags: list[str]) -> list[int]:
+        with self._lock:
+            return [self._tags.get(tag, self._floor) for tag in tags]
+
+    def invalidate(self, *tags: str) -> None:
+        with self._lock:
+            for tag in tags:
+                self._counter += 1
+                self._tags[tag] = self._counter
+                self._tags.move_to_end(tag)
+            while len(self._tags) > self.max_entries:
+                self._tags.popitem(last=False)
+                self._counter += 1
+                self._floor = self._counter
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._counter += 1
+            self._floor = self._counter
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache(Cache):
+    """
+    Cache shared by all workers through Redis (or anything speaking its protocol)
+    """
+
+    def __init__(self, url: str, ttl_seconds: float, prefix: str = "subletters:") -> None:
+        super().__init__()
+
+        # Redis is an optional dependency
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package must be installed to use cache_backend=redis")
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds: float = ttl_seconds
+        self.prefix: str = prefix
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, orjson.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        self.client.set(self.prefix + key, orjson.dumps(value), px=int(self.ttl_seconds * 1000))
+
+    def versions(self, tags: list[str]) -> list[int]:
+        if not tags:
+            return []
+        return [int(version or 0) for version in self.client.mget([f"{self.prefix}tag:{tag}" for tag in tags])]
+
+    def invalidate(self, *tags: str) -> None:
+        if tags:
+            pipeline = self.client.pipeline(transaction=False)
+            for tag in tags:
+                pipeline.incr(f"{self.prefix}tag:{tag}")
+            pipeline.execute()
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=f"{self.prefix}*"):
+            self.client.delete(key)
+
+    def size(self) -> int:
+        return -1
+
+
+def create_cache() -> Cache:
+    """
+    Build the cache backend chosen in settings
+    """
+    if settings.cache_backend == "memory":
+        return LRUCache(max_entries=settings.cache_max_entries, ttl_seconds=settings.cache_ttl_seconds)
+    elif settings.cache_backend == "redis":
+        return RedisCache(url=settings.cache_redis_url, ttl_seconds=settings.cache_ttl_seconds)
+    elif settings.cache_backend == "none":
+        return Cache()
+    else:
+        raise ValueError(f"Unknown cache backend: {settings.cache_backend}")
+
+
+# Create the process wide cache
+cache: Cache = create_cache()
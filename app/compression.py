@@ -0,0 +1,227 @@
+"""
+Contains the response compression middleware
+
+Picks an encoding from the request's Accept-Encoding (q values are
+honoured, ties go to the server's order in compression_encodings) and
+compresses the body on the way out. gzip always works. br and zstd need
+the brotli and zstandard packages and are skipped when they aren't
+installed.
+
+Left alone:
+    - bodies smaller than compression_min_size (streams are always compressed)
+    - images, audio, video and archives, which are compressed already
+    - responses with a Content-Encoding or Content-Range (e.g. 206s)
+
+Compressed responses get Vary: Accept-Encoding and a weak ETag, since
+their bytes differ from the identity body the strong ETag names. The
+conditional helpers already treat W/"x" as "x", so If-None-Match and
+If-Match keep matching.
+"""
+
+# Starlette imports
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Settings import
+from .config import settings
+
+# Standard library imports
+import zlib
+from typing import Callable, Protocol
+
+# Optional brotli support
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Optional zstd support
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content types that are compressed already
+_COMPRESSED_TYPES: tuple[str, ...] = ("image/", "audio/", "video/", "application/zip", "application/gzip",
+                                      "application/x-gzip", "application/zstd", "application/octet-stream")
+
+# Image types that are text, so still worth compressing
+_TEXT_IMAGE_TYPES: tuple[str, ...] = ("image/svg+xml",)
+
+
+class Compressor(Protocol):
+    """
+    Streaming compressor, as zlib's: flush ends the stream
+    """
+    def compress(self, data: bytes) -> bytes: ...
+    def flush(self) -> bytes: ...
+
+
+class _BrotliCompressor:
+    """
+    Streaming brotli compressor with the same interface as zlib's
+    """
+
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    """
+    Streaming zstd compressor with the same interface as zlib's
+    """
+
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encodings() -> dict[str, Callable[[], Compressor]]:
+    """
+    Get a compressor factory for each configured encoding that is installed
+    """
+    factories: dict[str, Callable[[], Compressor]] = {
+        # wbits=31 writes the gzip header and trailer
+        "gzip": lambda: zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31),
+    }
+    if brotli is not None:
+        factories["br"] = lambda: _BrotliCompressor(settings.compression_brotli_quality)
+    if zstandard is not None:
+        factories["zstd"] = lambda: _ZstdCompressor(settings.compression_zstd_level)
+    return {name: factories[name] for name in settings.compression_encodings if name in factories}
+
+
+def choose_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """
+    Pick the encoding the client prefers most out of the ones we offer
+
+    Returns None when the client accepts none of them.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight: float = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    best: str | None = None
+    best_weight: float = 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    """
+    Check if a response is worth compressing from its headers alone
+    """
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    content_type: str = headers.get("content-type", "").lower()
+    return content_type.startswith(_TEXT_IMAGE_TYPES) or not content_type.startswith(_COMPRESSED_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with gzip, br or zstd
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.encodings: dict[str, Callable[[], Compressor]] = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding: str | None = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), list(self.encodings))
+        await _CompressionResponder(self.app, encoding, self.encodings.get(encoding))(scope, receive, send)
+
+
+class _CompressionResponder:
+    """
+    Compresses one response, deciding how once its first body message is sent
+    """
+
+    def __init__(self, app: ASGIApp, encoding: str | None, factory: Callable[[], Compressor] | None) -> None:
+        self.app = app
+        self.encoding: str | None = encoding
+        self.factory: Callable[[], Compressor] | None = factory
+        self.send: Send | None = None
+        self.start: Message | None = None
+        self.compressor: Compressor | None = None
+        self.started: bool = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+
+        # Hold the headers back until the first body says how to change them
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+
+        # Later messages of a stream are compressed as they come
+        if self.started:
+            if self.compressor is not None:
+                message["body"] = self.compressor.compress(body) + (b"" if more_body else self.compressor.flush())
+            await self.send(message)
+            return
+        self.started = True
+
+        # Empty and small bodies, already compressed types and clients
+        # accepting none of our encodings get the body as it is
+        headers: MutableHeaders = MutableHeaders(raw=self.start["headers"])
+        small: bool = not more_body and (not body or len(body) < settings.compression_min_size)
+        if small or not is_compressible(headers):
+            await self.send(self.start)
+            await self.send(message)
+            return
+        headers.add_vary_header("Accept-Encoding")
+        if self.factory is None:
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        # Compress the whole body, or the first part of a stream
+        self.compressor = self.factory()
+        message["body"] = self.compressor.compress(body) + (self.compressor.flush() if not more_body else b"")
+        headers["Content-Encoding"] = self.encoding
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(message["body"]))
+        if "etag" in headers and not headers["etag"].startswith("W/"):
+            headers["ETag"] = f"W/{headers['etag']}"
+        await self.send(self.start)
+        await self.send(message)
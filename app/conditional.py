@@ -0,0 +1,66 @@
+"""
+Contains helpers for conditional requests (ETag, If-None-Match, If-Match)
+
+ETags are built from row ids and versions rather than from the response
+body, so a matching If-None-Match can be answered with a 304 before
+anything is serialized.
+"""
+
+# FastAPI imports
+from fastapi import HTTPException, Request, Response
+
+# Standard library imports
+import hashlib
+from typing import Any, Iterable
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Build a strong ETag out of values identifying one version of a resource
+    """
+    digest: str = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def make_list_etag(rows: Iterable[Any], *parts: Any) -> str:
+    """
+    Build a strong ETag for a list out of its rows' ids and versions
+    """
+    return make_etag(*parts, *(f"{row.id}:{row.version}" for row in rows))
+
+
+def _parse_etags(header: str) -> set[str]:
+    """
+    Split an If-Match or If-None-Match header into its ETags
+    """
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """
+    Check if the client sent If-None-Match with this ETag
+    """
+    header: str | None = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    etags: set[str] = _parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+def not_modified_response(etag: str) -> Response:
+    """
+    Build an empty 304 response for an ETag
+    """
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def check_if_match(request: Request, etag: str) -> None:
+    """
+    Raise a 412 if the client sent If-Match and it does not match this ETag
+    """
+    header: str | None = request.headers.get("if-match")
+    if header is None:
+        return
+    etags: set[str] = _parse_etags(header)
+    if "*" not in etags and etag not in etags:
+        raise HTTPException(status_code=412, detail="Resource has been modified")
@@ -20,13 +20,85 @@ class Settings(BaseSettings):
     postgres_password: str
     use_ssl: bool
 
+    # Define database connection pool settings
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+
+    # Define per statement timeout in milliseconds (0 disables it)
+    db_statement_timeout_ms: int = 0
+
     # Define Azure Blob settings
     azure_storage_connection_string: str
     azure_storage_container_name: str
 
+    # Define Azure Blob client settings. Connections are pooled per process
+    azure_storage_pool_size: int = 32
+    azure_storage_retry_total: int = 3
+    azure_storage_retry_backoff: float = 0.5
+    azure_storage_connection_timeout: float = 5.0
+    azure_storage_read_timeout: float = 60.0
+
     # Specify whether we are using azure blob or not
     use_azure_blob: bool
 
+    # Define how many stored files are deleted per batch (Azure allows 256)
+    blob_delete_batch_size: int = 256
+
+    # Define the largest accepted image upload in bytes
+    max_image_upload_bytes: int = 20 * 1024 * 1024
+
+    # Define how many of the latest reviews ?expand=reviews embeds per property
+    expanded_review_limit: int = 10
+
+    # Define the most ids a batch get-by-ids request may ask for
+    batch_get_max_ids: int = 100
+
+    # Define bulk write settings. Items are validated and inserted this
+    # many at a time, each chunk in its own transaction. NDJSON bodies are
+    # streamed, so only their lines are limited. JSON arrays are parsed
+    # whole, so keep their limit small
+    bulk_chunk_size: int = 500
+    max_bulk_line_bytes: int = 64 * 1024
+    max_bulk_array_bytes: int = 1024 * 1024
+
+    # Define how long pre-signed upload URLs stay valid, and the key used
+    # to sign them for local storage. Without a key, one is derived from
+    # the database credentials, so every worker and restart agrees on it
+    upload_url_ttl_seconds: int = 900
+    upload_signing_key: str | None = None
+
+    # Define the resized copies made of each uploaded image. Formats the
+    # installed Pillow can't write (e.g. avif without pillow-avif-plugin)
+    # are skipped
+    image_derivative_widths: list[int] = [200, 640, 1280]
+    image_derivative_formats: list[str] = ["avif", "webp"]
+    image_derivative_quality: int = 80
+    image_worker_processes: int = 2
+
+    # Define read cache settings. Backend is "memory", "redis" or "none".
+    # Use redis when running more than one worker
+    cache_backend: str = "memory"
+    cache_ttl_seconds: float = 60.0
+    cache_max_entries: int = 10000
+    cache_redis_url: str = "redis://localhost:6379/0"
+
+    # Define response compression settings. Encodings are offered in this
+    # order when the client likes them equally; br and zstd are skipped
+    # unless the brotli and zstandard packages are installed. An empty list
+    # turns compression off. Bodies under the minimum size are sent as is
+    compression_encodings: list[str] = ["zstd", "br", "gzip"]
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+
+    # Specify whether requests run on the event loop with an async engine
+    # (asyncpg) instead of on the threadpool with psycopg2
+    use_async_engine: bool = False
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,27 @@
+"""
+Shared test setup
+"""
+
+# Pytest imports
+import pytest
+
+# Alembic imports
+from alembic import command
+from alembic.config import Config
+
+# Standard library imports
+import pathlib
+
+
+@pytest.fixture(scope="session", autouse=True)
+def migrate_database():
+    """
+    Bring the test database up to the latest migration, as a deploy would
+
+    The app never creates tables itself. The config is built here rather
+    than read from alembic.ini, so its logging setup doesn't replace the
+    test run's.
+    """
+    config: Config = Config()
+    config.set_main_option("script_location", str(pathlib.Path(__file__).parents[1] / "migrations"))
+    command.upgrade(config, "head")
@@ -1,20 +1,93 @@
-from sqlmodel import SQLModel, create_engine
+from sqlmodel import create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from .config import settings
+from .metrics import Histogram
+import logging
+import time
+
+# Module logger
+logger = logging.getLogger(__name__)
 
 # Build DB URL from settings
 db_url: str = f"postgresql+psycopg2://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}/{settings.postgres_db}"
+async_db_url: str = f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}/{settings.postgres_db}"
 
 # Add SSL if necessary
-if settings.use_ssl: 
+if settings.use_ssl:
     db_url += "?sslmode=require"
+    async_db_url += "?ssl=require"
+
+# Log which database is used, without the credentials. Nothing is
+# printed, since scripts like the exporter write their output to stdout
+logger.info("Using database %s on %s", settings.postgres_db, settings.postgres_host)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    Queue pool which records how long each checkout waited for a connection
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_histogram = Histogram()
+
+    def _do_get(self):
+        start: float = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_histogram.observe(time.perf_counter() - start)
+
 
-# Print the DB url for logging
-print(f"DB has been created: {db_url}")
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+# Shared pool arguments for both engines
+pool_kwargs: dict = {
+    "pool_size": settings.db_pool_size,
+    "max_overflow": settings.db_max_overflow,
+    "pool_timeout": settings.db_pool_timeout,
+    "pool_recycle": settings.db_pool_recycle,
+    "pool_pre_ping": settings.db_pool_pre_ping,
+}
+
+# Statement timeout is passed as a server setting on connect
+connect_args: dict = {}
+async_connect_args: dict = {}
+if settings.db_statement_timeout_ms > 0:
+    connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+    async_connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
 
 # Create engine
-engine = create_engine(url=db_url)
+engine = create_engine(url=db_url, poolclass=TimedQueuePool, connect_args=connect_args, **pool_kwargs)
+
+
+def create_async_db_engine() -> AsyncEngine:
+    """
+    Create an asyncpg engine with the same pool settings as the sync one
+    """
+    return create_async_engine(url=async_db_url, poolclass=TimedAsyncAdaptedQueuePool,
+                               connect_args=async_connect_args, **pool_kwargs)
+
+
+# Create async engine if requests should run on the event loop.
+# The sync engine above is still used for migrations, scripts and
+# routes kept on the threadpool
+async_engine: AsyncEngine | None = create_async_db_engine() if settings.use_async_engine else None
 
 
-# Factory function to create DB and tables
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+def get_pool_stats(pool: TimedQueuePool) -> dict:
+    """
+    Get a snapshot of a pool's usage and checkout wait times
+    """
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+        "wait_seconds": pool.wait_histogram.snapshot(),
+    }
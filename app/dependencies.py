@@ -1,25 +1,57 @@
 # Database imports
-from .database import engine
+from .database import engine, async_engine
 
 # SQLModel imports
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # Settings import
 from .config import settings
 
+# Cache imports
+from .cache import Cache, cache
+
 # Azure Blob imports
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+from azure.storage.blob import ContainerClient
+from . import azure_blob
 
 def get_session():
     with Session(engine) as session:
         yield session
 
 
+def get_sync_session():
+    """
+    Session on the sync engine in either mode
+
+    For routes marked with threadpool_route, which run on the threadpool
+    even when use_async_engine is set, so get_session is never swapped
+    out from under them.
+    """
+    with Session(engine) as session:
+        yield session
+
+
+async def get_async_session():
+    """
+    Async replacement for get_session when use_async_engine is set.
+
+    Yields the sync facade of an AsyncSession so routes keep the same
+    Session API. Routes run inside a greenlet (see routing.py), which lets
+    that facade drive asyncpg without blocking the event loop. Objects are
+    not expired on commit, since reloading them outside the greenlet
+    (e.g. while serializing the response) is not possible.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session.sync_session
+
+
+def get_cache() -> Cache:
+    return cache
+
+
 def get_container_client() -> ContainerClient | None:
     if settings.use_azure_blob:
-        return ContainerClient.from_connection_string(
-            conn_str=settings.azure_storage_connection_string,
-            container_name=settings.azure_storage_container_name,
-        )
+        return azure_blob.get_container_client()
     else:
         return None
\ No newline at end of file
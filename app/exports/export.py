@@ -0,0 +1,125 @@
+"""
+Streams whole tables out as NDJSON or CSV
+
+Rows come straight from a server-side cursor as plain tuples, a batch at
+a time, and are encoded and written out before the next batch is
+fetched. Memory stays flat however large the table is, and no ORM
+objects are built. The export runs in its own transaction without a
+statement timeout, so exports of millions of rows are not cut off.
+
+Example:
+    python -m app.exports.export reviews --format csv > reviews.csv
+    python -m app.exports.export properties --output properties.ndjson
+"""
+
+# SQLModel imports
+from sqlmodel import SQLModel, select
+
+# SQLAlchemy imports
+from sqlalchemy import Column, text
+
+# Model imports
+from ..accounts.models import Account, AccountRead
+from ..properties.models import Property, PropertyRead
+from ..property_images.models import PropertyImage, PropertyImageRead
+from ..reviews.models import Review, ReviewRead
+
+# Database imports
+from ..database import engine
+
+# Standard library imports
+import argparse
+import csv
+import io
+import sys
+from enum import Enum
+from typing import Iterator
+
+# Third party imports
+import orjson
+
+# Rows fetched per round trip from the server side cursor
+FETCH_SIZE: int = 2000
+
+
+class ExportDataset(str, Enum):
+    accounts = "accounts"
+    properties = "properties"
+    reviews = "reviews"
+    property_images = "property_images"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+# Content type of each export format
+MEDIA_TYPES: dict[ExportFormat, str] = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+# Table and read model of each dataset. The read model picks the exported columns
+_DATASETS: dict[ExportDataset, tuple[type[SQLModel], type[SQLModel]]] = {
+    ExportDataset.accounts: (Account, AccountRead),
+    ExportDataset.properties: (Property, PropertyRead),
+    ExportDataset.reviews: (Review, ReviewRead),
+    ExportDataset.property_images: (PropertyImage, PropertyImageRead),
+}
+
+
+def export_columns(dataset: ExportDataset) -> list[Column]:
+    """
+    Get the table columns a dataset exports, in read model order
+    """
+    model, read_model = _DATASETS[dataset]
+    return [model.__table__.c[name] for name in read_model.__fields__ if name in model.__table__.c]
+
+
+def iter_batches(dataset: ExportDataset) -> Iterator[list[tuple]]:
+    """
+    Yield every row of a dataset as tuples, one cursor batch at a time
+    """
+    with engine.connect() as connection:
+        with connection.begin():
+            connection.execute(text("SET LOCAL statement_timeout = 0"))
+            result = connection.execution_options(stream_results=True, yield_per=FETCH_SIZE) \
+                .execute(select(*export_columns(dataset)))
+            for batch in result.partitions():
+                yield batch
+
+
+def iter_export(dataset: ExportDataset, format: ExportFormat) -> Iterator[bytes]:
+    """
+    Yield a dataset encoded as NDJSON or CSV, one encoded batch per chunk
+    """
+    names: list[str] = [column.name for column in export_columns(dataset)]
+
+    if format == ExportFormat.ndjson:
+        for batch in iter_batches(dataset):
+            yield b"".join(orjson.dumps(dict(zip(names, row))) + b"\n" for row in batch)
+
+    else:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        for batch in iter_batches(dataset):
+            writer.writerows(batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", type=ExportDataset, choices=list(ExportDataset))
+    parser.add_argument("--format", type=ExportFormat, choices=list(ExportFormat), default=ExportFormat.ndjson)
+    parser.add_argument("--output", type=argparse.FileType("wb"), default=sys.stdout.buffer,
+                        help="file to write to (default: stdout)")
+    args = parser.parse_args()
+    with args.output:
+        for chunk in iter_export(args.dataset, args.format):
+            args.output.write(chunk)
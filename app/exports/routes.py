@@ -0,0 +1,40 @@
+"""
+Contains route endpoints to export whole datasets
+"""
+
+# FastAPI imports
+from fastapi import APIRouter, Path, Query
+from fastapi.responses import StreamingResponse
+
+# Export imports
+from .export import ExportDataset, ExportFormat, MEDIA_TYPES, iter_export
+
+# Routing imports
+from ..routing import AppRoute
+
+
+# Initializing router
+router = APIRouter(prefix="/export", route_class=AppRoute)
+
+
+### HTTP GET FUNCTIONS ###
+
+@router.get("/{dataset}")
+def export_dataset(
+    *,
+    dataset: ExportDataset = Path(),
+    format: ExportFormat = Query(default=ExportFormat.ndjson)
+):
+    """
+    Stream every row of a dataset as NDJSON or CSV
+
+    The body is sent as rows are read from the database, so exports of
+    any size start right away and never buffer the whole table.
+    """
+
+    # Stream the rows as a download
+    return StreamingResponse(
+        iter_export(dataset, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset.value}.{format.value}"'},
+    )
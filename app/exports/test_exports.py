@@ -0,0 +1,114 @@
+"""
+Test file for export routes
+"""
+
+# Pytest imports
+import pytest
+
+# FastAPI imports
+from fastapi import Response
+from fastapi.testclient import TestClient
+
+# Main app import
+from ..main import app
+
+# Export imports
+from . import export
+
+# Model imports
+from ..accounts.models import AccountCreate
+
+# Helper function imports from other tests
+from ..accounts.test_acccounts import create_account
+
+# Standard library imports
+import csv
+import io
+import json
+import pathlib
+import subprocess
+import sys
+
+
+# Create new client
+client: TestClient = TestClient(app)
+
+
+class TestExports:
+
+    ### SETUP FUNCTIONS ###
+
+    @pytest.fixture(autouse=True)
+    def setup_and_teardown(self, monkeypatch):
+
+        # Delete everything in database
+        response: Response = client.delete("/api/")
+        assert response.status_code == 200
+
+        # Fetch a few rows at a time so exports span several batches
+        monkeypatch.setattr(export, "FETCH_SIZE", 3)
+
+        # Create an account and some properties to export
+        self.account = create_account(
+            AccountCreate(
+                fname="Maheer",
+                lname="Aeron",
+                email="maa368@cornell.edu"
+            ),
+            client_instance=client
+        )
+        response = client.post("/api/properties/bulk", json=[{
+            "owner_id": self.account['id'],
+            "name": f"Property {i}",
+            "address": f"{i} College Ave",
+            "description": "Apartment, close to campus",
+            "start_date": "2022-11-30",
+            "end_date": "2023-11-30",
+            "monthly_rent": 1000 + i,
+            "num_bedrooms": 1,
+            "num_bathrooms": 1
+        } for i in range(10)])
+        self.property_ids: list[str] = response.json()["ids"]
+
+        # Transfer control to a test
+        yield
+
+        # Clear everything in database
+        response: Response = client.delete("/api/")
+        assert response.status_code == 200
+
+    ### TEST HTTP GET FUNCTIONS ###
+
+    def test_export_ndjson(self):
+
+        # Every property comes back as one JSON object per line
+        response = client.get("/api/export/properties")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows: list[dict] = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(row["id"] for row in rows) == sorted(self.property_ids)
+        assert rows[0].keys() == client.get(f"/api/properties/{rows[0]['id']}").json().keys()
+
+    def test_export_csv(self):
+
+        # A header row, then one row per account
+        response = client.get("/api/export/accounts", params={"format": "csv"})
+        assert response.status_code == 200
+        assert 'filename="accounts.csv"' in response.headers["content-disposition"]
+        rows: list[dict] = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["id"] for row in rows] == [self.account["id"]]
+        assert rows[0]["email"] == "maa368@cornell.edu"
+
+        # Unknown datasets are rejected
+        response = client.get("/api/export/secrets")
+        assert response.status_code == 422
+
+    ### TEST COMMAND LINE ###
+
+    def test_export_command_to_stdout(self):
+
+        # Nothing but the CSV is written to stdout
+        result = subprocess.run([sys.executable, "-m", "app.exports.export", "properties", "--format", "csv"],
+                                cwd=pathlib.Path(__file__).parents[2], capture_output=True, check=True)
+        rows: list[dict] = list(csv.DictReader(io.StringIO(result.stdout.decode())))
+        assert sorted(row["id"] for row in rows) == sorted(self.property_ids)
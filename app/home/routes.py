@@ -7,11 +7,17 @@ from sqlmodel import Session, select, delete
 # Model imports
 from ..accounts.models import Account
 from ..properties.models import Property
-from ..property_images.models import PropertyImage
+from ..property_images.models import BlobDeletion, ImageBlob, PropertyImage, PropertyImageDerivative
 from ..reviews.models import Review
 
 # Dependency imports
-from ..dependencies import get_session
+from ..dependencies import get_sync_session, get_cache
+
+# Cache imports
+from ..cache import Cache
+
+# Routing imports
+from ..routing import AppRoute, threadpool_route
 
 # Settings import
 from ..config import settings
@@ -21,27 +27,34 @@ import os
 import shutil
 
 # Initializing router
-router = APIRouter()
+router = APIRouter(route_class=AppRoute)
 
 @router.get("/")
 def get_home():
     return "Welcome to the Subeletters-API home!"
 
 @router.delete("/")
-def delete_all(session: Session = Depends(get_session)):
+@threadpool_route
+def delete_all(session: Session = Depends(get_sync_session), cache: Cache = Depends(get_cache)):
     """
     THIS IS DANGEROUS! Should only be used for testing
     """
     
     # Delete everything
     session.exec(delete(Review))
+    session.exec(delete(PropertyImageDerivative))
     session.exec(delete(PropertyImage))
+    session.exec(delete(ImageBlob))
+    session.exec(delete(BlobDeletion))
     session.exec(delete(Property))
     session.exec(delete(Account))
 
     # Commit the delete
     session.commit()
 
+    # Empty the cache
+    cache.clear()
+
     # If local, delete blob folder
     if not settings.use_azure_blob:
         if os.path.exists("blob/"):
@@ -0,0 +1,73 @@
+"""
+Contains internal routes used for operations and tuning
+"""
+
+# FastAPI imports
+from fastapi import APIRouter, Depends
+
+# Database imports
+from ..database import engine, async_engine, get_pool_stats
+
+# SQLModel imports
+from sqlmodel import Session, select
+
+# SQLAlchemy imports
+from sqlalchemy import func
+
+# Model imports
+from ..property_images.models import BlobDeletion
+
+# Dependency imports
+from ..dependencies import get_session, get_cache
+
+# Cache imports
+from ..cache import Cache
+
+# Azure Blob imports
+from ..azure_blob import get_storage_stats
+
+# Routing imports
+from ..routing import AppRoute
+
+
+# Initializing router
+router = APIRouter(prefix="/_internal", route_class=AppRoute)
+
+
+### HTTP GET FUNCTIONS ###
+
+@router.get("/pool")
+def get_pool():
+    """
+    Get connection pool usage and checkout wait times for each engine
+    """
+
+    # Always report the sync engine, and the async one if it is in use
+    stats: dict = {"sync": get_pool_stats(engine.pool)}
+    if async_engine is not None:
+        stats["async"] = get_pool_stats(async_engine.sync_engine.pool)
+
+    # Return the stats
+    return stats
+
+
+@router.get("/cache")
+def get_cache_stats(cache: Cache = Depends(get_cache)):
+    """
+    Get read cache hit and miss counters for each cached route
+    """
+    return cache.get_stats()
+
+
+@router.get("/storage")
+def get_storage(session: Session = Depends(get_session)):
+    """
+    Get Azure Blob client settings, per operation latency and queued file deletions
+    """
+
+    # Count queued deletions, and those that have failed at least once
+    pending, failing = session.exec(select(func.count(), func.count().filter(BlobDeletion.attempts > 0))
+                                    .select_from(BlobDeletion)).one()
+
+    # Return the stats
+    return {**get_storage_stats(), "deletions": {"pending": pending, "failing": failing}}
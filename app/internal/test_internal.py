@@ -0,0 +1,67 @@
+"""
+Test file for internal routes
+"""
+
+# FastAPI imports
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+# Main app import
+from ..main import app
+
+# Create new client
+client: TestClient = TestClient(app)
+
+def test_get_pool():
+
+    # Issue a query so the pool has handed out at least one connection
+    response: Response = client.get("/api/accounts/")
+    assert response.status_code == 200
+
+    # Check the pool stats
+    response = client.get("/api/_internal/pool")
+    assert response.status_code == 200
+    stats: dict = response.json()["sync"]
+    assert stats["checked_out"] == 0
+    assert stats["wait_seconds"]["count"] > 0
+
+def test_get_cache_stats():
+
+    # Make an account and a property to read
+    account: dict = client.post("/api/accounts/", json={"fname": "Maheer", "lname": "Aeron", "email": "maa368@cornell.edu"}).json()
+    property: dict = client.post("/api/properties/", json={
+        "owner_id": account["id"],
+        "name": "College Town Terrace",
+        "address": "715 E State St.",
+        "description": "This is a big apartment in Ithaca",
+        "start_date": "2022-11-30",
+        "end_date": "2023-11-30",
+        "monthly_rent": 2100,
+        "num_bedrooms": 1,
+        "num_bathrooms": 1
+    }).json()
+
+    # Read the property twice, which should miss then hit
+    before: dict = client.get("/api/_internal/cache").json()["namespaces"].get("property", {"hits": 0, "misses": 0})
+    client.get(f"/api/properties/{property['id']}")
+    client.get(f"/api/properties/{property['id']}")
+    after: dict = client.get("/api/_internal/cache").json()["namespaces"]["property"]
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+    # A write invalidates the cached copy
+    client.patch(f"/api/properties/{property['id']}", json={"monthly_rent": 1000})
+    response = client.get(f"/api/properties/{property['id']}")
+    assert response.json()["monthly_rent"] == 1000
+
+    # Clean up
+    client.delete("/api/")
+
+def test_get_storage_stats():
+
+    # Check the storage client stats
+    response = client.get("/api/_internal/storage")
+    assert response.status_code == 200
+    stats: dict = response.json()
+    assert stats["pool_size"] > 0
+    assert isinstance(stats["latency_seconds"], dict)
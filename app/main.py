@@ -11,16 +11,35 @@
 from fastapi import FastAPI
 
 # Starlette imports
-from starlette.responses import RedirectResponse
+from starlette.responses import RedirectResponse, JSONResponse
+
+# Standard library imports
+import asyncio
+
+# SQLAlchemy imports
+from sqlalchemy.orm.exc import StaleDataError
 
 # Middleware imports
 from fastapi.middleware.cors import CORSMiddleware
+from .compression import CompressionMiddleware
 
 # Settings imports
 from .config import settings
 
-# Database imports
-from .database import create_db_and_tables
+# Dependency imports
+from .dependencies import get_session, get_async_session
+
+# Pagination imports
+from .pagination import NEXT_CURSOR_HEADER
+
+# Image derivative imports
+from .property_images.derivatives import shutdown_executor
+
+# Blob deletion imports
+from .property_images.deletions import process_blob_deletions
+
+# Azure Blob imports
+from .azure_blob import open_container_clients, close_container_clients
 
 # Routers
 from .home.routes import router as home_router
@@ -28,6 +47,8 @@ from .accounts.routes import router as accounts_router
 from .properties.routes import router as property_router
 from .property_images.routes import router as property_image_router
 from .reviews.routes import router as review_router
+from .exports.routes import router as export_router
+from .internal.routes import router as internal_router
 
 
 def get_application():
@@ -43,11 +64,16 @@ def get_application():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
     )
+    _app.add_middleware(CompressionMiddleware)
 
-    # Create database tables (if not existant)
-    # and establish connection
-    create_db_and_tables()
+    # Tables are not created here. Schema changes run through Alembic
+    # ("alembic upgrade head") before the app is deployed
+
+    # Run sessions on the async engine if requested
+    if settings.use_async_engine:
+        _app.dependency_overrides[get_session] = get_async_session
 
     # Add routing
     _app.include_router(home_router, prefix="/api", tags=["home"])
@@ -55,6 +81,8 @@ def get_application():
     _app.include_router(property_router, prefix="/api", tags=["properties"])
     _app.include_router(property_image_router, prefix="/api", tags=["property_images"])
     _app.include_router(review_router, prefix="/api", tags=["reviews"])
+    _app.include_router(export_router, prefix="/api", tags=["exports"])
+    _app.include_router(internal_router, prefix="/api", tags=["internal"])
 
     # Default routes
     @_app.get("/")
@@ -64,8 +92,42 @@ def get_application():
         """
         return RedirectResponse(url="/api")
 
+    # Error handlers
+    @_app.exception_handler(StaleDataError)
+    def handle_stale_data(request, exc):
+        """
+        An update lost a race with another update of the same row version
+        """
+        return JSONResponse(status_code=412, content={"detail": "Resource has been modified"})
+
     # App events
-    # ADD HERE...
+    @_app.on_event("startup")
+    async def open_storage_clients():
+        """
+        Create the shared Azure Blob clients
+        """
+        await open_container_clients()
+
+    @_app.on_event("startup")
+    async def resume_blob_deletions():
+        """
+        Pick up file deletions left over from before a restart, in the background
+        """
+        asyncio.get_running_loop().run_in_executor(None, process_blob_deletions)
+
+    @_app.on_event("shutdown")
+    async def close_storage_clients():
+        """
+        Close the shared Azure Blob clients and their connections
+        """
+        await close_container_clients()
+
+    @_app.on_event("shutdown")
+    def stop_image_workers():
+        """
+        Stop the image derivative worker processes
+        """
+        shutdown_executor()
 
     
 
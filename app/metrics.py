@@ -0,0 +1,46 @@
+"""
+Contains lightweight in-process metrics
+"""
+
+# Standard library imports
+import bisect
+import threading
+
+# Default histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Thread safe histogram of durations with fixed buckets.
+    Each bucket counts the observations above the previous bound
+    and up to its own bound.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self) -> dict:
+        """
+        Get a JSON friendly copy of the histogram
+        """
+        with self._lock:
+            labels: list[str] = [str(bound) for bound in self.buckets] + ["+inf"]
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "buckets": dict(zip(labels, self.counts)),
+            }
@@ -0,0 +1,135 @@
+"""
+Contains helpers for paginating list routes
+
+Lists are paged with an opaque keyset cursor by default. The cursor encodes
+the sort key and id of the last row on a page, so the next page is a
+"WHERE (sort, id) > (last_sort, last_id)" seek on an index instead of an
+OFFSET scan that reads and throws away every skipped row.
+"""
+
+# FastAPI imports
+from fastapi import HTTPException, Response
+
+# SQLAlchemy imports
+from sqlalchemy import tuple_
+
+# SQLModel imports
+from sqlmodel import Session
+
+# Standard library imports
+import base64
+import json
+import uuid
+from datetime import date, datetime
+from typing import Any, Callable
+
+# Header used to hand the next cursor back to clients
+NEXT_CURSOR_HEADER: str = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    """
+    Turn a sort key value into something JSON can hold
+    """
+    if isinstance(value, (uuid.UUID, date)):
+        return str(value)
+    return value
+
+
+def encode_cursor(sort_value: Any, id_value: Any) -> str:
+    """
+    Build an opaque cursor out of the last row's sort key and id
+    """
+    raw: bytes = json.dumps([_encode_value(sort_value), _encode_value(id_value)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_value(value: Any, python_type: type | None) -> Any:
+    """
+    Turn a sort key value read from JSON back into the column's type
+    """
+    if value is None or python_type is None:
+        return value
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    if python_type in (date, datetime):
+        return python_type.fromisoformat(value)
+    if python_type is float:
+        return float(value)
+    return value
+
+
+def decode_cursor(cursor: str, sort_type: type | None = None) -> tuple[Any, Any]:
+    """
+    Parse a cursor made by encode_cursor, raising a 400 if it is malformed
+
+    The sort value is converted back to sort_type, since drivers like
+    asyncpg won't bind a string to a DATE or UUID column.
+    """
+    try:
+        padded: str = cursor + "=" * (-len(cursor) % 4)
+        sort_value, id_value = json.loads(base64.urlsafe_b64decode(padded))
+        return _decode_value(sort_value, sort_type), uuid.UUID(id_value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _python_type(column) -> type | None:
+    """
+    Get the Python type of a column's values, if its type has one
+    """
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def paginate(
+    session: Session,
+    statement,
+    *,
+    response: Response,
+    sort_column,
+    id_column,
+    cursor: str | None = None,
+    offset: int | None = None,
+    limit: int = 100,
+    descending: bool = False,
+    cursor_of: Callable[[Any], tuple[Any, Any]] | None = None,
+) -> list:
+    """
+    Execute a select statement one page at a time
+
+    When offset is given the legacy OFFSET/LIMIT paging is used. Otherwise
+    rows are ordered by (sort_column, id_column) and the page starts right
+    after the given cursor. The cursor for the following page is returned
+    in the X-Next-Cursor header, which is left out on the last page.
+    """
+
+    # Keep legacy offset paging for older clients
+    if offset is not None:
+        return session.exec(statement.offset(offset).limit(limit)).all()
+
+    # Seek past the cursor, if any
+    if cursor is not None:
+        key = tuple_(sort_column, id_column)
+        last = decode_cursor(cursor, _python_type(sort_column))
+        statement = statement.where(key < last if descending else key > last)
+
+    # Order on the keyset and fetch one extra row to know if there is more
+    if descending:
+        statement = statement.order_by(sort_column.desc(), id_column.desc())
+    else:
+        statement = statement.order_by(sort_column, id_column)
+    rows = session.exec(statement.limit(limit + 1)).all()
+
+    # Hand back the next cursor if there is another page
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if cursor_of is not None:
+            last_values = cursor_of(rows[-1])
+        else:
+            last_values = getattr(rows[-1], sort_column.key), getattr(rows[-1], id_column.key)
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*last_values)
+
+    return rows
@@ -0,0 +1,53 @@
+"""
+Contains the writer behind the bulk property route
+"""
+
+# SQLModel imports
+from sqlmodel import Session
+
+# SQLAlchemy imports
+from sqlalchemy import Boolean, literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+# Model imports
+from .models import Property, PropertyBulkItem, PropertyCreate
+
+# Standard library imports
+import uuid
+
+
+def write_properties(
+    session: Session,
+    items: list[tuple[int, PropertyBulkItem]],
+    tags: set[str],
+    *,
+    upsert: bool = False,
+) -> list[tuple[int, uuid.UUID, bool]]:
+    """
+    Insert a chunk of properties with one INSERT ... RETURNING
+
+    With upsert, items whose id already exists replace that property's
+    fields. Its rating aggregates are left alone.
+    """
+
+    # Give every row an id, so returned rows can be matched to items
+    rows: list[dict] = [
+        {**item.dict(exclude={"id"}), "id": item.id or uuid.uuid4()}
+        for _, item in items
+    ]
+    index_of: dict[uuid.UUID, int] = {row["id"]: index for row, (index, _) in zip(rows, items)}
+
+    # Replace existing properties if asked to
+    statement = insert(Property).values(rows)
+    if upsert:
+        set_: dict = {field: getattr(statement.excluded, field) for field in PropertyCreate.__fields__}
+        set_["version"] = Property.version + 1
+        statement = statement.on_conflict_do_update(index_elements=[Property.id], set_=set_)
+
+    # Write the rows, telling inserted rows from replaced ones by xmax
+    returned = session.execute(statement.returning(
+        Property.id, literal_column("xmax = 0", Boolean).label("created")
+    )).all()
+    tags.update(f"property:{row.id}" for row in returned if not row.created)
+
+    return [(index_of[row.id], row.id, row.created) for row in returned]
@@ -0,0 +1,132 @@
+"""
+Contains helpers to embed related rows in property responses
+
+A listing card needs a property's images, latest reviews and owner. With
+?expand=images,reviews,account they are loaded for a whole page at once:
+images (with their derivatives) and owners through selectinload, and the
+latest reviews of every property with one window function query. That is
+a fixed number of queries however many properties are on the page.
+"""
+
+# FastAPI imports
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+# SQLModel imports
+from sqlmodel import Session, select
+
+# SQLAlchemy imports
+from sqlalchemy import func
+from sqlalchemy.orm import aliased, selectinload
+
+# Model imports
+from .models import Property, PropertyRead
+from ..accounts.models import AccountRead
+from ..property_images.models import ImageStatus, PropertyImage, PropertyImageRead
+from ..reviews.models import Review, ReviewRead
+
+# Conditional request imports
+from ..conditional import make_etag
+
+# Settings import
+from ..config import settings
+
+# Standard library imports
+import hashlib
+import uuid
+from collections import defaultdict
+from enum import Enum
+from typing import Any
+
+# Third party imports
+import orjson
+
+
+class PropertyExpand(str, Enum):
+    images = "images"
+    reviews = "reviews"
+    account = "account"
+
+
+class PropertyReadExpanded(PropertyRead):
+    images: list[PropertyImageRead] | None = None
+    reviews: list[ReviewRead] | None = None
+    account: AccountRead | None = None
+
+
+def parse_expand(values: list[str]) -> set[PropertyExpand]:
+    """
+    Parse expand query values, given repeated or comma separated
+    """
+    names: set[str] = {name.strip() for value in values for name in value.split(",") if name.strip()}
+    try:
+        return {PropertyExpand(name) for name in names}
+    except ValueError:
+        raise HTTPException(status_code=422,
+                            detail=f"expand must be one of {', '.join(expand.value for expand in PropertyExpand)}")
+
+
+def expand_options(expand: set[PropertyExpand]) -> list:
+    """
+    Get the loader options that eager load the expanded relationships
+    """
+    options: list = []
+    if PropertyExpand.images in expand:
+        options.append(selectinload(Property.images.and_(PropertyImage.status == ImageStatus.ready.value))
+                       .selectinload(PropertyImage.derivatives))
+    if PropertyExpand.account in expand:
+        options.append(selectinload(Property.account))
+    return options
+
+
+def load_latest_reviews(session: Session, property_ids: list[uuid.UUID], limit: int) -> dict[uuid.UUID, list[Review]]:
+    """
+    Get the latest reviews of each property, at most limit each, in one query
+    """
+    ranked = select(
+        Review,
+        func.row_number().over(partition_by=Review.property_id,
+                               order_by=(Review.created.desc(), Review.id.desc())).label("rank"),
+    ).where(Review.property_id.in_(property_ids)).subquery()
+    review = aliased(Review, ranked)
+
+    reviews: dict[uuid.UUID, list[Review]] = defaultdict(list)
+    for row in session.exec(select(review).where(ranked.c.rank <= limit).order_by(ranked.c.rank)).all():
+        reviews[row.property_id].append(row)
+    return reviews
+
+
+def expand_properties(session: Session, properties: list[Property], expand: set[PropertyExpand]) -> list[dict]:
+    """
+    Build the JSON body of each property with the expanded rows embedded
+
+    The properties must have been loaded with expand_options. Only the
+    expanded keys are added, so unexpanded responses keep their shape.
+    """
+    reviews: dict[uuid.UUID, list[Review]] = {}
+    if PropertyExpand.reviews in expand and properties:
+        reviews = load_latest_reviews(session, [property.id for property in properties],
+                                      settings.expanded_review_limit)
+
+    items: list[dict] = []
+    for property in properties:
+        item = PropertyReadExpanded.parse_obj(PropertyRead.from_orm(property))
+        if PropertyExpand.images in expand:
+            item.images = [PropertyImageRead.from_orm(image)
+                           for image in sorted(property.images, key=lambda image: (image.created, image.id))]
+        if PropertyExpand.reviews in expand:
+            item.reviews = [ReviewRead.from_orm(review) for review in reviews.get(property.id, [])]
+        if PropertyExpand.account in expand:
+            item.account = AccountRead.from_orm(property.account)
+        items.append(jsonable_encoder(item, exclude={name.value for name in PropertyExpand if name not in expand}))
+    return items
+
+
+def expanded_etag(content: list[dict] | dict, *parts: Any) -> str:
+    """
+    Build an ETag for an expanded response out of its encoded body
+
+    Embedded images have no row version, so unlike plain responses the
+    tag is taken from the content itself.
+    """
+    return make_etag(*parts, hashlib.sha1(orjson.dumps(content)).hexdigest())
@@ -3,22 +3,57 @@ Contains models for Property
 """
 
 # SQL Model imports
-from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel import Field, SQLModel, Relationship, Index
+
+# SQLAlchemy imports
+from sqlalchemy import Column, Computed, Float, Integer, text
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 
 # Standard library imports
 import uuid
 from datetime import date
+from enum import Enum
 from typing import Optional
 
 # Other model imports
 from ..reviews.models import Review
 from ..property_images.models import PropertyImage
-    
+
+# Availability window as an inclusive date range. Shared by the GiST index
+# and the search route so the planner can match them. greatest() keeps
+# rows with end_date before start_date from failing the index build
+AVAILABILITY_RANGE_SQL: str = "daterange(start_date, greatest(start_date, end_date), '[]')"
+
+# Full text search document, weighting name over address over description.
+# Postgres keeps this generated column up to date on every write
+SEARCH_VECTOR_SQL: str = (
+    "setweight(to_tsvector('english'::regconfig, name), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, address), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, description), 'C')"
+)
+
+# Row version, bumped by the ORM on every update and by rating aggregate
+# updates. Used for ETags
+property_version = Column("version", Integer, nullable=False, server_default="1")
+
 class Property(SQLModel, table=True):
 
     # Table arguments
     __tablename__ = "properties"
 
+    # The search vector is only used in SQL, so it is never loaded
+    __mapper_args__ = {"exclude_properties": ["search_vector"], "version_id_col": property_version}
+
+    __table_args__ = (
+        Index("ix_properties_created_id", "created", "id"),
+        Index("ix_properties_owner_id_created_id", "owner_id", "created", "id"),
+        Index("ix_properties_monthly_rent_id", "monthly_rent", "id"),
+        Index("ix_properties_average_rating_id", "average_rating", "id"),
+        Index("ix_properties_num_bedrooms_num_bathrooms_monthly_rent", "num_bedrooms", "num_bathrooms", "monthly_rent"),
+        Index("ix_properties_availability", text(AVAILABILITY_RANGE_SQL), postgresql_using="gist"),
+        Index("ix_properties_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
     # Main fields
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(foreign_key="accounts.id")
@@ -30,7 +65,24 @@ class Property(SQLModel, table=True):
     monthly_rent: int
     num_bedrooms: int
     num_bathrooms: int
-    created: date = Field(default=date.today())
+    created: date | None = Field(default=None, nullable=False, sa_column_kwargs={"server_default": text("CURRENT_DATE")})
+    version: int = Field(default=1, sa_column=property_version)
+
+    # Rating aggregates, kept up to date by the review routes.
+    # rating_histogram[n] is the number of reviews rated n (0 to 5)
+    review_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_sum: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_histogram: list[int] = Field(
+        default_factory=lambda: [0] * 6,
+        sa_column=Column(ARRAY(Integer, zero_indexes=True), nullable=False, server_default="{0,0,0,0,0,0}"),
+    )
+    average_rating: float | None = Field(
+        default=None,
+        sa_column=Column(Float, Computed("CASE WHEN review_count > 0 THEN rating_sum::float / review_count ELSE 0 END")),
+    )
+
+    # Full text search document
+    search_vector: str | None = Field(default=None, sa_column=Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL)))
 
     # Relationships
     reviews: list[Review] = Relationship(back_populates="property", sa_relationship_kwargs={"cascade": "delete"})
@@ -49,6 +101,9 @@ class PropertyCreate(SQLModel):
     num_bedrooms: int
     num_bathrooms: int
     
+class PropertyBulkItem(PropertyCreate):
+    id: uuid.UUID | None = None
+
 class PropertyRead(SQLModel):
     id: uuid.UUID
     owner_id: uuid.UUID
@@ -61,13 +116,26 @@ class PropertyRead(SQLModel):
     num_bedrooms: int
     num_bathrooms: int
     created: date
+    review_count: int
+    rating_sum: int
+    rating_histogram: list[int]
+    average_rating: float
+
+class PropertyBatchRead(SQLModel):
+    items: list[PropertyRead]
+    missing: list[uuid.UUID]
+
+class PropertySortKey(str, Enum):
+    created = "created"
+    rent = "rent"
+    rating = "rating"
 
 class PropertyUpdate(SQLModel):
     name: str | None = None
     address: str | None = None
     description: str | None = None
-    start_date: str | None = None
-    end_date: str | None = None
+    start_date: date | None = None
+    end_date: date | None = None
     monthly_rent: int | None = None
     num_bedrooms: int | None = None
     num_bathrooms: int | None = None
\ No newline at end of file
@@ -3,32 +3,67 @@ Contains routes to access Properties
 """
 
 # FastAPI imports
-from fastapi import APIRouter, Depends, Query, Path, Body, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Path, Body, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
 # SQLModel imports
 from sqlmodel import Session, select
 
-# Azure Blob imports
-from azure.storage.blob import ContainerClient
+# SQLAlchemy imports
+from sqlalchemy import Date, Float, bindparam, cast, func, literal_column, text
 
 # Model imports
-from .models import Property, PropertyCreate, PropertyRead, PropertyUpdate
+from .models import Property, PropertyBatchRead, PropertyBulkItem, PropertyCreate, PropertyRead, PropertyUpdate, PropertySortKey, AVAILABILITY_RANGE_SQL
+from ..accounts.models import Account
 from ..property_images.models import PropertyImage
 
+# Expansion imports
+from .expand import PropertyExpand, parse_expand, expand_options, expand_properties, expanded_etag
+
+# Bulk write imports
+from .bulk import write_properties
+from ..bulk import BulkResult, read_bulk_body, run_bulk
+
+# Blob reference counting imports
+from ..property_images.blobs import release_images
+
+# Blob deletion imports
+from ..property_images.deletions import process_blob_deletions
+
 # Dependency imports
-from ..dependencies import get_session, get_container_client
+from ..dependencies import get_session, get_cache
+
+# Cache imports
+from ..cache import Cache
+
+# Routing imports
+from ..routing import AppRoute
+
+# Pagination imports
+from ..pagination import paginate, NEXT_CURSOR_HEADER
+
+# Batch get imports
+from ..batch import BatchGetRequest, get_by_ids, parse_ids
 
-# Settings import
-from ..config import settings
+# Conditional request imports
+from ..conditional import make_etag, make_list_etag, not_modified, not_modified_response, check_if_match
+
+# Write imports
+from ..writes import insert_returning, update_returning
+
+# Serialization imports
+from ..serialization import field_columns, json_response, parse_fields, project, row_names, rows_response
 
 # Standard library imports
+import functools
 import uuid
-import os
-import shutil
+from typing import Any, Iterator
+from datetime import date
 
 
 # Initializing router
-router = APIRouter(prefix="/properties")
+router = APIRouter(prefix="/properties", route_class=AppRoute)
 
 
 ### HTTP GET FUNCTIONS ###
@@ -38,33 +73,279 @@ def get_all_properties(
     *,
     owner_id: uuid.UUID | None = Query(default=None),
     session: Session = Depends(get_session),
-    offset: int = Query(default=0),
+    request: Request,
+    response: Response,
+    cursor: str | None = Query(default=None),
+    offset: int | None = Query(default=None),
+    limit: int = Query(default=100, lte=100),
+    expand: list[str] = Query(default=[]),
+    fields: list[str] = Query(default=[]),
+):
+    """
+    Get a page of properties
+
+    expand=images,reviews,account embeds each property's ready images,
+    latest reviews and owner, loaded for the whole page at once.
+    fields=id,name,monthly_rent returns only those fields of each property.
+    """
+
+    # Get page of properties with filter on owner_id, as column tuples with
+    # only the fields asked for unless expanding
+    expansions = parse_expand(expand)
+    projection: list[str] | None = parse_fields(fields, Property, PropertyRead)
+    statement = select(Property).options(*expand_options(expansions)) if expansions \
+        else select(*field_columns(Property, PropertyRead, projection, Property.created))
+    properties = paginate(session, statement
+                          .where((Property.owner_id == owner_id) if owner_id else (Property is not None)),
+                          response=response,
+                          sort_column=Property.created,
+                          id_column=Property.id,
+                          cursor=cursor,
+                          offset=offset,
+                          limit=limit)
+
+    # Embed the expanded rows, tagging the page by its whole body
+    if expansions:
+        items: list[dict] = expand_properties(session, properties, expansions)
+        if projection:
+            items = [project(item, [*projection, *expansions]) for item in items]
+        next_cursor: str | None = response.headers.get(NEXT_CURSOR_HEADER)
+        etag: str = expanded_etag(items, next_cursor)
+        if not_modified(request, etag):
+            return not_modified_response(etag)
+        return JSONResponse(items, headers={"ETag": etag, **({NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {})})
+
+    # Skip the body if the client already has this page
+    etag: str = make_list_etag(properties, response.headers.get(NEXT_CURSOR_HEADER), *(projection or []))
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+
+    # Return list of properties
+    return rows_response(properties, projection or row_names(Property, PropertyRead), response)
+
+
+@router.get("/search", response_model=list[PropertyRead])
+def search_properties(
+    *,
+    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    min_rent: int | None = Query(default=None),
+    max_rent: int | None = Query(default=None),
+    min_bedrooms: int | None = Query(default=None),
+    max_bedrooms: int | None = Query(default=None),
+    min_bathrooms: int | None = Query(default=None),
+    max_bathrooms: int | None = Query(default=None),
+    available_from: date | None = Query(default=None),
+    available_to: date | None = Query(default=None),
+    sort: PropertySortKey = Query(default=PropertySortKey.created),
+    descending: bool = Query(default=False),
+    cursor: str | None = Query(default=None),
     limit: int = Query(default=100, lte=100),
+    fields: list[str] = Query(default=[]),
 ):
-    # Get properties with filter on owner_id
-    properties = session.exec(select(Property)
-                              .where((Property.owner_id == owner_id) if owner_id else (Property is not None))
-                              .offset(offset)
-                              .limit(limit))\
-        .all()
+    """
+    Search properties by rent, room counts and availability window
+
+    A property matches the availability filter if its start_date to
+    end_date window overlaps the requested one. Either end of the
+    requested window may be left out to leave it open.
+    """
+
+    # Ensure the availability window doesn't end before it starts
+    if available_from is not None and available_to is not None and available_from > available_to:
+        raise HTTPException(status_code=422, detail="available_from must not be after available_to")
+
+    # Order on the requested key
+    sort_column = {
+        PropertySortKey.created: Property.created,
+        PropertySortKey.rent: Property.monthly_rent,
+        PropertySortKey.rating: Property.average_rating,
+    }[sort]
+
+    # Build the range filters that were given, selecting only the fields asked for
+    projection: list[str] | None = parse_fields(fields, Property, PropertyRead)
+    statement = select(*field_columns(Property, PropertyRead, projection, sort_column))
+    for column, low, high in (
+        (Property.monthly_rent, min_rent, max_rent),
+        (Property.num_bedrooms, min_bedrooms, max_bedrooms),
+        (Property.num_bathrooms, min_bathrooms, max_bathrooms),
+    ):
+        if low is not None:
+            statement = statement.where(column >= low)
+        if high is not None:
+            statement = statement.where(column <= high)
+
+    # Overlap the availability window using the GiST index
+    if available_from is not None or available_to is not None:
+        statement = statement.where(
+            text(f"{AVAILABILITY_RANGE_SQL} && daterange(:available_from, :available_to, '[]')")
+            .bindparams(bindparam("available_from", available_from, type_=Date),
+                        bindparam("available_to", available_to, type_=Date))
+        )
+
+    # Get page of properties in the requested order
+    properties = paginate(session, statement,
+                          response=response,
+                          sort_column=sort_column,
+                          id_column=Property.id,
+                          cursor=cursor,
+                          limit=limit,
+                          descending=descending)
+
+    # Skip the body if the client already has this page
+    etag: str = make_list_etag(properties, response.headers.get(NEXT_CURSOR_HEADER), *(projection or []))
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
 
     # Return list of properties
-    return properties
+    return rows_response(properties, projection or row_names(Property, PropertyRead), response)
+
+
+@router.get("/search/text", response_model=list[PropertyRead])
+def search_properties_text(
+    *,
+    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    q: str = Query(min_length=1),
+    cursor: str | None = Query(default=None),
+    limit: int = Query(default=100, lte=100),
+    fields: list[str] = Query(default=[]),
+):
+    """
+    Full text search over property names, addresses and descriptions
+
+    The query uses web search syntax ("quoted phrases", or, -excluded).
+    Results are ranked best match first, with names weighted above
+    addresses and addresses above descriptions.
+    """
+
+    # Match against the GIN indexed search vector and rank the hits.
+    # The rank is cast to double precision so it survives the cursor exactly
+    search_vector = Property.__table__.c.search_vector
+    query = func.websearch_to_tsquery(literal_column("'english'::regconfig"), q)
+    rank = cast(func.ts_rank(search_vector, query), Float).label("rank")
+    projection: list[str] | None = parse_fields(fields, Property, PropertyRead)
+    statement = select(*field_columns(Property, PropertyRead, projection), rank).where(search_vector.op("@@")(query))
+
+    # Get page of ranked properties
+    rows = paginate(session, statement,
+                    response=response,
+                    sort_column=rank,
+                    id_column=Property.id,
+                    cursor=cursor,
+                    limit=limit,
+                    descending=True,
+                    cursor_of=lambda row: (row.rank, row.id))
+
+    # Skip the body if the client already has this page
+    etag: str = make_list_etag(rows, response.headers.get(NEXT_CURSOR_HEADER), *(projection or []))
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+
+    # Return list of properties. The rank comes after the named columns, so it is left out
+    return rows_response(rows, projection or row_names(Property, PropertyRead), response)
+
+
+@router.get("/batch", response_model=PropertyBatchRead)
+def get_properties_by_ids(
+    *,
+    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    ids: str = Query()
+):
+    """
+    Get several properties by a comma separated list of ids
+
+    Properties come back in the order asked for. Ids with no property
+    are listed under missing instead of failing the request.
+    """
+
+    # Get the properties in one query
+    properties, missing = get_by_ids(session, Property, parse_ids(ids))
+
+    # Skip the body if the client already has these versions
+    etag: str = make_list_etag(properties, *missing)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+
+    # Return the properties found and the ids that weren't
+    return PropertyBatchRead(items=properties, missing=missing)
 
 
 @router.get("/{property_id}", response_model=PropertyRead)
 def get_property_by_id(
     *,
     session: Session = Depends(get_session),
-    property_id: uuid.UUID = Path()
+    cache: Cache = Depends(get_cache),
+    request: Request,
+    response: Response,
+    property_id: uuid.UUID = Path(),
+    expand: list[str] = Query(default=[]),
+    fields: list[str] = Query(default=[])
 ):
-    # Get property and check if it exists
-    property = session.get(Property, property_id)
-    if not property:
-        raise HTTPException(status_code=404, detail="Property not found")
+    """
+    Get a property
+
+    expand=images,reviews,account embeds its ready images, latest reviews
+    and owner. fields=id,name,monthly_rent returns only those fields.
+    """
+    expansions = parse_expand(expand)
+    projection: list[str] | None = parse_fields(fields, Property, PropertyRead)
+
+    def load_property() -> dict:
+
+        # Embed the expanded rows, tagging the property by its whole body
+        if expansions:
+            property = session.get(Property, property_id, options=expand_options(expansions))
+            if not property:
+                raise HTTPException(status_code=404, detail="Property not found")
+            item: dict = expand_properties(session, [property], expansions)[0]
+            if projection:
+                item = project(item, [*projection, *expansions])
+            return {"item": item, "etag": expanded_etag(item)}
+
+        # Get property, with only the fields asked for, and check if it exists
+        row = session.execute(select(*field_columns(Property, PropertyRead, projection))
+                              .where(Property.id == property_id)).one_or_none()
+        if not row:
+            raise HTTPException(status_code=404, detail="Property not found")
+
+        return {
+            "item": jsonable_encoder(dict(zip(projection or row_names(Property, PropertyRead), row))),
+            "etag": make_etag(row.id, row.version, *(projection or [])),
+        }
+
+    # Get property, from the cache if possible. Owners have no cache tag,
+    # so properties with their owner embedded are always loaded
+    if not expansions:
+        cached: dict = cache.get_or_load("property", f"{property_id}:{','.join(projection or [])}",
+                                         [f"property:{property_id}"], load_property)
+    elif PropertyExpand.account not in expansions:
+        tags: list[str] = [f"property:{property_id}"]
+        if PropertyExpand.images in expansions:
+            tags.append(f"property_images:{property_id}")
+        if PropertyExpand.reviews in expansions:
+            tags.append(f"property_reviews:{property_id}")
+        cached = cache.get_or_load("property_expanded",
+                                   f"{property_id}:{','.join(sorted(expansions))}:{','.join(projection or [])}",
+                                   tags, load_property)
+    else:
+        cached = load_property()
 
-    # Return back property
-    return property
+    # Skip the body if the client already has this version
+    if not_modified(request, cached["etag"]):
+        return not_modified_response(cached["etag"])
+    response.headers["ETag"] = cached["etag"]
+
+    # Return back property, with the expanded rows if asked for
+    return json_response(cached["item"], response)
 
 
 ### HTTP POST FUNCTIONS ###
@@ -76,16 +357,53 @@ def create_property(
     property: PropertyCreate = Body()
 ):
 
-    # Create property by using from_orm function
-    db_property = Property.from_orm(property)
+    # Insert the property and read it back in one statement
+    row = insert_returning(session, Property, PropertyRead, property.dict())
 
     # Commit to DBMS
-    session.add(db_property)
     session.commit()
-    session.refresh(db_property)
 
     # Return back property
-    return db_property
+    return PropertyRead.parse_obj(row._mapping)
+
+
+@router.post("/bulk", response_model=BulkResult)
+def create_properties_bulk(
+    *,
+    session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
+    body: Iterator[Any] = Depends(read_bulk_body),
+    upsert: bool = Query(default=False)
+):
+    """
+    Create many properties from a JSON array or NDJSON body
+
+    With upsert, items carrying the id of an existing property replace
+    its fields. The response lists the id given to each item (null where
+    it failed) and the errors by item index.
+    """
+
+    # Write the properties a chunk at a time
+    return run_bulk(session, cache, body, PropertyBulkItem,
+                    functools.partial(write_properties, upsert=upsert),
+                    references={"owner_id": Account.id})
+
+
+@router.post("/batch", response_model=PropertyBatchRead)
+def get_properties_by_ids_post(
+    *,
+    session: Session = Depends(get_session),
+    batch: BatchGetRequest = Body()
+):
+    """
+    Get several properties by ids sent in the body, for lists too long for a URL
+    """
+
+    # Get the properties in one query
+    properties, missing = get_by_ids(session, Property, batch.ids)
+
+    # Return the properties found and the ids that weren't
+    return PropertyBatchRead(items=properties, missing=missing)
 
 
 ### HTTP PATCH FUNCTIONS ###
@@ -94,6 +412,9 @@ def create_property(
 def update_property(
     *,
     session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
+    request: Request,
+    response: Response,
     property_id: uuid.UUID = Path(),
     property: PropertyUpdate = Body()
 ):
@@ -103,18 +424,22 @@ def update_property(
     if not db_property:
         raise HTTPException(status_code=404, detail="Property not found")
 
-    # Update property data
-    property_data = property.dict(exclude_unset=True)
-    for key, value in property_data.items():
-        setattr(db_property, key, value)
+    # Check the client is editing the latest version
+    check_if_match(request, make_etag(db_property.id, db_property.version))
+
+    # Update property data and read it back in one statement
+    row = update_returning(session, Property, PropertyRead, property_id, db_property.version,
+                           property.dict(exclude_unset=True))
 
     # Commit to DBMS
-    session.add(db_property)
     session.commit()
-    session.refresh(db_property)
 
-    # Return back property
-    return db_property
+    # Drop cached copies
+    cache.invalidate(f"property:{property_id}")
+
+    # Return back property with its new version
+    response.headers["ETag"] = make_etag(row.id, row.version)
+    return PropertyRead.parse_obj(row._mapping)
 
 
 ### HTTP DELETE FUNCTIONS ###
@@ -123,8 +448,10 @@ def update_property(
 def delete_property(
     *,
     session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
+    background_tasks: BackgroundTasks,
+    request: Request,
     property_id: uuid.UUID = Path(),
-    container_client: ContainerClient = Depends(get_container_client),
 ):
 
     # Get property and check if it exists
@@ -132,25 +459,26 @@ def delete_property(
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
 
-    # Commit to DBMS
+    # Check the client is deleting the latest version
+    check_if_match(request, make_etag(property.id, property.version))
+
+    # Remember the images the delete cascades to
+    images = session.exec(select(PropertyImage.checksum, PropertyImage.path)
+                          .where(PropertyImage.property_id == property_id)).all()
+
+    # Delete the property and release its images' stored files
     session.delete(property)
+    queued: bool = release_images(session, images)
+
+    # Commit to DBMS
     session.commit()
 
-    # Now try to delete property images associated with this
-    if not settings.use_azure_blob:
-        try:
-            path = f"blob/{property_id}"
-            if os.path.exists(path):
-                shutil.rmtree(path)
-        except OSError as e:
-            raise HTTPException(
-                status_code=404, detail=f"There were images for property id: {property_id} but there was an error deleting existing images")
-    else:
-        blobs =  [blob.name for blob in container_client.list_blobs(name_starts_with=f"{property_id}")]
-        blobs.sort(reverse=True, key=len)
-        if len(blobs) > 0:
-            for blob in blobs:
-                container_client.delete_blob(blob)
+    # Drop cached copies of the property and its children
+    cache.invalidate(f"property:{property_id}", f"property_images:{property_id}", f"property_reviews:{property_id}")
+
+    # Delete unreferenced files once the response is sent
+    if queued:
+        background_tasks.add_task(process_blob_deletions)
 
     # Return back an OK response
     return {"ok": True}
\ No newline at end of file
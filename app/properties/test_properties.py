@@ -9,9 +9,22 @@ import pytest
 from fastapi import FastAPI, Response
 from fastapi.testclient import TestClient
 
+# SQLAlchemy imports
+from sqlalchemy import event
+
 # Main app import
 from ..main import app
 
+# Database imports
+from ..database import engine, create_async_db_engine
+
+# Dependency imports
+from .. import dependencies
+from ..dependencies import get_session, get_async_session
+
+# Settings import
+from ..config import settings
+
 # Model imports
 from ..accounts.models import AccountCreate
 from ..properties.models import PropertyCreate
@@ -19,6 +32,8 @@ from ..properties.models import PropertyCreate
 # Helper function imports from other tests
 from ..accounts.test_acccounts import create_account
 
+# Standard library imports
+import json
 
 
 # Create new client
@@ -133,6 +148,182 @@ class TestProperties:
         response = client.get("/api/properties/")
         assert len(response.json()) == 3
 
+    def test_get_all_properties_async_engine(self, monkeypatch):
+
+        # Make more properties, each with a review
+        client.post("/api/properties/bulk", json=[
+            {**self.property, "id": None, "name": f"Property {i}", "created": None} for i in range(4)
+        ])
+        for property in client.get("/api/properties/").json():
+            client.post("/api/reviews/", json={"property_id": property["id"], "poster_id": self.account["id"],
+                                               "rating": 4, "content": "Review"})
+
+        # Run the routes on asyncpg, with one event loop for every request
+        monkeypatch.setattr(settings, "use_async_engine", True)
+        monkeypatch.setattr(dependencies, "async_engine", create_async_db_engine())
+        monkeypatch.setitem(app.dependency_overrides, get_session, get_async_session)
+        with TestClient(app) as async_client:
+            try:
+                # Page through properties and reviews one row at a time
+                for url, count in (("/api/properties/", 5), ("/api/reviews/", 5)):
+                    ids: list[str] = []
+                    params: dict = {"limit": 1}
+                    while True:
+                        response = async_client.get(url, params=params)
+                        assert response.status_code == 200
+                        ids += [row["id"] for row in response.json()]
+                        if "X-Next-Cursor" not in response.headers:
+                            break
+                        params["cursor"] = response.headers["X-Next-Cursor"]
+                    assert len(set(ids)) == count
+
+                # Dates in a PATCH are bound as dates, which asyncpg insists on
+                response = async_client.patch(f"/api/properties/{self.property['id']}",
+                                              json={"start_date": "2024-01-01", "end_date": "2024-06-30"})
+                assert response.status_code == 200
+                assert (response.json()["start_date"], response.json()["end_date"]) == ("2024-01-01", "2024-06-30")
+
+                # Bulk NDJSON bodies are read from the request in the endpoint's greenlet
+                item: dict = {**self.property, "id": None, "name": "Streamed", "created": None}
+                response = async_client.post("/api/properties/bulk", data=json.dumps(item) + "\n",
+                                             headers={"Content-Type": "application/x-ndjson"})
+                assert response.json()["created"] == 1
+
+                # Routes kept on the threadpool still work alongside them
+                response = async_client.post(f"/api/properties/{self.property['id']}/images",
+                                             files={"upload_file": ("front.png", b"png", "image/png")})
+                assert response.status_code == 200
+            finally:
+                async_client.portal.call(dependencies.async_engine.dispose)
+
+    def test_search_properties(self):
+
+        # Make two more properties with different rents, rooms and dates
+        create_property(
+            PropertyCreate(
+                owner_id=self.account['id'],
+                name="Lux Apartments",
+                address="123 place",
+                description="This is some complex in college town",
+                start_date="2023-06-01",
+                end_date="2023-08-31",
+                monthly_rent=1500,
+                num_bedrooms=2,
+                num_bathrooms=2
+            ),
+            client_instance=client
+        )
+        create_property(
+            PropertyCreate(
+                owner_id=self.account['id'],
+                name="Cornell Dorms",
+                address="Hoy Road",
+                description="This is a dorm in Cornell",
+                start_date="2024-01-01",
+                end_date="2024-05-31",
+                monthly_rent=1000,
+                num_bedrooms=3,
+                num_bathrooms=2
+            ),
+            client_instance=client
+        )
+
+        # Filter on rent range
+        response = client.get("/api/properties/search", params={"min_rent": 1200, "max_rent": 2000})
+        assert response.status_code == 200
+        assert [p["name"] for p in response.json()] == ["Lux Apartments"]
+
+        # Filter on room counts
+        response = client.get("/api/properties/search", params={"min_bedrooms": 2, "min_bathrooms": 2})
+        assert {p["name"] for p in response.json()} == {"Lux Apartments", "Cornell Dorms"}
+
+        # Filter on an availability window overlapping only the first two
+        response = client.get("/api/properties/search", params={"available_from": "2023-07-01", "available_to": "2023-07-31"})
+        assert {p["name"] for p in response.json()} == {"College Town Terrace", "Lux Apartments"}
+
+        # Open ended availability window
+        response = client.get("/api/properties/search", params={"available_from": "2023-12-01"})
+        assert [p["name"] for p in response.json()] == ["Cornell Dorms"]
+
+        # A window ending before it starts is the client's mistake
+        response = client.get("/api/properties/search", params={"available_from": "2023-07-31", "available_to": "2023-07-01"})
+        assert response.status_code == 422
+
+        # Sort by rent, descending, one page at a time
+        names: list = []
+        params: dict = {"sort": "rent", "descending": True, "limit": 2}
+        while True:
+            response = client.get("/api/properties/search", params=params)
+            names += [p["name"] for p in response.json()]
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+        assert names == ["College Town Terrace", "Lux Apartments", "Cornell Dorms"]
+
+        # Revalidating an unchanged page returns an empty 304
+        params = {"min_rent": 1200}
+        response = client.get("/api/properties/search", params=params)
+        response = client.get("/api/properties/search", params=params, headers={"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_search_properties_text(self):
+
+        # Make two more properties to search through
+        create_property(
+            PropertyCreate(
+                owner_id=self.account['id'],
+                name="Collegetown Lofts",
+                address="200 College Ave",
+                description="Bright 2 bedroom apartments",
+                start_date="2022-11-30",
+                end_date="2023-11-30",
+                monthly_rent=1500,
+                num_bedrooms=2,
+                num_bathrooms=2
+            ),
+            client_instance=client
+        )
+        create_property(
+            PropertyCreate(
+                owner_id=self.account['id'],
+                name="Cornell Dorms",
+                address="Hoy Road",
+                description="A dorm near the apartments in Collegetown",
+                start_date="2022-11-30",
+                end_date="2023-11-30",
+                monthly_rent=1000,
+                num_bedrooms=3,
+                num_bathrooms=2
+            ),
+            client_instance=client
+        )
+
+        # Name matches rank above description matches
+        response = client.get("/api/properties/search/text", params={"q": "collegetown apartments"})
+        assert response.status_code == 200
+        assert [p["name"] for p in response.json()] == ["Collegetown Lofts", "Cornell Dorms"]
+
+        # Results page with the same cursor as other lists
+        response = client.get("/api/properties/search/text", params={"q": "apartment", "limit": 2})
+        first_page: list = [p["name"] for p in response.json()]
+        response = client.get("/api/properties/search/text", params={"q": "apartment", "limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+        second_page: list = [p["name"] for p in response.json()]
+        assert sorted(first_page + second_page) == ["College Town Terrace", "Collegetown Lofts", "Cornell Dorms"]
+
+        # Revalidating an unchanged page returns an empty 304
+        response = client.get("/api/properties/search/text", params={"q": "apartment"})
+        etag: str = response.headers["etag"]
+        response = client.get("/api/properties/search/text", params={"q": "apartment"}, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        # Updates are searchable right away, and change the page's ETag
+        response = client.patch(f"/api/properties/{self.property['id']}", json={"description": "Quiet studio apartment"})
+        response = client.get("/api/properties/search/text", params={"q": "studio"})
+        assert [p["name"] for p in response.json()] == ["College Town Terrace"]
+        response = client.get("/api/properties/search/text", params={"q": "apartment"}, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+
     def test_get_property(self):
         # Call get property stored in the class and store it
         response = client.get(f"/api/properties/{self.property['id']}")
@@ -151,6 +342,138 @@ class TestProperties:
         assert fetched_property["num_bathrooms"] == self.property["num_bathrooms"]
         assert fetched_property["created"] == self.property["created"]
 
+    def test_get_properties_expanded(self, monkeypatch):
+
+        # Give every property an image, an owner and more reviews than are embedded
+        monkeypatch.setattr(settings, "expanded_review_limit", 2)
+        create_property(
+            PropertyCreate(
+                owner_id=self.account['id'],
+                name="Lux Apartments",
+                address="123 place",
+                description="This is some complex in college town",
+                start_date="2022-11-30",
+                end_date="2023-11-30",
+                monthly_rent=1500,
+                num_bedrooms=2,
+                num_bathrooms=2
+            ),
+            client_instance=client
+        )
+        for property in client.get("/api/properties/").json():
+            client.post(f"/api/properties/{property['id']}/images",
+                        files={"upload_file": ("front.png", property["id"].encode(), "image/png")})
+            client.post("/api/reviews/bulk", json=[
+                {"property_id": property["id"], "poster_id": self.account["id"], "rating": rating, "content": "Review"}
+                for rating in range(3)
+            ])
+
+        # Count the queries a page of properties takes
+        statements: list[str] = []
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", count_statement)
+        try:
+            response = client.get("/api/properties/", params={"expand": "images,reviews,account", "limit": 1})
+            one_property: int = len(statements)
+            statements.clear()
+            response = client.get("/api/properties/", params={"expand": ["images", "reviews", "account"]})
+            two_properties: int = len(statements)
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statement)
+
+        # The page embeds everything in the same number of queries as a page of one
+        assert one_property == two_properties
+        assert len(response.json()) == 2
+        for fetched_property in response.json():
+            assert len(fetched_property["images"]) == 1
+            assert len(fetched_property["reviews"]) == 2
+            assert fetched_property["account"]["id"] == self.account["id"]
+
+        # The detail route embeds only what is asked for
+        response = client.get(f"/api/properties/{self.property['id']}", params={"expand": "images"})
+        assert response.json()["images"][0]["url"]
+        assert "reviews" not in response.json()
+        response = client.get(f"/api/properties/{self.property['id']}", headers={"If-None-Match": response.headers["etag"]},
+                              params={"expand": "images"})
+        assert response.status_code == 304
+
+        # New reviews show up in the cached expanded property
+        monkeypatch.setattr(settings, "expanded_review_limit", 10)
+        response = client.get(f"/api/properties/{self.property['id']}", params={"expand": "reviews"})
+        assert len(response.json()["reviews"]) == 3
+        client.post("/api/reviews/bulk", json=[
+            {"property_id": self.property["id"], "poster_id": self.account["id"], "rating": 5, "content": "Great"}
+            for _ in range(2)
+        ])
+        response = client.get(f"/api/properties/{self.property['id']}", params={"expand": "reviews"})
+        assert len(response.json()["reviews"]) == 5
+
+        # Unknown expansions are rejected
+        response = client.get("/api/properties/", params={"expand": "secrets"})
+        assert response.status_code == 422
+
+    def test_get_properties_fields(self):
+
+        # Capture the SQL of a page with only some fields
+        statements: list[str] = []
+        def capture_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", capture_statement)
+        try:
+            response = client.get("/api/properties/", params={"fields": "id,name,monthly_rent"})
+        finally:
+            event.remove(engine, "before_cursor_execute", capture_statement)
+
+        # Only those fields are returned, and the description is never selected
+        assert response.json() == [{"id": self.property["id"], "name": self.property["name"],
+                                    "monthly_rent": self.property["monthly_rent"]}]
+        assert not any("description" in statement for statement in statements)
+
+        # Narrow pages are tagged apart from full ones
+        full_etag: str = client.get("/api/properties/").headers["etag"]
+        assert response.headers["etag"] != full_etag
+
+        # The search and detail routes take fields too, repeated or comma separated
+        response = client.get("/api/properties/search", params={"fields": ["name", "monthly_rent"], "sort": "rent"})
+        assert response.json() == [{"name": self.property["name"], "monthly_rent": self.property["monthly_rent"]}]
+        response = client.get(f"/api/properties/{self.property['id']}", params={"fields": "name"})
+        assert response.json() == {"name": self.property["name"]}
+        response = client.get(f"/api/properties/{self.property['id']}", params={"fields": "name", "expand": "reviews"})
+        assert response.json() == {"name": self.property["name"], "reviews": []}
+
+        # Unknown fields are rejected
+        response = client.get("/api/properties/", params={"fields": "search_vector"})
+        assert response.status_code == 422
+
+    def test_get_properties_compressed(self, monkeypatch):
+
+        # Make the page larger than the compression threshold
+        monkeypatch.setattr(settings, "compression_min_size", 1024)
+        client.post("/api/properties/bulk", json=[
+            {**self.property, "id": None, "name": f"Property {i}", "created": None} for i in range(20)
+        ])
+
+        # Clients accepting gzip get it, with a weak ETag they can revalidate with
+        response = client.get("/api/properties/", headers={"Accept-Encoding": "br;q=0, gzip;q=0.8"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"].startswith('W/"')
+        assert len(response.json()) == 21
+        compressed_length: int = int(response.headers["content-length"])
+        response = client.get("/api/properties/", headers={"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304
+
+        # Other clients get the body as it is
+        response = client.get("/api/properties/", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["etag"].startswith('"')
+        assert int(response.headers["content-length"]) > compressed_length
+
+        # Small bodies aren't compressed
+        response = client.get(f"/api/properties/{self.property['id']}", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
     ### TEST HTTP POST FUNCTIONS ###
 
     def test_create_property(self):
@@ -165,6 +488,39 @@ class TestProperties:
         assert self.property["num_bedrooms"] == 1
         assert self.property["num_bathrooms"] == 1
 
+    def test_create_properties_bulk(self):
+
+        # Create two properties in one request, one with a missing owner
+        item: dict = {
+            "owner_id": self.account['id'],
+            "name": "Lux Apartments",
+            "address": "123 place",
+            "description": "This is some complex in college town",
+            "start_date": "2022-11-30",
+            "end_date": "2023-11-30",
+            "monthly_rent": 1500,
+            "num_bedrooms": 2,
+            "num_bathrooms": 2
+        }
+        response = client.post("/api/properties/bulk", json=[item, {**item, "owner_id": self.property['id']}])
+        assert response.status_code == 200
+        result: dict = response.json()
+        assert result["created"] == 1
+        assert result["ids"][1] is None
+        assert result["errors"][0]["index"] == 1
+
+        # Upsert the existing property and create a new one
+        response = client.post("/api/properties/bulk", params={"upsert": True},
+                               json=[{**item, "id": self.property['id'], "monthly_rent": 999}, item])
+        assert (response.json()["created"], response.json()["updated"]) == (1, 1)
+        fetched_property: dict = client.get(f"/api/properties/{self.property['id']}").json()
+        assert fetched_property["monthly_rent"] == 999
+        assert len(client.get("/api/properties/").json()) == 3
+
+        # A body that isn't an array is rejected
+        response = client.post("/api/properties/bulk", json=item)
+        assert response.status_code == 400
+
     ### TEST HTTP PATCH FUNCTIONS ###
 
     def test_update_property(self):
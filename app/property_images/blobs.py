@@ -0,0 +1,110 @@
+"""
+Contains helpers to reference count the content addressed image blobs
+"""
+
+# SQLModel imports
+from sqlmodel import Session, select, update
+
+# SQLAlchemy imports
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+# Model imports
+from .models import BlobDeletion, ImageBlob
+
+# Standard library imports
+from collections import Counter
+from typing import Iterable
+
+
+def lock_content(session: Session, key: str) -> None:
+    """
+    Take a transaction scoped lock on a checksum (or path)
+
+    Uploads take it before creating a blob, and the deletion job before
+    deleting its bytes, so a file is never deleted while the same bytes
+    are being stored again.
+    """
+    session.execute(select(func.pg_advisory_xact_lock(func.hashtext(key))))
+
+
+def acquire_blob(session: Session, checksum: str, path: str, size: int, content_type: str) -> bool:
+    """
+    Add a reference to the blob with this checksum, creating its row if needed
+
+    Returns True if the row is new, in which case the caller must store
+    the bytes before committing. The insert locks the row until then, so
+    a concurrent upload of the same bytes waits and only ever sees the
+    row once the bytes are in place.
+    """
+    lock_content(session, checksum)
+    ref_count: int = session.execute(
+        insert(ImageBlob)
+        .values(checksum=checksum, path=path, size=size, content_type=content_type, ref_count=1)
+        .on_conflict_do_update(index_elements=[ImageBlob.checksum], set_={"ref_count": ImageBlob.ref_count + 1})
+        .returning(ImageBlob.ref_count)
+    ).scalar_one()
+    return ref_count == 1
+
+
+def enqueue_deletion(session: Session, path: str, checksum: str | None = None) -> None:
+    """
+    Queue a stored file for deletion once the transaction commits
+    """
+    session.add(BlobDeletion(path=path, checksum=checksum))
+
+
+def release_blobs(session: Session, checksums: Iterable[str | None]) -> bool:
+    """
+    Drop one reference per checksum, deleting blobs nobody references anymore
+
+    Call this with the PropertyImage rows already deleted in the session.
+    The bytes and derivatives of unreferenced blobs are queued for
+    deletion in the same transaction (see deletions.py), so they are
+    deleted after the commit even if the process dies first. Returns
+    True if anything was queued.
+    """
+
+    # Write the image deletes first so the blob rows can go
+    session.flush()
+
+    queued: bool = False
+    for checksum, count in Counter(checksum for checksum in checksums if checksum).items():
+
+        # Drop the references in one atomic update
+        ref_count: int | None = session.execute(
+            update(ImageBlob)
+            .where(ImageBlob.checksum == checksum)
+            .values(ref_count=ImageBlob.ref_count - count)
+            .returning(ImageBlob.ref_count)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        if ref_count != 0:
+            continue
+
+        # That was the last reference, so queue the bytes and delete the row
+        blob = session.get(ImageBlob, checksum)
+        for derivative in blob.derivatives:
+            enqueue_deletion(session, derivative.path, checksum)
+        enqueue_deletion(session, blob.path, checksum)
+        session.delete(blob)
+        queued = True
+
+    return queued
+
+
+def release_images(session: Session, images: Iterable[tuple[str | None, str]]) -> bool:
+    """
+    Release the stored files of deleted images, given their checksums and paths
+
+    Unfinished uploads, and images stored before content addressing, have
+    no checksum and own their file outright, so it is queued directly.
+    Returns True if anything was queued.
+    """
+    images = list(images)
+    queued: bool = False
+    for checksum, path in images:
+        if not checksum:
+            enqueue_deletion(session, path)
+            queued = True
+    return release_blobs(session, [checksum for checksum, _ in images]) or queued
@@ -0,0 +1,92 @@
+"""
+Contains the job that deletes stored files queued in blob_deletions
+
+Deletes are queued in the same transaction as the rows that stopped
+referencing the files (an outbox), so requests return right after the
+commit and nothing is lost if the process dies before the files are
+gone. The job runs after each request that queued something and at
+startup. Failed deletes are retried on later runs with backoff.
+"""
+
+# SQLModel imports
+from sqlmodel import Session, select
+
+# Model imports
+from .models import BlobDeletion, ImageBlob, PropertyImageDerivative
+
+# Blob reference counting imports
+from .blobs import lock_content
+
+# Storage imports
+from .storage import delete_files
+
+# Database imports
+from ..database import engine
+
+# Dependency imports
+from ..dependencies import get_container_client
+
+# Settings import
+from ..config import settings
+
+# Standard library imports
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between retries of a failing delete
+MAX_RETRY_DELAY: timedelta = timedelta(hours=1)
+
+
+def process_blob_deletions() -> int:
+    """
+    Delete every queued file that is due, a batch at a time
+
+    Rows are claimed with SKIP LOCKED, so several workers can run this at
+    once. Files in use again, because the same bytes were uploaded since,
+    are left alone. Returns the number of rows handled.
+    """
+    container_client = get_container_client()
+    handled: int = 0
+
+    while True:
+        with Session(engine) as session:
+
+            # Claim a batch of due deletions
+            now: datetime = datetime.utcnow()
+            deletions: list[BlobDeletion] = session.exec(
+                select(BlobDeletion)
+                .where(BlobDeletion.next_attempt <= now)
+                .order_by(BlobDeletion.next_attempt)
+                .limit(settings.blob_delete_batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not deletions:
+                return handled
+
+            # Lock their content in a fixed order, then skip files back in use
+            for key in sorted({deletion.checksum or deletion.path for deletion in deletions}):
+                lock_content(session, key)
+            queued_paths: list[str] = [deletion.path for deletion in deletions]
+            in_use: set[str] = set(session.execute(
+                select(ImageBlob.path).where(ImageBlob.path.in_(queued_paths))
+                .union(select(PropertyImageDerivative.path).where(PropertyImageDerivative.path.in_(queued_paths)))
+            ).scalars())
+            paths: list[str] = [path for path in queued_paths if path not in in_use]
+
+            # Delete the files, then drop the done rows and push back the failed ones
+            errors: dict[str, str] = delete_files(paths, container_client)
+            for deletion in deletions:
+                if deletion.path not in errors:
+                    session.delete(deletion)
+                    continue
+                deletion.attempts += 1
+                deletion.last_error = errors[deletion.path]
+                deletion.next_attempt = now + min(timedelta(seconds=2 ** deletion.attempts), MAX_RETRY_DELAY)
+                session.add(deletion)
+                logger.warning("Could not delete %s (attempt %d): %s", deletion.path, deletion.attempts, deletion.last_error)
+
+            # Commit to DBMS
+            session.commit()
+            handled += len(deletions)
@@ -0,0 +1,143 @@
+"""
+Contains the background pipeline that builds resized copies of Property Images
+"""
+
+# SQLModel imports
+from sqlmodel import Session, select
+
+# SQLAlchemy imports
+from sqlalchemy.exc import IntegrityError
+
+# Model imports
+from .models import ImageBlob, PropertyImage, PropertyImageDerivative
+
+# Imaging imports
+from .imaging import render_derivatives, supported_formats, RenderedImage
+
+# Storage imports
+from .storage import read_file, write_file
+
+# Blob reference counting imports
+from .blobs import enqueue_deletion
+
+# Deletion job imports
+from .deletions import process_blob_deletions
+
+# Database imports
+from ..database import engine
+
+# Dependency imports
+from ..dependencies import get_container_client
+
+# Cache imports
+from ..cache import cache
+
+# Settings import
+from ..config import settings
+
+# Standard library imports
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Worker processes, started on first use
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Get the process pool used for resizing, starting it if needed
+
+    Workers are spawned rather than forked, since the parent has database
+    connections and threads that a forked child must not inherit.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.image_worker_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def shutdown_executor() -> None:
+    """
+    Stop the worker processes, if they were started
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def generate_derivatives(checksum: str) -> None:
+    """
+    Build and store every configured size and format of an image blob
+
+    Meant to run as a background task once the upload response is sent.
+    Derivatives belong to the blob, so every image sharing its bytes
+    shares them too. Failures are logged rather than raised, since the
+    original image is already stored and usable without derivatives.
+    """
+    container_client = get_container_client()
+
+    with Session(engine) as session:
+
+        # The blob may have been deleted, or already processed, before the task got to run
+        blob = session.get(ImageBlob, checksum)
+        if not blob or blob.derivatives:
+            return
+
+        # Resize in a worker process so the CPU work stays off the web workers
+        try:
+            source: bytes = read_file(blob.path, container_client)
+            rendered: list[RenderedImage] = get_executor().submit(
+                render_derivatives,
+                source,
+                settings.image_derivative_widths,
+                supported_formats(settings.image_derivative_formats),
+                settings.image_derivative_quality,
+            ).result()
+        except Exception:
+            logger.exception("Could not build derivatives for image blob %s", checksum)
+            return
+
+        # Store each derivative under the blob's checksum
+        paths: list[str] = []
+        for item in rendered:
+            name: str = f"derivatives/{checksum}/{item.width}.{item.format}"
+            path: str = write_file(name, item.data, f"image/{item.format}", container_client)
+            paths.append(path)
+            session.add(PropertyImageDerivative(
+                checksum=checksum,
+                width=item.width,
+                height=item.height,
+                format=item.format,
+                path=path,
+                size=len(item.data),
+            ))
+
+        # Commit, or if the blob was deleted or another run stored the same
+        # derivatives in the meantime, queue the files. The deletion job
+        # leaves alone the ones the other run's rows point at
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            for path in paths:
+                enqueue_deletion(session, path, checksum)
+            session.commit()
+            process_blob_deletions()
+            return
+
+        # Drop cached image lists of every property using the blob
+        property_ids = session.exec(select(PropertyImage.property_id)
+                                    .where(PropertyImage.checksum == checksum)
+                                    .distinct()).all()
+        cache.invalidate(*(f"property_images:{property_id}" for property_id in property_ids))
@@ -0,0 +1,63 @@
+"""
+Contains the image resizing done by the derivative worker processes
+
+This module is imported by every worker process, so it only depends on
+Pillow and nothing from the rest of the app.
+"""
+
+# Pillow imports
+from PIL import Image, ImageOps
+
+# Optional AVIF support, registered with Pillow by the pillow-avif-plugin package
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Standard library imports
+import io
+from typing import NamedTuple
+
+
+class RenderedImage(NamedTuple):
+    width: int
+    height: int
+    format: str
+    data: bytes
+
+
+def supported_formats(formats: list[str]) -> list[str]:
+    """
+    Keep only the formats Pillow can save to in this environment
+    """
+    Image.init()
+    return [format for format in formats if format.upper() in Image.SAVE]
+
+
+def render_derivatives(source: bytes, widths: list[int], formats: list[str], quality: int) -> list[RenderedImage]:
+    """
+    Resize an image to each width and encode it in each format
+
+    Images are never scaled up. Widths at or above the original width
+    collapse into a single copy at the original size.
+    """
+    with Image.open(io.BytesIO(source)) as original:
+
+        # Apply the camera orientation, then drop anything the encoders can't take
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        # Pick the target widths, capped at the original width
+        targets: list[int] = sorted({min(width, image.width) for width in widths})
+
+        rendered: list[RenderedImage] = []
+        for width in targets:
+            height: int = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+            for format in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, format=format.upper(), quality=quality)
+                rendered.append(RenderedImage(width=width, height=height, format=format, data=buffer.getvalue()))
+
+    return rendered
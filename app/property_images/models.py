@@ -3,30 +3,157 @@ Contains models for Property
 """
 
 # SQL Model imports
-from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel import Field, SQLModel, Relationship, Index, UniqueConstraint
+
+# SQLAlchemy imports
+from sqlalchemy import text
+
+# Pydantic imports
+from pydantic import root_validator
 
 # Standard library imports
 import uuid
-from datetime import date
+from datetime import date, datetime
+from enum import Enum
 from typing import Optional
 
 
+class ImageStatus(str, Enum):
+    pending = "pending"
+    ready = "ready"
+    failed = "failed"
+
+
+class ImageBlob(SQLModel, table=True):
+
+    # Table arguments
+    __tablename__ = "image_blobs"
+
+    # Main Fields. Stored bytes are named after their SHA-256 checksum, so
+    # identical uploads share one blob. ref_count is the number of
+    # PropertyImage rows pointing at it
+    checksum: str = Field(primary_key=True)
+    path: str
+    size: int
+    content_type: str
+    ref_count: int = Field(default=1)
+    created: date | None = Field(default=None, nullable=False, sa_column_kwargs={"server_default": text("CURRENT_DATE")})
+
+    # Relationships
+    derivatives: list["PropertyImageDerivative"] = Relationship(back_populates="blob", sa_relationship_kwargs={"cascade": "delete"})
+
 class PropertyImage(SQLModel, table=True):
 
     # Table arguments
     __tablename__ = "property_images"
 
+    __table_args__ = (
+        Index("ix_property_images_property_id_created_id", "property_id", "created", "id"),
+        Index("ix_property_images_checksum", "checksum"),
+    )
+
     # Main Fields
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     property_id: uuid.UUID = Field(foreign_key="properties.id")
-    path: str = Field(unique=True)
-    created: date = Field(default=date.today())
+    path: str
+    filename: str | None = None
+    checksum: str | None = Field(default=None, foreign_key="image_blobs.checksum")
+    size: int | None = None
+    status: str = Field(default=ImageStatus.ready.value)
+    expected_checksum: str | None = None
+    created: date | None = Field(default=None, nullable=False, sa_column_kwargs={"server_default": text("CURRENT_DATE")})
+
+    # When a pending image's upload URL expires (UTC). Pending images left
+    # past it are removed by the reconcile job
+    upload_expires: datetime | None = None
 
     # Relationships
     property: Optional["Property"] = Relationship()
+    blob: Optional[ImageBlob] = Relationship()
+    derivatives: list["PropertyImageDerivative"] = Relationship(sa_relationship_kwargs={
+        "primaryjoin": "PropertyImage.checksum == foreign(PropertyImageDerivative.checksum)",
+        "viewonly": True,
+    })
+
+class PropertyImageDerivative(SQLModel, table=True):
+
+    # Table arguments
+    __tablename__ = "property_image_derivatives"
+
+    __table_args__ = (
+        UniqueConstraint("checksum", "width", "format"),
+    )
+
+    # Main Fields
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    checksum: str = Field(foreign_key="image_blobs.checksum")
+    width: int
+    height: int
+    format: str
+    path: str
+    size: int
+
+    # Relationships
+    blob: Optional[ImageBlob] = Relationship(back_populates="derivatives")
+
+class BlobDeletion(SQLModel, table=True):
+
+    # Table arguments
+    __tablename__ = "blob_deletions"
+
+    __table_args__ = (
+        Index("ix_blob_deletions_next_attempt", "next_attempt"),
+    )
+
+    # Main Fields. Stored files waiting to be deleted, written in the same
+    # transaction as the rows that stopped referencing them
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    path: str
+    checksum: str | None = None
+    attempts: int = Field(default=0)
+    last_error: str | None = None
+    next_attempt: datetime = Field(default_factory=datetime.utcnow)
+    created: datetime = Field(default_factory=datetime.utcnow)
+
+class PropertyImageDerivativeRead(SQLModel):
+    width: int
+    height: int
+    format: str
+    path: str
+    size: int
+    url: str | None = None
 
 class PropertyImageRead(SQLModel):
     id: uuid.UUID
     property_id: uuid.UUID
     path: str
-    created: date
\ No newline at end of file
+    filename: str | None
+    checksum: str | None
+    size: int | None
+    status: str
+    created: date
+    derivatives: list[PropertyImageDerivativeRead] = []
+    url: str | None = None
+
+    @root_validator(skip_on_failure=True)
+    def set_urls(cls, values: dict) -> dict:
+        """
+        Point ready images and their derivatives at the content route
+        """
+        if values["status"] == ImageStatus.ready.value:
+            values["url"] = f"/api/properties/{values['property_id']}/images/{values['id']}/content"
+            for derivative in values["derivatives"]:
+                derivative.url = f"{values['url']}?width={derivative.width}&format={derivative.format}"
+        return values
+
+class PropertyImageUploadCreate(SQLModel):
+    filename: str
+    size: int = Field(gt=0)
+    checksum: str = Field(regex="^[0-9a-f]{64}$")
+
+class PropertyImageUploadRead(SQLModel):
+    image: PropertyImageRead
+    upload_url: str
+    upload_method: str = "PUT"
+    upload_headers: dict[str, str] = {}
+    expires: datetime
@@ -0,0 +1,244 @@
+"""
+Reconciles stored files against the rows that reference them
+
+Streams the storage listing (the local blob/ tree or the Azure container)
+and every stored path in the database, both sorted by path, and walks
+them side by side like a merge join. Only one listing page, one cursor
+batch and one repair batch are held at a time, so memory stays flat no
+matter how many objects there are.
+
+Differences found:
+    expired  a pending image whose upload URL ran out more than the grace
+             period ago, so it can never be finalized.
+    orphan   a stored file no row references, e.g. left by a crash between
+             writing bytes and committing. Files newer than the grace period
+             are skipped, since an upload may be about to commit them.
+    missing  a row whose file is gone. Pending uploads are expected to have
+             no file yet and failed ones to have lost it, so they are skipped.
+
+With --repair, expired images are deleted, and their staged bytes and
+orphans are queued for deletion through blob_deletions (so the deletion
+job's in-use checks apply). Derivative rows without a file are deleted
+and images without their bytes are marked failed. Runs take
+an advisory lock, so a scheduled run never overlaps a slow previous one.
+
+Example:
+    python -m app.property_images.reconcile
+    python -m app.property_images.reconcile --repair --grace-minutes 120
+"""
+
+# SQLModel imports
+from sqlmodel import Session, delete, select, update
+
+# SQLAlchemy imports
+from sqlalchemy import and_, func, literal, or_, union_all
+from sqlalchemy.engine import Connection, Row
+
+# Model imports
+from .models import BlobDeletion, ImageBlob, ImageStatus, PropertyImage, PropertyImageDerivative
+
+# Storage imports
+from .storage import StoredEntry, list_files
+
+# Blob reference counting imports
+from .blobs import enqueue_deletion
+
+# Deletion job imports
+from .deletions import process_blob_deletions
+
+# Database imports
+from ..database import engine
+
+# Dependency imports
+from ..dependencies import get_container_client
+
+# Cache imports
+from ..cache import cache
+
+# Settings import
+from ..config import settings
+
+# Standard library imports
+import argparse
+import re
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import Iterator, TextIO
+
+# Rows fetched per round trip from the server side cursor
+FETCH_SIZE: int = 1000
+
+# Checksum a stored name belongs to, for objects/ab/<checksum> and derivatives/<checksum>/<file>
+_CHECKSUM_PATTERN = re.compile(r"(?:^|/)(?:objects/[0-9a-f]{2}|derivatives)/([0-9a-f]{64})(?:/[^/]+)?$")
+
+
+def _stored_paths(connection: Connection) -> Iterator[Row]:
+    """
+    Stream every path the database knows about, sorted by path in byte order
+
+    Images with a checksum share their blob's path, so only those without
+    one (pending uploads and images stored before content addressing) are
+    listed on their own.
+    """
+    paths = union_all(
+        select(ImageBlob.path, literal("blob").label("kind"), ImageBlob.checksum,
+               literal(None).label("status")),
+        select(PropertyImageDerivative.path, literal("derivative"), PropertyImageDerivative.checksum,
+               literal(None)),
+        select(PropertyImage.path, literal("image"), PropertyImage.checksum, PropertyImage.status)
+        .where(PropertyImage.checksum.is_(None)),
+        select(BlobDeletion.path, literal("deletion"), BlobDeletion.checksum, literal(None)),
+    ).subquery()
+    query = select(paths).order_by(paths.c.path.collate("C"))
+    yield from connection.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(query)
+
+
+def _content_key(path: str) -> str | None:
+    """
+    Get the checksum a stored file holds bytes of, if its name says so
+    """
+    match = _CHECKSUM_PATTERN.search(path)
+    return match.group(1) if match else None
+
+
+def _expired_uploads(session: Session, cutoff: datetime) -> Iterator[Row]:
+    """
+    Get the path and property of every pending image whose upload URL expired before cutoff
+
+    Images made before expiry times were recorded have none, and are
+    treated as expired a day after they were created.
+    """
+    naive_cutoff: datetime = cutoff.astimezone(timezone.utc).replace(tzinfo=None)
+    yield from session.execute(
+        select(PropertyImage.id, PropertyImage.path, PropertyImage.property_id)
+        .where(PropertyImage.status == ImageStatus.pending.value)
+        .where(or_(PropertyImage.upload_expires < naive_cutoff,
+                   and_(PropertyImage.upload_expires.is_(None),
+                        PropertyImage.created < (naive_cutoff - timedelta(days=1)).date())))
+        .order_by(PropertyImage.path)
+    ).all()
+
+
+def _flush_repairs(session: Session, property_ids: set[uuid.UUID]) -> None:
+    """
+    Commit a batch of repairs and drop the cached image lists they touch
+    """
+    session.commit()
+    cache.invalidate(*(f"property_images:{property_id}" for property_id in property_ids))
+    property_ids.clear()
+
+
+def reconcile(*, repair: bool = False, grace: timedelta = timedelta(hours=1), out: TextIO = sys.stdout) -> Counter | None:
+    """
+    Compare storage with the database, printing one line per difference
+
+    Returns how many of each difference were found, or None if another
+    run holds the lock.
+    """
+    container_client = get_container_client()
+    cutoff: datetime = datetime.now(timezone.utc) - grace
+    found: Counter = Counter()
+    touched: set[uuid.UUID] = set()
+    pending_repairs: int = 0
+
+    with engine.connect() as connection, Session(engine) as session:
+
+        # Only one run at a time
+        if not connection.execute(select(func.pg_try_advisory_lock(func.hashtext("reconcile")))).scalar_one():
+            print("Another reconciliation is running", file=out)
+            return None
+
+        try:
+
+            # Pending uploads that can no longer be finished. Their staged
+            # bytes get a deletion row, so the merge below skips them
+            for row in _expired_uploads(session, cutoff):
+                found["expired upload"] += 1
+                print(f"expired\t{row.path}", file=out)
+                if repair:
+                    session.execute(delete(PropertyImage)
+                                    .where(PropertyImage.id == row.id)
+                                    .where(PropertyImage.status == ImageStatus.pending.value)
+                                    .execution_options(synchronize_session=False))
+                    enqueue_deletion(session, row.path)
+                    touched.add(row.property_id)
+            _flush_repairs(session, touched)
+
+            files: Iterator[StoredEntry] = list_files(container_client)
+            groups = groupby(_stored_paths(connection), key=lambda row: row.path)
+            entry: StoredEntry | None = next(files, None)
+            group = next(groups, None)
+
+            while entry is not None or group is not None:
+
+                # A file with no rows is an orphan, once it is old enough
+                if group is None or (entry is not None and entry.path < group[0]):
+                    if entry.modified < cutoff:
+                        found["orphan"] += 1
+                        print(f"orphan\t{entry.path}", file=out)
+                        if repair:
+                            enqueue_deletion(session, entry.path, _content_key(entry.path))
+                            pending_repairs += 1
+                    entry = next(files, None)
+
+                # Rows with no file are missing their bytes
+                elif entry is None or group[0] < entry.path:
+                    path, rows = group
+                    for row in rows:
+                        if row.kind == "deletion" or row.status in (ImageStatus.pending.value, ImageStatus.failed.value):
+                            continue
+                        found[f"missing {row.kind}"] += 1
+                        print(f"missing\t{path}\t{row.kind}", file=out)
+                        if not repair:
+                            continue
+                        if row.kind == "derivative":
+                            session.execute(delete(PropertyImageDerivative)
+                                            .where(PropertyImageDerivative.path == path)
+                                            .execution_options(synchronize_session=False))
+                            touched.update(session.exec(select(PropertyImage.property_id)
+                                                        .where(PropertyImage.checksum == row.checksum)).all())
+                        else:
+                            touched.update(session.execute(update(PropertyImage)
+                                                           .where(PropertyImage.path == path)
+                                                           .where(PropertyImage.status == ImageStatus.ready.value)
+                                                           .values(status=ImageStatus.failed.value)
+                                                           .returning(PropertyImage.property_id)
+                                                           .execution_options(synchronize_session=False)).scalars())
+                        pending_repairs += 1
+                    group = next(groups, None)
+
+                # Both sides agree
+                else:
+                    entry, group = next(files, None), next(groups, None)
+
+                if pending_repairs >= settings.blob_delete_batch_size:
+                    _flush_repairs(session, touched)
+                    pending_repairs = 0
+
+            _flush_repairs(session, touched)
+
+        finally:
+            connection.rollback()
+            connection.execute(select(func.pg_advisory_unlock(func.hashtext("reconcile"))))
+
+    # Delete the queued files now rather than waiting for the next request
+    if repair and (found["orphan"] or found["expired upload"]):
+        process_blob_deletions()
+
+    print("\t".join(f"{kind}={count}" for kind, count in sorted(found.items())) or "no differences", file=out)
+    return found
+
+
+if __name__ == "__main__":
+
+    # Make sure every model's mapper is configured
+    import app.main  # noqa: F401
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repair", action="store_true", help="fix the differences instead of only reporting them")
+    parser.add_argument("--grace-minutes", type=int, default=60, help="ignore files newer than this (default: 60)")
+    args = parser.parse_args()
+    reconcile(repair=args.repair, grace=timedelta(minutes=args.grace_minutes))
@@ -3,30 +3,74 @@ Contains routes to access Property Images
 """
 
 # FastAPI imports
-from fastapi import APIRouter, Depends, Query, Path, Body, File, UploadFile, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Path, Body, File, UploadFile, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# Starlette imports
+from starlette.concurrency import run_in_threadpool
 
 # SQLModel imports
 from sqlmodel import Session, select
 
+# SQLAlchemy imports
+from sqlalchemy.orm import selectinload
+
 # Azure Blob imports
 from azure.storage.blob import ContainerClient
 
 # Model imports
-from .models import PropertyImage, PropertyImageRead
+from .models import (ImageStatus, PropertyImage, PropertyImageDerivative, PropertyImageRead,
+                     PropertyImageUploadCreate, PropertyImageUploadRead)
+from ..properties.models import Property
+
+# Storage imports
+from .storage import digest_upload, blob_name, stored_path, save_upload, save_local_stream, file_size
+
+# Blob reference counting imports
+from .blobs import acquire_blob, release_images
+
+# Blob deletion imports
+from .deletions import process_blob_deletions
+
+# Derivative imports
+from .derivatives import generate_derivatives
+
+# Serving imports
+from .serving import content_response
+
+# Pre-signed upload imports
+from .uploads import (upload_name, upload_content_type, upload_expiry, create_upload_target,
+                      check_upload_signature, is_pending_upload, verify_upload)
 
 # Dependency imports
-from ..dependencies import get_session, get_container_client
+from ..dependencies import get_session, get_sync_session, get_container_client, get_cache
+
+# Cache imports
+from ..cache import Cache
+
+# Routing imports
+from ..routing import AppRoute, threadpool_route
+
+# Pagination imports
+from ..pagination import paginate, NEXT_CURSOR_HEADER
+
+# Write imports
+from ..writes import insert_returning
+
+# Serialization imports
+from ..serialization import json_response
 
 # Settings import
 from ..config import settings
 
 # Standard library imports
+import mimetypes
 import uuid
-import os
+from datetime import datetime
 
 
 # Initializing router
-router = APIRouter(prefix="/properties")
+router = APIRouter(prefix="/properties", route_class=AppRoute)
 
 
 ### HTTP GET FUNCTIONS ###
@@ -35,32 +79,124 @@ router = APIRouter(prefix="/properties")
 def get_all_property_images(
     *,
     session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
     property_id: uuid.UUID = Path(),
-    offset: int = Query(default=0),
+    response: Response,
+    cursor: str | None = Query(default=None),
+    offset: int | None = Query(default=None),
     limit: int = Query(default=100, lte=100),
 ):
     """
     Get all the images for a particular property
     """
 
-    # Get property images with filter on property_id
-    property_images = session.exec(select(PropertyImage)
+    def load_property_images() -> dict:
+
+        # Get page of property images with filter on property_id
+        property_images = paginate(session, select(PropertyImage)
                                    .where(PropertyImage.property_id == property_id)
-                                   .offset(offset)
-                                   .limit(limit))\
-        .all()
+                                   .where(PropertyImage.status == ImageStatus.ready.value)
+                                   .options(selectinload(PropertyImage.derivatives)),
+                                   response=response,
+                                   sort_column=PropertyImage.created,
+                                   id_column=PropertyImage.id,
+                                   cursor=cursor,
+                                   offset=offset,
+                                   limit=limit)
+
+        return {
+            "items": jsonable_encoder([PropertyImageRead.from_orm(image) for image in property_images]),
+            "next_cursor": response.headers.get(NEXT_CURSOR_HEADER),
+        }
+
+    # Get the page, from the cache if possible
+    page: dict = cache.get_or_load("property_images", f"{property_id}:{cursor}:{offset}:{limit}",
+                                   [f"property_images:{property_id}"], load_property_images)
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
 
     # Return list of property images
-    return property_images
+    return json_response(page["items"], response)
+
+@router.get("/{property_id}/images/{property_image_id}", response_model=PropertyImageRead)
+def get_property_image(
+    *,
+    session: Session = Depends(get_session),
+    property_id: uuid.UUID = Path(),
+    property_image_id: uuid.UUID = Path()
+):
+    """
+    Get one image of a property, including pending and failed uploads
+    """
+
+    # Get property image and check if it exists
+    property_image = session.get(PropertyImage, property_image_id)
+    if not property_image or property_image.property_id != property_id:
+        raise HTTPException(status_code=404, detail="Property image not found")
+
+    # Return property image
+    return PropertyImageRead.from_orm(property_image)
+
+@router.api_route("/{property_id}/images/{property_image_id}/content", methods=["GET", "HEAD"])
+@threadpool_route
+def get_property_image_content(
+    *,
+    session: Session = Depends(get_sync_session),
+    container_client: ContainerClient = Depends(get_container_client),
+    request: Request,
+    property_id: uuid.UUID = Path(),
+    property_image_id: uuid.UUID = Path(),
+    width: int | None = Query(default=None),
+    format: str | None = Query(default=None)
+):
+    """
+    Get the bytes of an image, or of one of its derivatives given width and format
+
+    Supports Range, If-None-Match and If-Modified-Since. Responses are
+    marked immutable, since the bytes behind a URL never change.
+    """
+
+    # Get property image and check if it is ready
+    property_image = session.get(PropertyImage, property_image_id)
+    if (not property_image or property_image.property_id != property_id
+            or property_image.status != ImageStatus.ready.value):
+        raise HTTPException(status_code=404, detail="Property image not found")
+
+    # Serve a derivative if one was asked for
+    if width is not None or format is not None:
+        derivative = session.exec(select(PropertyImageDerivative)
+                                  .where(PropertyImageDerivative.checksum == property_image.checksum)
+                                  .where(PropertyImageDerivative.width == width)
+                                  .where(PropertyImageDerivative.format == format)).first()
+        if not derivative:
+            raise HTTPException(status_code=404, detail="Property image derivative not found")
+        return content_response(request, derivative.path, derivative.size, f"image/{derivative.format}",
+                                f'"{property_image.checksum}-{derivative.width}.{derivative.format}"',
+                                property_image.blob.created, container_client)
+
+    # Serve the original. Images stored before content addressing have no blob
+    if property_image.blob:
+        blob = property_image.blob
+        return content_response(request, blob.path, blob.size, blob.content_type, f'"{blob.checksum}"',
+                                blob.created, container_client)
+    size: int | None = file_size(property_image.path, container_client)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Property image not found in storage")
+    return content_response(request, property_image.path, size,
+                            mimetypes.guess_type(property_image.path)[0] or "application/octet-stream",
+                            f'"{property_image.id}"', property_image.created, container_client)
 
 ### HTTP POST FUNCTIONS ###
 
 
 @router.post("/{property_id}/images", response_model=PropertyImageRead)
+@threadpool_route
 def create_property_image(
     *,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_sync_session),
+    cache: Cache = Depends(get_cache),
     container_client: ContainerClient = Depends(get_container_client),
+    background_tasks: BackgroundTasks,
     property_id: uuid.UUID = Path(),
     upload_file: UploadFile = File(),
 ):
@@ -70,53 +206,191 @@ def create_property_image(
         raise HTTPException(
             status_code=400, detail="Unsupported image file type")
 
-    # Used for finalizing the database entry's "path" field later
-    final_path: str = ""
-
-    # Use settings to track if we upload to azure blob or local
-    if not settings.use_azure_blob:
+    # Hash the file to find its content addressed name
+    digest = digest_upload(upload_file)
+    name: str = blob_name(digest.checksum)
+    path: str = stored_path(name)
+
+    # Reference the blob, only storing the bytes if nobody has them yet
+    is_new_blob: bool = acquire_blob(session, digest.checksum, path, digest.size, upload_file.content_type)
+    if is_new_blob:
+        save_upload(upload_file, name, container_client)
+
+    # Now create the database entry
+    row = insert_returning(session, PropertyImage, PropertyImageRead, {
+        "property_id": property_id,
+        "path": path,
+        "filename": upload_file.filename,
+        "checksum": digest.checksum,
+        "size": digest.size,
+    })
 
-        # If "/blob" doesn't have a subfolder for the property id, make it
-        subfolder: str = f"blob/{property_id}"
-        if not os.path.exists(subfolder):
-            os.makedirs(subfolder)
+    # Commit to DBMS
+    session.commit()
 
-        # Now create the path and save the image
-        path: str = f"{subfolder}/{upload_file.filename}"
-        with open(path, "wb+") as file_obj:
-            file_obj.write(upload_file.file.read())
+    # Drop cached image lists
+    cache.invalidate(f"property_images:{property_id}")
 
-        # Set the final path
-        final_path = os.path.abspath(path)
+    # Build the resized copies of new blobs once the response is sent
+    if is_new_blob:
+        background_tasks.add_task(generate_derivatives, digest.checksum)
 
-    else:
+    # Return back property image
+    return PropertyImageRead.parse_obj(row._mapping)
 
-        # Create the blob path
-        blob_path: str = f"{property_id}/{upload_file.filename}"
-        container_client.upload_blob(name=blob_path, data=upload_file.file)
+@router.post("/{property_id}/images/uploads", response_model=PropertyImageUploadRead)
+def create_property_image_upload(
+    *,
+    session: Session = Depends(get_session),
+    container_client: ContainerClient = Depends(get_container_client),
+    request: Request,
+    property_id: uuid.UUID = Path(),
+    upload: PropertyImageUploadCreate = Body()
+):
+    """
+    Start an upload that goes straight to storage
 
-        # Set the final path
-        final_path = blob_path
+    Creates a pending image and returns a short lived URL to PUT the file
+    to. Once the PUT is done, call finalize.
+    """
 
-    
-    # Now create the database entry 
-    db_property_image = PropertyImage(property_id=property_id, path=final_path)
+    # Ensure file is supported type and size
+    content_type: str | None = upload_content_type(upload.filename)
+    if content_type not in ("image/png", "image/jpeg"):
+        raise HTTPException(status_code=400, detail="Unsupported image file type")
+    if upload.size > settings.max_image_upload_bytes:
+        raise HTTPException(status_code=413, detail=f"Image is larger than {settings.max_image_upload_bytes} bytes")
+
+    # Ensure property exists
+    if not session.get(Property, property_id):
+        raise HTTPException(status_code=404, detail="Property not found")
+
+    # Create the pending database entry, noting when its upload URL expires
+    property_image_id: uuid.UUID = uuid.uuid4()
+    expires: datetime = upload_expiry()
+    row = insert_returning(session, PropertyImage, PropertyImageRead, {
+        "id": property_image_id,
+        "property_id": property_id,
+        "path": stored_path(upload_name(property_image_id)),
+        "filename": upload.filename,
+        "size": upload.size,
+        "status": ImageStatus.pending.value,
+        "expected_checksum": upload.checksum,
+        "upload_expires": expires.replace(tzinfo=None),
+    })
+    property_image = PropertyImageRead.parse_obj(row._mapping)
 
     # Commit to DBMS
-    session.add(db_property_image)
     session.commit()
-    session.refresh(db_property_image)
+
+    # Sign the URL the client uploads to
+    target = create_upload_target(
+        property_image,
+        content_type,
+        request.url_for("upload_property_image_content", property_id=str(property_id), property_image_id=str(property_image_id)),
+        expires,
+        container_client,
+    )
+
+    # Return the pending image and where to upload it
+    return PropertyImageUploadRead(
+        image=property_image,
+        upload_url=target.url,
+        upload_headers=target.headers,
+        expires=target.expires,
+    )
+
+
+@router.post("/{property_id}/images/{property_image_id}/finalize", response_model=PropertyImageRead)
+@threadpool_route
+def finalize_property_image_upload(
+    *,
+    session: Session = Depends(get_sync_session),
+    container_client: ContainerClient = Depends(get_container_client),
+    background_tasks: BackgroundTasks,
+    property_id: uuid.UUID = Path(),
+    property_image_id: uuid.UUID = Path()
+):
+    """
+    Confirm a pre-signed upload is done
+
+    The upload must exist with the declared size. Its checksum is then
+    checked in the background, after which the image is ready (or failed).
+    Calling this again is harmless.
+    """
+
+    # Get property image and check if it exists
+    property_image = session.get(PropertyImage, property_image_id)
+    if not property_image or property_image.property_id != property_id:
+        raise HTTPException(status_code=404, detail="Property image not found")
+
+    # Already finalized images are returned as they are
+    if property_image.status != ImageStatus.pending.value:
+        return PropertyImageRead.from_orm(property_image)
+
+    # Ensure the client uploaded what it declared
+    size: int | None = file_size(property_image.path, container_client)
+    if size is None:
+        raise HTTPException(status_code=400, detail="Upload not found")
+    if size != property_image.size:
+        raise HTTPException(status_code=400, detail=f"Upload is {size} bytes, expected {property_image.size}")
+
+    # Check the checksum once the response is sent
+    background_tasks.add_task(verify_upload, property_image.id)
 
     # Return back property image
-    return db_property_image
+    return PropertyImageRead.from_orm(property_image)
+
+### HTTP PUT FUNCTIONS ###
+
+@router.put("/{property_id}/images/{property_image_id}/upload", status_code=201)
+async def upload_property_image_content(
+    *,
+    request: Request,
+    property_id: uuid.UUID = Path(),
+    property_image_id: uuid.UUID = Path(),
+    size: int = Query(),
+    expires: int = Query(),
+    signature: str = Query()
+):
+    """
+    Receive the bytes of a pre-signed upload when storing locally
+
+    Stands in for the Azure SAS URL, so it is authorized by the URL's
+    signature alone. Like the create-only SAS, it accepts one upload per
+    image, and only while the image is pending.
+    """
+
+    # Only local storage uploads through the API
+    if settings.use_azure_blob:
+        raise HTTPException(status_code=404, detail="Uploads go to Azure storage")
+
+    # Ensure the URL is valid
+    if not check_upload_signature(property_image_id, size, expires, signature):
+        raise HTTPException(status_code=403, detail="Upload URL is invalid or expired")
+
+    # Ensure the image is still waiting for its bytes
+    if not await run_in_threadpool(is_pending_upload, property_id, property_image_id):
+        raise HTTPException(status_code=409, detail="Image is not waiting for an upload")
+
+    # Stream the body to the staging name, unless it was uploaded already
+    try:
+        await save_local_stream(request.stream(), upload_name(property_image_id), size)
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail="Image was already uploaded")
+
+    # Return an empty created response
+    return Response(status_code=201)
 
 ### HTTP DELETE FUNCTIONS ###
 
 @router.delete("/{property_id}/images/{property_image_id}")
+@threadpool_route
 def delete_property_image(
     *,
-    session: Session = Depends(get_session),
-    container_client: ContainerClient = Depends(get_container_client),
+    session: Session = Depends(get_sync_session),
+    cache: Cache = Depends(get_cache),
+    background_tasks: BackgroundTasks,
     property_id: uuid.UUID = Path(),
     property_image_id: uuid.UUID = Path()
 ):
@@ -130,22 +404,19 @@ def delete_property_image(
     if property_image.property_id != property_id:
         raise HTTPException(status_code=400, detail="Specified property ID does not have this image")
 
-    # Use settings to track if we delete on azure blob or local
-    if not settings.use_azure_blob:
-        try:
-            os.remove(property_image.path)
-        except OSError as e:
-            raise HTTPException(
-                status_code=404, detail=f"Image not found on file system: {e.filename} - {e.strerror}")
-    else:
-        try:
-            container_client.delete_blob(blob=property_image.path)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"There was an error trying to delete image on cloud {e}")
+    # Delete the row and release its stored file
+    session.delete(property_image)
+    queued: bool = release_images(session, [(property_image.checksum, property_image.path)])
 
     # Commit to DBMS
-    session.delete(property_image)
     session.commit()
 
+    # Drop cached image lists
+    cache.invalidate(f"property_images:{property_id}")
+
+    # Delete unreferenced files once the response is sent
+    if queued:
+        background_tasks.add_task(process_blob_deletions)
+
     # Return back an OK response
     return {"ok": True}
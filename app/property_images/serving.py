@@ -0,0 +1,145 @@
+"""
+Contains helpers to serve stored image bytes over HTTP
+
+Image bytes never change once stored, so responses are cacheable forever
+and conditional and range requests are answered from the database row
+alone, before storage is touched.
+"""
+
+# FastAPI imports
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+# Azure Blob imports
+from azure.storage.blob import ContainerClient
+
+# Storage imports
+from .storage import CHUNK_SIZE
+
+# Conditional request imports
+from ..conditional import not_modified
+
+# Azure Blob client imports
+from ..azure_blob import get_async_container_client
+
+# Settings import
+from ..config import settings
+
+# Standard library imports
+from datetime import date, datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Iterator
+
+# Cache-Control for content that never changes under its URL
+IMMUTABLE_CACHE_CONTROL: str = "public, max-age=31536000, immutable"
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parse a Range header into an inclusive (start, end) byte range
+
+    Returns None when the whole file should be sent: no header, a unit
+    other than bytes, or several ranges (which servers may ignore).
+    Raises a 416 for a range outside the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header.removeprefix("bytes=").strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = size - int(last), size - 1
+    except ValueError:
+        return None
+    start, end = max(start, 0), min(end, size - 1)
+    if start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _modified_since(request: Request, last_modified: datetime) -> bool:
+    """
+    Check If-Modified-Since, which only applies without If-None-Match
+    """
+    header: str | None = request.headers.get("if-modified-since")
+    if header is None or "if-none-match" in request.headers:
+        return True
+    try:
+        return last_modified > parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return True
+
+
+def iter_file(path: str, start: int, end: int, container_client: ContainerClient | None) -> Iterator[bytes]:
+    """
+    Yield an inclusive byte range of a stored file one chunk at a time
+    """
+    if not settings.use_azure_blob:
+        with open(path, "rb") as file_obj:
+            file_obj.seek(start)
+            remaining: int = end - start + 1
+            while remaining > 0 and (chunk := file_obj.read(min(CHUNK_SIZE, remaining))):
+                remaining -= len(chunk)
+                yield chunk
+    else:
+        yield from container_client.download_blob(path, offset=start, length=end - start + 1).chunks()
+
+
+async def aiter_blob(path: str, start: int, end: int, async_container_client) -> AsyncIterator[bytes]:
+    """
+    Yield an inclusive byte range of a blob on the event loop
+    """
+    downloader = await async_container_client.download_blob(path, offset=start, length=end - start + 1)
+    async for chunk in downloader.chunks():
+        yield chunk
+
+
+def content_response(
+    request: Request,
+    path: str,
+    size: int,
+    content_type: str,
+    etag: str,
+    created: date,
+    container_client: ContainerClient | None,
+) -> Response:
+    """
+    Build the response for a stored file, honouring conditional and range requests
+    """
+    last_modified: datetime = datetime.combine(created, time(), tzinfo=timezone.utc)
+    headers: dict = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    # Answer revalidations without touching storage
+    if not_modified(request, etag) or not _modified_since(request, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    # Send a single range if one was asked for, unless If-Range is stale
+    byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range and request.headers.get("if-range", etag) not in (etag, headers["Last-Modified"]):
+        byte_range = None
+    status_code: int = 200
+    start, end = 0, size - 1
+    if byte_range:
+        status_code = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    # HEAD gets the headers only
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=content_type)
+
+    # Stream the bytes, from the event loop if the async storage client is running
+    async_container_client = get_async_container_client() if settings.use_azure_blob else None
+    if async_container_client is not None:
+        content = aiter_blob(path, start, end, async_container_client)
+    else:
+        content = iter_file(path, start, end, container_client)
+    return StreamingResponse(content, status_code=status_code, headers=headers, media_type=content_type)
@@ -0,0 +1,289 @@
+"""
+Contains helpers to store Property Image files locally or on Azure Blob
+"""
+
+# FastAPI imports
+from fastapi import HTTPException, UploadFile
+
+# Azure Blob imports
+from azure.storage.blob import ContainerClient, ContentSettings
+from azure.core.exceptions import ResourceNotFoundError
+
+# Settings import
+from ..config import settings
+
+# Starlette imports
+from starlette.concurrency import run_in_threadpool
+
+# Standard library imports
+import base64
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator, NamedTuple
+
+# Size of each chunk read from an upload
+CHUNK_SIZE: int = 1024 * 1024
+
+
+class UploadDigest(NamedTuple):
+    checksum: str
+    size: int
+
+
+class StoredEntry(NamedTuple):
+    path: str
+    modified: datetime
+
+
+def blob_name(checksum: str) -> str:
+    """
+    Get the storage name of the bytes with this checksum
+    """
+    return f"objects/{checksum[:2]}/{checksum}"
+
+
+def stored_path(name: str) -> str:
+    """
+    Get the path recorded in the database for a storage name
+    """
+    return os.path.abspath(f"blob/{name}") if not settings.use_azure_blob else name
+
+
+def digest_upload(upload_file: UploadFile) -> UploadDigest:
+    """
+    Hash an upload one chunk at a time and rewind it
+
+    Only one chunk is held in memory regardless of the file size. If the
+    upload goes over max_image_upload_bytes, a 413 is raised before
+    anything is stored.
+    """
+    hasher = hashlib.sha256()
+    max_size: int = settings.max_image_upload_bytes
+    size: int = 0
+    while chunk := upload_file.file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=413, detail=f"Image is larger than {max_size} bytes")
+        hasher.update(chunk)
+    upload_file.file.seek(0)
+    return UploadDigest(checksum=hasher.hexdigest(), size=size)
+
+
+def save_upload(upload_file: UploadFile, name: str, container_client: ContainerClient | None) -> None:
+    """
+    Stream an upload to storage one chunk at a time
+
+    Local files are written under a temporary name and moved into place
+    once complete, so a crash never leaves a partial file under the real
+    name. Azure uploads stage one block per chunk and commit the block
+    list at the end; blocks that are never committed are discarded.
+    """
+
+    # Use settings to track if we upload to azure blob or local
+    if not settings.use_azure_blob:
+        path: str = f"blob/{name}"
+        partial_path: str = f"{path}.{uuid.uuid4().hex}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(partial_path, "wb") as file_obj:
+                while chunk := upload_file.file.read(CHUNK_SIZE):
+                    file_obj.write(chunk)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    else:
+        blob_client = container_client.get_blob_client(name)
+        block_ids: list[str] = []
+        while chunk := upload_file.file.read(CHUNK_SIZE):
+            block_id: str = base64.b64encode(f"{len(block_ids):08d}".encode()).decode()
+            blob_client.stage_block(block_id=block_id, data=chunk, length=len(chunk))
+            block_ids.append(block_id)
+        blob_client.commit_block_list(block_ids, content_settings=ContentSettings(content_type=upload_file.content_type))
+
+
+async def save_local_stream(stream: AsyncIterator[bytes], name: str, max_size: int) -> None:
+    """
+    Write a request body to local storage as it arrives
+
+    Like save_upload, the file only appears under its real name once
+    complete. It never replaces a file already there: FileExistsError is
+    raised instead. Bodies over max_size are cut off with a 413.
+    """
+    path: str = f"blob/{name}"
+    partial_path: str = f"{path}.{uuid.uuid4().hex}.part"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    size: int = 0
+    try:
+        with open(partial_path, "xb") as file_obj:
+            async for chunk in stream:
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(status_code=413, detail=f"Upload is larger than the declared {max_size} bytes")
+                await run_in_threadpool(file_obj.write, chunk)
+
+        # Linking, unlike os.replace, fails if another upload got there first
+        os.link(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def copy_file(path: str, name: str, content_type: str, container_client: ContainerClient | None) -> str:
+    """
+    Copy a stored file to a new name one chunk at a time and return its path
+
+    Local copies appear under their real name only once complete, as in
+    save_upload. Azure copies are streamed from the source blob.
+    """
+    if not settings.use_azure_blob:
+        target: str = f"blob/{name}"
+        partial_path: str = f"{target}.{uuid.uuid4().hex}.part"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            shutil.copyfile(path, partial_path)
+            os.replace(partial_path, target)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+    else:
+        container_client.upload_blob(name=name, data=container_client.download_blob(path).chunks(), overwrite=True,
+                                     content_settings=ContentSettings(content_type=content_type))
+    return stored_path(name)
+
+
+def file_size(path: str, container_client: ContainerClient | None) -> int | None:
+    """
+    Get the size of a stored file, or None if it doesn't exist
+    """
+    if not settings.use_azure_blob:
+        return os.path.getsize(path) if os.path.exists(path) else None
+    else:
+        try:
+            return container_client.get_blob_client(path).get_blob_properties().size
+        except ResourceNotFoundError:
+            return None
+
+
+def digest_file(path: str, container_client: ContainerClient | None) -> UploadDigest:
+    """
+    Hash a stored file one chunk at a time
+    """
+    hasher = hashlib.sha256()
+    size: int = 0
+    if not settings.use_azure_blob:
+        with open(path, "rb") as file_obj:
+            while chunk := file_obj.read(CHUNK_SIZE):
+                hasher.update(chunk)
+                size += len(chunk)
+    else:
+        for chunk in container_client.download_blob(path).chunks():
+            hasher.update(chunk)
+            size += len(chunk)
+    return UploadDigest(checksum=hasher.hexdigest(), size=size)
+
+
+def read_file(path: str, container_client: ContainerClient | None) -> bytes:
+    """
+    Read a stored file back into memory
+    """
+    if not settings.use_azure_blob:
+        with open(path, "rb") as file_obj:
+            return file_obj.read()
+    else:
+        return container_client.download_blob(path).readall()
+
+
+def write_file(name: str, data: bytes, content_type: str, container_client: ContainerClient | None) -> str:
+    """
+    Store a small file held in memory and return its path
+    """
+    if not settings.use_azure_blob:
+        path: str = f"blob/{name}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file_obj:
+            file_obj.write(data)
+    else:
+        container_client.upload_blob(name=name, data=data, overwrite=True,
+                                     content_settings=ContentSettings(content_type=content_type))
+    return stored_path(name)
+
+
+def delete_file(path: str, container_client: ContainerClient | None) -> None:
+    """
+    Delete a stored file, ignoring files that are already gone
+    """
+    if not settings.use_azure_blob:
+        if os.path.exists(path):
+            os.remove(path)
+    else:
+        try:
+            container_client.delete_blob(blob=path)
+        except ResourceNotFoundError:
+            pass
+
+
+def delete_files(paths: list[str], container_client: ContainerClient | None) -> dict[str, str]:
+    """
+    Delete many stored files, returning the error for each one that failed
+
+    Files that are already gone count as deleted. Azure deletes go out in
+    batch requests of up to 256 blobs.
+    """
+    errors: dict[str, str] = {}
+    if not settings.use_azure_blob:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors[path] = str(e)
+    else:
+        for index in range(0, len(paths), 256):
+            batch: list[str] = paths[index:index + 256]
+            try:
+                responses = list(container_client.delete_blobs(*batch, raise_on_any_failure=False))
+            except Exception as e:
+                errors.update((path, str(e)) for path in batch)
+                continue
+            for path, response in zip(batch, responses):
+                if response.status_code not in (202, 404):
+                    errors[path] = f"{response.status_code} {response.reason}"
+    return errors
+
+
+def _walk_sorted(directory: str) -> Iterator[StoredEntry]:
+    """
+    Yield the files under a directory in byte order of their full paths
+
+    Siblings are sorted with directories keyed as "name/", which is where
+    every path inside them falls, so the output is globally sorted while
+    only one directory listing is held per level.
+    """
+    with os.scandir(directory) as scanner:
+        entries = sorted(scanner, key=lambda entry: entry.name + "/" if entry.is_dir(follow_symlinks=False) else entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk_sorted(entry.path)
+        else:
+            yield StoredEntry(path=entry.path, modified=datetime.fromtimestamp(entry.stat().st_mtime, timezone.utc))
+
+
+def list_files(container_client: ContainerClient | None) -> Iterator[StoredEntry]:
+    """
+    Yield every stored file in byte order of its path, one page at a time
+    """
+    if not settings.use_azure_blob:
+        root: str = os.path.abspath("blob")
+        if os.path.isdir(root):
+            yield from _walk_sorted(root)
+    else:
+        for blob in container_client.list_blobs(results_per_page=5000):
+            yield StoredEntry(path=blob.name, modified=blob.last_modified)
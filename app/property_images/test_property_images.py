@@ -0,0 +1,481 @@
+"""
+Test file for property images route
+"""
+
+# Pytest imports
+import pytest
+
+# FastAPI imports
+from fastapi import Response
+from fastapi.testclient import TestClient
+
+# Main app import
+from ..main import app
+
+# Settings import
+from ..config import settings
+
+# SQLModel imports
+from sqlmodel import Session, update
+
+# Reconciliation imports
+from .reconcile import reconcile
+
+# Deletion job imports
+from .deletions import process_blob_deletions
+
+# Derivative imports
+from . import derivatives
+
+# Database imports
+from ..database import engine
+
+# Model imports
+from .models import BlobDeletion, PropertyImage
+from ..accounts.models import AccountCreate
+from ..properties.models import PropertyCreate
+
+# Helper function imports from other tests
+from ..accounts.test_acccounts import create_account
+from ..properties.test_properties import create_property
+
+# Pillow imports
+from PIL import Image
+
+# Standard library imports
+import hashlib
+import io
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+# Create new client
+client: TestClient = TestClient(app)
+
+
+class TestPropertyImages:
+
+    ### SETUP FUNCTIONS ###
+
+    @pytest.fixture(autouse=True)
+    def setup_and_teardown(self):
+
+        # Delete everything in database
+        response: Response = client.delete("/api/")
+        assert response.status_code == 200
+
+        # Create an account and a property to attach images to
+        self.account = create_account(
+            AccountCreate(
+                fname="Maheer",
+                lname="Aeron",
+                email="maa368@cornell.edu"
+            ),
+            client_instance=client
+        )
+        self.property = create_property(
+            PropertyCreate(
+                owner_id=self.account['id'],
+                name="College Town Terrace",
+                address="715 E State St.",
+                description="This is a big apartment in Ithaca",
+                start_date="2022-11-30",
+                end_date="2023-11-30",
+                monthly_rent=2100,
+                num_bedrooms=1,
+                num_bathrooms=1
+            ),
+            client_instance=client
+        )
+
+        # Transfer control to a test
+        yield
+
+        # Clear everything in database
+        response: Response = client.delete("/api/")
+        assert response.status_code == 200
+
+    ### TEST HTTP GET FUNCTIONS ###
+
+    def test_get_property_image_content(self):
+
+        # Upload an image
+        content: bytes = os.urandom(100_000)
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", content, "image/png")}
+        )
+        url: str = response.json()["url"]
+
+        # The whole file comes back with cache headers, and isn't compressed again
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.content == content
+        assert "content-encoding" not in response.headers
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+        assert "immutable" in response.headers["cache-control"]
+        assert "last-modified" in response.headers
+
+        # Revalidating returns an empty 304
+        response = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        # Ranges return part of the file
+        response = client.get(url, headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == content[10:20]
+        assert response.headers["content-range"] == f"bytes 10-19/{len(content)}"
+        response = client.get(url, headers={"Range": "bytes=-5"})
+        assert response.content == content[-5:]
+        response = client.get(url, headers={"Range": f"bytes={len(content)}-"})
+        assert response.status_code == 416
+
+        # HEAD returns only the headers
+        response = client.head(url)
+        assert response.status_code == 200
+        assert response.headers["content-length"] == str(len(content))
+        assert response.content == b""
+
+        # Unknown derivatives are not found
+        response = client.get(url, params={"width": 123, "format": "webp"})
+        assert response.status_code == 404
+
+    ### TEST HTTP POST FUNCTIONS ###
+
+    def test_create_property_image(self):
+
+        # Upload an image spanning several chunks
+        content: bytes = os.urandom(3 * 1024 * 1024 + 17)
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", content, "image/png")}
+        )
+        assert response.status_code == 200
+        image: dict = response.json()
+
+        # Checksum and size are recorded, and the stored file is intact
+        assert image["checksum"] == hashlib.sha256(content).hexdigest()
+        assert image["size"] == len(content)
+        with open(image["path"], "rb") as file_obj:
+            assert file_obj.read() == content
+
+        # The image shows up in the list
+        response = client.get(f"/api/properties/{self.property['id']}/images")
+        assert [i["id"] for i in response.json()] == [image["id"]]
+
+    def test_create_property_image_derivatives(self):
+
+        # Upload a real image wider than the smallest derivative
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 400), "red").save(buffer, format="PNG")
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", buffer.getvalue(), "image/png")}
+        )
+        assert response.status_code == 200
+
+        # Derivatives are built after the response, never larger than the original
+        response = client.get(f"/api/properties/{self.property['id']}/images")
+        image_id: str = response.json()[0]["id"]
+        derivatives: list = response.json()[0]["derivatives"]
+        assert {d["width"] for d in derivatives} == {200, 640, 800}
+        assert "webp" in {d["format"] for d in derivatives}
+        for derivative in derivatives:
+            assert derivative["height"] == derivative["width"] // 2
+            response = client.get(derivative["url"])
+            assert response.headers["content-type"] == f"image/{derivative['format']}"
+            with Image.open(io.BytesIO(response.content)) as image:
+                assert image.size == (derivative["width"], derivative["height"])
+
+        # Deleting the image removes its derivatives
+        response = client.delete(f"/api/properties/{self.property['id']}/images/{image_id}")
+        assert response.status_code == 200
+        assert not any(os.path.exists(d["path"]) for d in derivatives)
+
+    def test_create_property_image_derivatives_race(self, monkeypatch):
+
+        # Have another run store the same derivatives while the first one is writing
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 400), "blue").save(buffer, format="PNG")
+        checksum: str = hashlib.sha256(buffer.getvalue()).hexdigest()
+        write_file = derivatives.write_file
+        raced: list[bool] = []
+
+        def write_file_after_race(*args):
+            if not raced:
+                raced.append(True)
+                derivatives.generate_derivatives(checksum)
+            return write_file(*args)
+
+        monkeypatch.setattr(derivatives, "write_file", write_file_after_race)
+        client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", buffer.getvalue(), "image/png")}
+        )
+
+        # The losing run's cleanup leaves the winner's files in place
+        image: dict = client.get(f"/api/properties/{self.property['id']}/images").json()[0]
+        assert raced and len(image["derivatives"]) > 0
+        for derivative in image["derivatives"]:
+            assert os.path.exists(derivative["path"])
+            assert client.get(derivative["url"]).status_code == 200
+
+    def test_create_property_image_too_large(self, monkeypatch):
+
+        # Lower the limit so a small upload goes over it
+        monkeypatch.setattr(settings, "max_image_upload_bytes", 1024)
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("big.png", os.urandom(4096), "image/png")}
+        )
+        assert response.status_code == 413
+
+        # Nothing is left behind on disk or in the database
+        assert not os.path.exists("blob/objects")
+        response = client.get(f"/api/properties/{self.property['id']}/images")
+        assert response.json() == []
+
+    def test_create_property_image_deduplicates(self):
+
+        # Upload the same bytes twice under the same name
+        images: list = []
+        for _ in range(2):
+            response = client.post(
+                f"/api/properties/{self.property['id']}/images",
+                files={"upload_file": ("front.png", b"same bytes", "image/png")}
+            )
+            assert response.status_code == 200
+            images.append(response.json())
+
+        # Both images point at one stored file
+        assert images[0]["id"] != images[1]["id"]
+        assert images[0]["path"] == images[1]["path"]
+        assert images[0]["filename"] == "front.png"
+        assert len(os.listdir(os.path.dirname(images[0]["path"]))) == 1
+
+        # The file stays until the last image using it is deleted
+        client.delete(f"/api/properties/{self.property['id']}/images/{images[0]['id']}")
+        assert os.path.exists(images[0]["path"])
+        client.delete(f"/api/properties/{self.property['id']}/images/{images[1]['id']}")
+        assert not os.path.exists(images[0]["path"])
+
+    def test_presigned_upload(self):
+
+        # Ask for an upload URL
+        content: bytes = b"presigned bytes"
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images/uploads",
+            json={"filename": "front.png", "size": len(content), "checksum": hashlib.sha256(content).hexdigest()}
+        )
+        assert response.status_code == 200
+        upload: dict = response.json()
+        image_id: str = upload["image"]["id"]
+        assert upload["image"]["status"] == "pending"
+
+        # Pending images are not listed, and can't be finalized before the upload
+        response = client.get(f"/api/properties/{self.property['id']}/images")
+        assert response.json() == []
+        response = client.post(f"/api/properties/{self.property['id']}/images/{image_id}/finalize")
+        assert response.status_code == 400
+
+        # A tampered URL is rejected
+        response = client.put(upload["upload_url"].replace("signature=", "signature=0"), data=content)
+        assert response.status_code == 403
+
+        # Upload to the signed URL once, then finalize
+        response = client.put(upload["upload_url"], data=content, headers=upload["upload_headers"])
+        assert response.status_code == 201
+        response = client.put(upload["upload_url"], data=b"other bytes", headers=upload["upload_headers"])
+        assert response.status_code == 409
+        response = client.post(f"/api/properties/{self.property['id']}/images/{image_id}/finalize")
+        assert response.status_code == 200
+
+        # The checksum is verified after the response and the image is ready
+        response = client.get(f"/api/properties/{self.property['id']}/images/{image_id}")
+        image: dict = response.json()
+        assert image["status"] == "ready"
+        assert image["checksum"] == hashlib.sha256(content).hexdigest()
+        with open(image["path"], "rb") as file_obj:
+            assert file_obj.read() == content
+
+        # The bytes moved to their content addressed name, out of the URL's reach
+        checksum: str = hashlib.sha256(content).hexdigest()
+        assert image["path"] == os.path.abspath(f"blob/objects/{checksum[:2]}/{checksum}")
+        assert not os.path.exists(upload["image"]["path"])
+        response = client.put(upload["upload_url"], data=b"other bytes", headers=upload["upload_headers"])
+        assert response.status_code == 409
+        with open(image["path"], "rb") as file_obj:
+            assert file_obj.read() == content
+
+    def test_presigned_upload_checksum_mismatch(self):
+
+        # Declare one checksum and upload other bytes of the same size
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images/uploads",
+            json={"filename": "front.png", "size": 5, "checksum": hashlib.sha256(b"hello").hexdigest()}
+        )
+        upload: dict = response.json()
+        client.put(upload["upload_url"], data=b"world")
+        client.post(f"/api/properties/{self.property['id']}/images/{upload['image']['id']}/finalize")
+
+        # The image fails and its bytes are dropped
+        response = client.get(f"/api/properties/{self.property['id']}/images/{upload['image']['id']}")
+        assert response.json()["status"] == "failed"
+        assert not os.path.exists(upload["image"]["path"])
+
+    ### TEST HTTP DELETE FUNCTIONS ###
+
+    def test_delete_property_image(self):
+
+        # Upload and then delete an image
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", b"not really a png", "image/png")}
+        )
+        image: dict = response.json()
+        response = client.delete(f"/api/properties/{self.property['id']}/images/{image['id']}")
+        assert response.status_code == 200
+
+        # The file is gone
+        assert not os.path.exists(image["path"])
+
+    def test_blob_deletions_skip_files_in_use(self):
+
+        # Queue the file of an image that still uses it
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", b"bytes in use", "image/png")}
+        )
+        image: dict = response.json()
+        with Session(engine) as session:
+            session.add(BlobDeletion(path=image["path"], checksum=image["checksum"]))
+            session.commit()
+
+        # The deletion is dropped and the file stays
+        assert process_blob_deletions() == 1
+        assert os.path.exists(image["path"])
+        assert client.get(image["url"]).status_code == 200
+
+    def test_delete_property_image_retries_failed_deletes(self):
+
+        # Upload an image, then swap its file for something that can't be removed
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", b"stuck bytes", "image/png")}
+        )
+        image: dict = response.json()
+        os.remove(image["path"])
+        os.makedirs(image["path"])
+
+        # The delete still succeeds and the file stays queued for a retry
+        response = client.delete(f"/api/properties/{self.property['id']}/images/{image['id']}")
+        assert response.status_code == 200
+        deletions: dict = client.get("/api/_internal/storage").json()["deletions"]
+        assert deletions == {"pending": 1, "failing": 1}
+        os.rmdir(image["path"])
+
+    def test_delete_property_releases_images(self):
+
+        # Use the same bytes on a second property
+        other_property: dict = create_property(
+            PropertyCreate(
+                owner_id=self.account['id'],
+                name="Lux Apartments",
+                address="123 place",
+                description="This is some complex in college town",
+                start_date="2022-11-30",
+                end_date="2023-11-30",
+                monthly_rent=1500,
+                num_bedrooms=2,
+                num_bathrooms=2
+            ),
+            client_instance=client
+        )
+        for property in (self.property, other_property):
+            response = client.post(
+                f"/api/properties/{property['id']}/images",
+                files={"upload_file": ("front.png", b"shared bytes", "image/png")}
+            )
+        path: str = response.json()["path"]
+
+        # Deleting one property keeps the file for the other
+        response = client.delete(f"/api/properties/{self.property['id']}")
+        assert response.status_code == 200
+        assert os.path.exists(path)
+
+        # Deleting the account deletes the other property and the file
+        response = client.delete(f"/api/accounts/{self.account['id']}")
+        assert response.status_code == 200
+        assert not os.path.exists(path)
+
+    ### TEST RECONCILIATION ###
+
+    def test_reconcile_repairs_storage(self):
+
+        # Upload an image with derivatives, then lose one derivative file
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 400), "red").save(buffer, format="PNG")
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images",
+            files={"upload_file": ("front.png", buffer.getvalue(), "image/png")}
+        )
+        image: dict = client.get(f"/api/properties/{self.property['id']}/images").json()[0]
+        lost: dict = image["derivatives"][0]
+        os.remove(lost["path"])
+
+        # Leave an old stray file and one that may still be uploading
+        stray: str = os.path.abspath(f"blob/objects/zz/{'0' * 64}")
+        fresh: str = os.path.abspath(f"blob/uploads/{'1' * 32}")
+        for path in (stray, fresh):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file_obj:
+                file_obj.write(b"stray bytes")
+        os.utime(stray, (time.time() - 7200, time.time() - 7200))
+
+        # Reporting finds both problems and changes nothing
+        out = io.StringIO()
+        assert reconcile(out=out) == {"orphan": 1, "missing derivative": 1}
+        assert f"orphan\t{stray}" in out.getvalue()
+        assert os.path.exists(stray)
+
+        # Repairing deletes the old stray file and the lost derivative's row only
+        reconcile(repair=True, out=io.StringIO())
+        assert not os.path.exists(stray)
+        assert os.path.exists(fresh)
+        image = client.get(f"/api/properties/{self.property['id']}/images").json()[0]
+        assert lost["path"] not in {d["path"] for d in image["derivatives"]}
+        assert client.get(image["url"]).content == buffer.getvalue()
+        assert reconcile(out=io.StringIO()) == {}
+
+    def test_reconcile_removes_expired_uploads(self):
+
+        # Start an upload, send its bytes but never finalize it
+        content: bytes = b"abandoned bytes"
+        response = client.post(
+            f"/api/properties/{self.property['id']}/images/uploads",
+            json={"filename": "front.png", "size": len(content), "checksum": hashlib.sha256(content).hexdigest()}
+        )
+        upload: dict = response.json()
+        client.put(upload["upload_url"], data=content, headers=upload["upload_headers"])
+
+        # While its URL is valid the upload is left alone
+        assert reconcile(repair=True, grace=timedelta(0), out=io.StringIO()) == {}
+        assert os.path.exists(upload["image"]["path"])
+
+        # Once it has expired, its row and staged bytes are removed
+        with Session(engine) as session:
+            session.execute(update(PropertyImage)
+                            .where(PropertyImage.id == uuid.UUID(upload["image"]["id"]))
+                            .values(upload_expires=datetime.utcnow() - timedelta(minutes=1)))
+            session.commit()
+        out = io.StringIO()
+        assert reconcile(repair=True, grace=timedelta(0), out=out) == {"expired upload": 1}
+        assert f"expired\t{upload['image']['path']}" in out.getvalue()
+        assert not os.path.exists(upload["image"]["path"])
+        response = client.get(f"/api/properties/{self.property['id']}/images/{upload['image']['id']}")
+        assert response.status_code == 404
+        assert reconcile(out=io.StringIO()) == {}
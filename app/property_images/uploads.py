@@ -0,0 +1,223 @@
+"""
+Contains helpers for uploads that go straight to storage through pre-signed URLs
+
+The API hands out a short lived URL for a staging name, the client PUTs
+the bytes there, and a finalize call confirms it. On Azure the URL is a
+create-only SAS for the blob. On local storage it is a signed URL for the
+upload route, which checks the signature instead of a session. Neither
+can replace bytes once they are uploaded, and verified bytes are copied
+to their content addressed name, so the URL never reaches a shared blob.
+"""
+
+# SQLModel imports
+from sqlmodel import Session, select
+
+# Azure Blob imports
+from azure.storage.blob import ContainerClient, BlobSasPermissions, generate_blob_sas
+
+# Model imports
+from .models import ImageBlob, ImageStatus, PropertyImage, PropertyImageRead
+
+# Storage imports
+from .storage import blob_name, stored_path, copy_file, digest_file
+
+# Blob reference counting imports
+from .blobs import acquire_blob, enqueue_deletion
+
+# Deletion job imports
+from .deletions import process_blob_deletions
+
+# Derivative imports
+from .derivatives import generate_derivatives
+
+# Database imports
+from ..database import engine
+
+# Dependency imports
+from ..dependencies import get_container_client
+
+# Cache imports
+from ..cache import cache
+
+# Settings import
+from ..config import settings
+
+# Standard library imports
+import hashlib
+import hmac
+import logging
+import mimetypes
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTarget(NamedTuple):
+    url: str
+    headers: dict[str, str]
+    expires: datetime
+
+
+def upload_name(image_id: uuid.UUID) -> str:
+    """
+    Get the staging name a pending image is uploaded to
+    """
+    return f"uploads/{image_id}"
+
+
+def upload_content_type(filename: str) -> str | None:
+    """
+    Get the content type of an upload from its file name
+    """
+    return mimetypes.guess_type(filename)[0]
+
+
+def upload_expiry() -> datetime:
+    """
+    Get when an upload URL handed out now expires
+    """
+    return datetime.now(timezone.utc) + timedelta(seconds=settings.upload_url_ttl_seconds)
+
+
+def _signing_key() -> bytes:
+    """
+    Get the key local upload URLs are signed with
+
+    Derived from the database credentials when upload_signing_key isn't
+    set, so URLs signed by one worker verify on every other one.
+    """
+    if settings.upload_signing_key:
+        return settings.upload_signing_key.encode()
+    secret: str = f"{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}/{settings.postgres_db}"
+    return hmac.new(b"upload-signing-key", secret.encode(), hashlib.sha256).digest()
+
+
+def sign_upload(image_id: uuid.UUID, size: int, expires: int) -> str:
+    """
+    Sign a local upload URL for one image, size and expiry time
+    """
+    message: bytes = f"{image_id}:{size}:{expires}".encode()
+    return hmac.new(_signing_key(), message, hashlib.sha256).hexdigest()
+
+
+def check_upload_signature(image_id: uuid.UUID, size: int, expires: int, signature: str) -> bool:
+    """
+    Check a local upload URL's signature and expiry time
+    """
+    if expires < datetime.now(timezone.utc).timestamp():
+        return False
+    return hmac.compare_digest(sign_upload(image_id, size, expires), signature)
+
+
+def create_upload_target(
+    image: PropertyImageRead,
+    content_type: str,
+    local_url: str,
+    expires: datetime,
+    container_client: ContainerClient | None,
+) -> UploadTarget:
+    """
+    Build the pre-signed URL a client PUTs a pending image to, valid until expires
+
+    local_url is the URL of the local upload route for this image, and is
+    only used when not on Azure.
+    """
+
+    if not settings.use_azure_blob:
+        timestamp: int = int(expires.timestamp())
+        signature: str = sign_upload(image.id, image.size, timestamp)
+        return UploadTarget(
+            url=f"{local_url}?size={image.size}&expires={timestamp}&signature={signature}",
+            headers={"Content-Type": content_type},
+            expires=expires,
+        )
+
+    else:
+        name: str = upload_name(image.id)
+        sas: str = generate_blob_sas(
+            account_name=container_client.account_name,
+            container_name=container_client.container_name,
+            blob_name=name,
+            account_key=container_client.credential.account_key,
+            permission=BlobSasPermissions(create=True),
+            expiry=expires,
+        )
+        return UploadTarget(
+            url=f"{container_client.get_blob_client(name).url}?{sas}",
+            headers={"x-ms-blob-type": "BlockBlob", "Content-Type": content_type},
+            expires=expires,
+        )
+
+
+def is_pending_upload(property_id: uuid.UUID, image_id: uuid.UUID) -> bool:
+    """
+    Check an image of this property is still waiting for its upload
+    """
+    with Session(engine) as session:
+        image = session.get(PropertyImage, image_id)
+        return image is not None and image.property_id == property_id and image.status == ImageStatus.pending.value
+
+
+def verify_upload(image_id: uuid.UUID) -> None:
+    """
+    Check a finalized upload's checksum and turn it into a ready image
+
+    Meant to run as a background task after finalize. The bytes are hashed
+    where they were uploaded. If they match what the client declared, the
+    image takes a reference on the blob with that checksum, and new bytes
+    are copied to the blob's name. Otherwise the image is marked failed.
+    Either way the staged bytes are queued for deletion, so the upload URL
+    can never reach a blob other images share.
+    """
+    container_client = get_container_client()
+
+    with Session(engine) as session:
+
+        # The image may have been deleted, or already verified, before the task got to run
+        image = session.get(PropertyImage, image_id)
+        if not image or image.status != ImageStatus.pending.value:
+            return
+        staged_path: str = image.path
+
+        # Hash what the client actually uploaded
+        try:
+            digest = digest_file(staged_path, container_client)
+        except Exception:
+            logger.exception("Could not read upload for property image %s", image_id)
+            return
+
+        # Reject bytes that don't match the declaration
+        is_new_blob: bool = False
+        if digest.checksum != image.expected_checksum or digest.size != image.size:
+            image.status = ImageStatus.failed.value
+        else:
+
+            # Reference the blob, storing a copy of the bytes if nobody has them yet
+            content_type: str = upload_content_type(image.filename) or "application/octet-stream"
+            name: str = blob_name(digest.checksum)
+            is_new_blob = acquire_blob(session, digest.checksum, stored_path(name), digest.size, content_type)
+            if is_new_blob:
+                copy_file(staged_path, name, content_type, container_client)
+            image.path = session.exec(select(ImageBlob.path).where(ImageBlob.checksum == digest.checksum)).one()
+            image.checksum = digest.checksum
+            image.status = ImageStatus.ready.value
+
+        # Drop the staged bytes once the image no longer points at them
+        enqueue_deletion(session, staged_path)
+
+        # Commit to DBMS
+        property_id: uuid.UUID = image.property_id
+        session.add(image)
+        session.commit()
+
+    # Delete the staged bytes now rather than waiting for the next request
+    process_blob_deletions()
+
+    # Drop cached image lists
+    cache.invalidate(f"property_images:{property_id}")
+
+    # Build the resized copies of new blobs
+    if is_new_blob:
+        generate_derivatives(digest.checksum)
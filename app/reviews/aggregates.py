@@ -0,0 +1,83 @@
+"""
+Contains helpers to keep the rating aggregates on Property in sync with Reviews
+"""
+
+# SQLModel imports
+from sqlmodel import Session, update
+
+# Model imports
+from ..properties.models import Property
+
+# Standard library imports
+import uuid
+from collections import defaultdict
+from typing import Iterable
+
+
+def update_rating_aggregates(
+    session: Session,
+    property_id: uuid.UUID,
+    *,
+    added: int | None = None,
+    removed: int | None = None,
+) -> None:
+    """
+    Adjust a property's review count, rating sum and histogram in place
+
+    Pass added for a new rating, removed for a deleted one, or both when a
+    rating changes. The update is a single atomic UPDATE, so concurrent
+    reviews on the same property cannot lose increments. It is not
+    committed, so it lands in the same transaction as the review write.
+    """
+
+    # Nothing changes if a rating is replaced with itself
+    if added == removed:
+        return
+
+    apply_rating_changes(session, [(property_id, added, removed)])
+
+
+def apply_rating_changes(
+    session: Session,
+    changes: Iterable[tuple[uuid.UUID, int | None, int | None]],
+) -> None:
+    """
+    Apply many (property_id, added, removed) rating changes at once
+
+    The changes are summed per property first, so a bulk write issues one
+    UPDATE per property rather than one per review. Properties are updated
+    in id order, so concurrent bulk writes lock them in the same order.
+    """
+
+    # Sum the deltas of each property
+    deltas: dict[uuid.UUID, list[int]] = defaultdict(lambda: [0, 0] + [0] * 6)
+    for property_id, added, removed in changes:
+        delta: list[int] = deltas[property_id]
+        if added is not None:
+            delta[0] += 1
+            delta[1] += added
+            delta[2 + added] += 1
+        if removed is not None:
+            delta[0] -= 1
+            delta[1] -= removed
+            delta[2 + removed] -= 1
+
+    for property_id in sorted(deltas):
+        count_delta, sum_delta, *histogram_delta = deltas[property_id]
+
+        # Build the column deltas
+        values: dict = {}
+        for rating, change in enumerate(histogram_delta):
+            if change:
+                values[Property.rating_histogram[rating]] = Property.rating_histogram[rating] + change
+        if not values:
+            continue
+        values[Property.review_count] = Property.review_count + count_delta
+        values[Property.rating_sum] = Property.rating_sum + sum_delta
+        values[Property.version] = Property.version + 1
+
+        # Apply them to the property row
+        session.exec(update(Property)
+                     .where(Property.id == property_id)
+                     .values(values)
+                     .execution_options(synchronize_session=False))
@@ -0,0 +1,80 @@
+"""
+Contains the writer behind the bulk review route
+"""
+
+# SQLModel imports
+from sqlmodel import Session, select
+
+# SQLAlchemy imports
+from sqlalchemy import Boolean, literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+# Model imports
+from .models import Review, ReviewBulkItem
+
+# Aggregate imports
+from .aggregates import apply_rating_changes
+
+# Standard library imports
+import uuid
+
+
+def write_reviews(
+    session: Session,
+    items: list[tuple[int, ReviewBulkItem]],
+    tags: set[str],
+    *,
+    upsert: bool = False,
+) -> list[tuple[int, uuid.UUID, bool]]:
+    """
+    Insert a chunk of reviews with one INSERT ... RETURNING
+
+    With upsert, items whose id already exists replace that review. Those
+    reviews are locked first so their old ratings can be taken off the
+    property aggregates.
+    """
+
+    # Give every row an id, so returned rows can be matched to items
+    rows: list[dict] = [
+        {**item.dict(exclude={"id"}), "id": item.id or uuid.uuid4()}
+        for _, item in items
+    ]
+    index_of: dict[uuid.UUID, int] = {row["id"]: index for row, (index, _) in zip(rows, items)}
+
+    # Remember the reviews about to be replaced
+    replaced: dict = {}
+    statement = insert(Review).values(rows)
+    if upsert:
+        replaced = {row.id: row for row in session.exec(
+            select(Review.id, Review.property_id, Review.rating)
+            .where(Review.id.in_([row["id"] for row in rows]))
+            .with_for_update()
+        ).all()}
+        statement = statement.on_conflict_do_update(
+            index_elements=[Review.id],
+            set_={
+                "property_id": statement.excluded.property_id,
+                "poster_id": statement.excluded.poster_id,
+                "rating": statement.excluded.rating,
+                "content": statement.excluded.content,
+                "version": Review.version + 1,
+            },
+        )
+
+    # Write the rows, telling inserted rows from replaced ones by xmax
+    returned = session.execute(statement.returning(
+        Review.id, Review.property_id, Review.rating, literal_column("xmax = 0", Boolean).label("created")
+    )).all()
+
+    # Move the ratings on the properties
+    changes: list[tuple] = []
+    for row in returned:
+        changes.append((row.property_id, row.rating, None))
+        tags.update((f"property:{row.property_id}", f"property_reviews:{row.property_id}"))
+        if not row.created:
+            old = replaced[row.id]
+            changes.append((old.property_id, None, old.rating))
+            tags.update((f"property:{old.property_id}", f"property_reviews:{old.property_id}"))
+    apply_rating_changes(session, changes)
+
+    return [(index_of[row.id], row.id, row.created) for row in returned]
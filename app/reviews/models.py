@@ -3,7 +3,10 @@ Contains routes to access Reviews
 """
 
 # SQL Model imports
-from sqlmodel import Field, SQLModel, Relationship, UniqueConstraint
+from sqlmodel import Field, SQLModel, Relationship, UniqueConstraint, Index
+
+# SQLAlchemy imports
+from sqlalchemy import CheckConstraint, Column, Integer, text
 
 # Standard library imports
 import uuid
@@ -11,14 +14,24 @@ from datetime import date
 from typing import Optional
 
 
+# Row version, bumped by the ORM on every update and used for ETags
+review_version = Column("version", Integer, nullable=False, server_default="1")
+
+
 class Review(SQLModel, table=True):
 
     # Table arguments
     __tablename__ = "reviews"
 
-    # __table_args__ = (
-    #     UniqueConstraint("property_id", "poster_id", name="property_poster_constraint"),
-    # )
+    __mapper_args__ = {"version_id_col": review_version}
+
+    __table_args__ = (
+        # UniqueConstraint("property_id", "poster_id", name="property_poster_constraint"),
+        Index("ix_reviews_created_id", "created", "id"),
+        Index("ix_reviews_property_id_created_id", "property_id", "created", "id"),
+        Index("ix_reviews_poster_id_created_id", "poster_id", "created", "id"),
+        CheckConstraint("rating BETWEEN 0 AND 5", name="ck_reviews_rating_range"),
+    )
 
     # Main Fields
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
@@ -26,7 +39,8 @@ class Review(SQLModel, table=True):
     poster_id: uuid.UUID = Field(foreign_key="accounts.id")
     rating: int = Field(default=0)
     content: str = Field(default="")
-    created: date = Field(default=date.today())
+    created: date | None = Field(default=None, nullable=False, sa_column_kwargs={"server_default": text("CURRENT_DATE")})
+    version: int = Field(default=1, sa_column=review_version)
 
     # Relationships
     property: Optional["Property"] = Relationship()
@@ -34,9 +48,12 @@ class Review(SQLModel, table=True):
 class ReviewCreate(SQLModel):
     property_id: uuid.UUID
     poster_id: uuid.UUID
-    rating: int
+    rating: int = Field(ge=0, le=5)
     content: str
 
+class ReviewBulkItem(ReviewCreate):
+    id: uuid.UUID | None = None
+
 class ReviewRead(SQLModel):
     id: uuid.UUID
     property_id: uuid.UUID
@@ -45,6 +62,10 @@ class ReviewRead(SQLModel):
     content: str
     created: date
 
+class ReviewBatchRead(SQLModel):
+    items: list[ReviewRead]
+    missing: list[uuid.UUID]
+
 class ReviewUpdate(SQLModel):
-    rating: int | None = None
+    rating: int | None = Field(default=None, ge=0, le=5)
     content: str | None = None
\ No newline at end of file
@@ -7,59 +7,171 @@ TODO:
 """
 
 # FastAPI imports
-from fastapi import APIRouter, Depends, Query, Path, Body, HTTPException
+from fastapi import APIRouter, Depends, Query, Path, Body, HTTPException, Request, Response
 
 # SQLModel imports
 from sqlmodel import Session, select
 
 # Model imports
-from .models import Review, ReviewCreate, ReviewRead, ReviewUpdate
+from .models import Review, ReviewBatchRead, ReviewBulkItem, ReviewCreate, ReviewRead, ReviewUpdate
+from ..properties.models import Property
+from ..accounts.models import Account
+
+# Aggregate imports
+from .aggregates import update_rating_aggregates
+
+# Bulk write imports
+from .bulk import write_reviews
+from ..bulk import BulkResult, read_bulk_body, run_bulk
 
 # Dependency imports
-from ..dependencies import get_session
+from ..dependencies import get_session, get_cache
+
+# Cache imports
+from ..cache import Cache
+
+# Routing imports
+from ..routing import AppRoute
+
+# Pagination imports
+from ..pagination import paginate, NEXT_CURSOR_HEADER
+
+# Batch get imports
+from ..batch import BatchGetRequest, get_by_ids, parse_ids
+
+# Conditional request imports
+from ..conditional import make_etag, make_list_etag, not_modified, not_modified_response, check_if_match
+
+# Write imports
+from ..writes import insert_returning, update_returning
+
+# Serialization imports
+from ..serialization import field_columns, json_response, parse_fields, row_names
 
 # Standard library imports
+import functools
 import uuid
+from typing import Any, Iterator
 
 
 # Initializing router
-router = APIRouter(prefix="/reviews")
+router = APIRouter(prefix="/reviews", route_class=AppRoute)
 
 
 ### HTTP GET FUNCTIONS ###
 
-@router.get("/", response_model=list[Review])
+@router.get("/", response_model=list[ReviewRead])
 def get_all_reviews(
     *,
     property_id: uuid.UUID | None = Query(default=None),
     session: Session = Depends(get_session),
-    offset: int = Query(default=0),
+    cache: Cache = Depends(get_cache),
+    request: Request,
+    response: Response,
+    cursor: str | None = Query(default=None),
+    offset: int | None = Query(default=None),
     limit: int = Query(default=100, lte=100),
+    fields: list[str] = Query(default=[]),
 ):
-    # Get reviews with filter on property id
-    reviews = session.exec(select(Review)
-                           .where((Review.property_id == property_id) if property_id else (Review is not None))
-                           .offset(offset)
-                           .limit(limit))\
-        .all()
+    """
+    Get a page of reviews
+
+    fields=id,rating returns only those fields of each review.
+    """
+    projection: list[str] | None = parse_fields(fields, Review, ReviewRead)
+    names: list[str] = projection or row_names(Review, ReviewRead)
+
+    def load_reviews() -> dict:
+
+        # Get page of reviews with filter on property id, as column tuples
+        # with only the fields asked for
+        reviews = paginate(session, select(*field_columns(Review, ReviewRead, projection, Review.created))
+                           .where((Review.property_id == property_id) if property_id else (Review is not None)),
+                           response=response,
+                           sort_column=Review.created,
+                           id_column=Review.id,
+                           cursor=cursor,
+                           offset=offset,
+                           limit=limit)
+
+        return {
+            "items": [dict(zip(names, review)) for review in reviews],
+            "next_cursor": response.headers.get(NEXT_CURSOR_HEADER),
+            "etag": make_list_etag(reviews, response.headers.get(NEXT_CURSOR_HEADER), *(projection or [])),
+        }
+
+    # Only reviews of a single property are cached, since unfiltered
+    # lists would be invalidated by every review write
+    if property_id:
+        page: dict = cache.get_or_load("property_reviews",
+                                       f"{property_id}:{cursor}:{offset}:{limit}:{','.join(projection or [])}",
+                                       [f"property_reviews:{property_id}"], load_reviews)
+    else:
+        page = load_reviews()
+
+    # Skip the body if the client already has this page
+    if not_modified(request, page["etag"]):
+        return not_modified_response(page["etag"])
+    response.headers["ETag"] = page["etag"]
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
 
     # Return list of reviews
-    return reviews
+    return json_response(page["items"], response)
+
+
+@router.get("/batch", response_model=ReviewBatchRead)
+def get_reviews_by_ids(
+    *,
+    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    ids: str = Query()
+):
+    """
+    Get several reviews by a comma separated list of ids
+
+    Reviews come back in the order asked for. Ids with no review
+    are listed under missing instead of failing the request.
+    """
+
+    # Get the reviews in one query
+    reviews, missing = get_by_ids(session, Review, parse_ids(ids))
 
+    # Skip the body if the client already has these versions
+    etag: str = make_list_etag(reviews, *missing)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
 
-@router.get("/{review_id}", response_model=Review)
+    # Return the reviews found and the ids that weren't
+    return ReviewBatchRead(items=reviews, missing=missing)
+
+
+@router.get("/{review_id}", response_model=ReviewRead)
 def get_review_by_id(
     *,
     session: Session = Depends(get_session),
-    review_id: uuid.UUID = Path()
+    request: Request,
+    response: Response,
+    review_id: uuid.UUID = Path(),
+    fields: list[str] = Query(default=[])
 ):
-    # Get review and check if it exists
-    review = session.get(Review, review_id)
+    # Get review, with only the fields asked for, and check if it exists
+    projection: list[str] | None = parse_fields(fields, Review, ReviewRead)
+    review = session.execute(select(*field_columns(Review, ReviewRead, projection))
+                             .where(Review.id == review_id)).one_or_none()
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
 
+    # Skip the body if the client already has this version
+    etag: str = make_etag(review.id, review.version, *(projection or []))
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+
     # Return back review
-    return review
+    return json_response(dict(zip(projection or row_names(Review, ReviewRead), review)), response)
 
 
 ### HTTP POST FUNCTIONS ###
@@ -68,22 +180,66 @@ def get_review_by_id(
 def create_review(
     *,
     session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
     review: ReviewCreate = Body()
 ):
     """
     TODO: Need to catch when property and poster id is invalid
     """
 
-    # Create review by using from_orm function
-    db_review = Review.from_orm(review)
+    # Insert the review and read it back in one statement
+    row = insert_returning(session, Review, ReviewRead, review.dict())
+
+    # Count the rating on the property
+    update_rating_aggregates(session, row.property_id, added=row.rating)
 
     # Commit to DBMS
-    session.add(db_review)
     session.commit()
-    session.refresh(db_review)
+
+    # Drop cached reviews and aggregates of the property
+    cache.invalidate(f"property:{row.property_id}", f"property_reviews:{row.property_id}")
 
     # Return back review
-    return db_review
+    return ReviewRead.parse_obj(row._mapping)
+
+
+@router.post("/bulk", response_model=BulkResult)
+def create_reviews_bulk(
+    *,
+    session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
+    body: Iterator[Any] = Depends(read_bulk_body),
+    upsert: bool = Query(default=False)
+):
+    """
+    Create many reviews from a JSON array or NDJSON body
+
+    With upsert, items carrying the id of an existing review replace it.
+    The response lists the id given to each item (null where it failed)
+    and the errors by item index.
+    """
+
+    # Write the reviews a chunk at a time
+    return run_bulk(session, cache, body, ReviewBulkItem,
+                    functools.partial(write_reviews, upsert=upsert),
+                    references={"property_id": Property.id, "poster_id": Account.id})
+
+
+@router.post("/batch", response_model=ReviewBatchRead)
+def get_reviews_by_ids_post(
+    *,
+    session: Session = Depends(get_session),
+    batch: BatchGetRequest = Body()
+):
+    """
+    Get several reviews by ids sent in the body, for lists too long for a URL
+    """
+
+    # Get the reviews in one query
+    reviews, missing = get_by_ids(session, Review, batch.ids)
+
+    # Return the reviews found and the ids that weren't
+    return ReviewBatchRead(items=reviews, missing=missing)
 
 
 ### HTTP PATCH FUNCTIONS ###
@@ -92,6 +248,9 @@ def create_review(
 def update_review(
     *,
     session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
+    request: Request,
+    response: Response,
     review_id: uuid.UUID = Path(),
     review: ReviewUpdate = Body()
 ):
@@ -101,18 +260,25 @@ def update_review(
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
 
-    # Update review data
-    review_data = review.dict(exclude_unset=True)
-    for key, value in review_data.items():
-        setattr(db_review, key, value)
+    # Check the client is editing the latest version
+    check_if_match(request, make_etag(db_review.id, db_review.version))
+
+    # Update review data and read it back in one statement
+    row = update_returning(session, Review, ReviewRead, review_id, db_review.version,
+                           review.dict(exclude_unset=True))
+
+    # Move the rating on the property
+    update_rating_aggregates(session, row.property_id, added=row.rating, removed=db_review.rating)
 
     # Commit to DBMS
-    session.add(db_review)
     session.commit()
-    session.refresh(db_review)
 
-    # Return back review
-    return db_review
+    # Drop cached reviews and aggregates of the property
+    cache.invalidate(f"property:{row.property_id}", f"property_reviews:{row.property_id}")
+
+    # Return back review with its new version
+    response.headers["ETag"] = make_etag(row.id, row.version)
+    return ReviewRead.parse_obj(row._mapping)
 
 
 ### HTTP DELETE FUNCTIONS ###
@@ -121,6 +287,8 @@ def update_review(
 def delete_review(
     *,
     session: Session = Depends(get_session),
+    cache: Cache = Depends(get_cache),
+    request: Request,
     review_id: uuid.UUID = Path()
 ):
 
@@ -129,9 +297,18 @@ def delete_review(
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
 
+    # Check the client is deleting the latest version
+    check_if_match(request, make_etag(review.id, review.version))
+
+    # Remove the rating from the property
+    update_rating_aggregates(session, review.property_id, removed=review.rating)
+
     # Commit to DBMS
     session.delete(review)
     session.commit()
 
+    # Drop cached reviews and aggregates of the property
+    cache.invalidate(f"property:{review.property_id}", f"property_reviews:{review.property_id}")
+
     # Return back an OK response
     return {"ok": True}
@@ -15,6 +15,9 @@ from sqlalchemy.exc import IntegrityError
 # Main app import
 from ..main import app
 
+# Settings import
+from ..config import settings
+
 # Model imports
 from ..accounts.models import AccountCreate
 from ..properties.models import PropertyCreate
@@ -24,6 +27,9 @@ from ..reviews.models import ReviewCreate
 from ..accounts.test_acccounts import create_account
 from ..properties.test_properties import create_property
 
+# Standard library imports
+import json
+
 # Create new client
 client: TestClient = TestClient(app)
 
@@ -224,6 +230,114 @@ class TestProperties:
             # Ensure the error is not null
             assert e is not None
 
+    def test_rating_aggregates(self):
+
+        # Add a second review on property1
+        review2: dict = create_review(
+            ReviewCreate(
+                property_id=self.property1["id"],
+                poster_id=self.account2["id"],
+                rating=2,
+                content="Not great"
+            ),
+            client_instance=client
+        )
+
+        # Property should count both reviews
+        fetched_property: dict = client.get(f"/api/properties/{self.property1['id']}").json()
+        assert fetched_property["review_count"] == 2
+        assert fetched_property["rating_sum"] == 7
+        assert fetched_property["rating_histogram"] == [0, 0, 1, 0, 0, 1]
+        assert fetched_property["average_rating"] == 3.5
+
+        # Change a rating and check the histogram moved
+        response = client.patch(f"/api/reviews/{review2['id']}", json={"rating": 4})
+        assert response.status_code == 200
+        fetched_property = client.get(f"/api/properties/{self.property1['id']}").json()
+        assert fetched_property["rating_sum"] == 9
+        assert fetched_property["rating_histogram"] == [0, 0, 0, 0, 1, 1]
+
+        # Delete a review and check it is no longer counted
+        response = client.delete(f"/api/reviews/{self.review1['id']}")
+        assert response.status_code == 200
+        fetched_property = client.get(f"/api/properties/{self.property1['id']}").json()
+        assert fetched_property["review_count"] == 1
+        assert fetched_property["rating_sum"] == 4
+        assert fetched_property["rating_histogram"] == [0, 0, 0, 0, 1, 0]
+        assert fetched_property["average_rating"] == 4
+
+        # Ratings outside of 0 to 5 are rejected
+        response = client.patch(f"/api/reviews/{review2['id']}", json={"rating": 6})
+        assert response.status_code == 422
+
+    def test_create_reviews_bulk(self, monkeypatch):
+
+        # Send NDJSON spanning several chunks, with a few bad lines
+        monkeypatch.setattr(settings, "bulk_chunk_size", 2)
+        lines: list[str] = [
+            json.dumps({"property_id": self.property2["id"], "poster_id": self.account2["id"], "rating": 4, "content": "Good"}),
+            "{not json",
+            json.dumps({"property_id": self.property2["id"], "poster_id": self.account2["id"], "rating": 9, "content": "Too high"}),
+            json.dumps({"property_id": self.account1["id"], "poster_id": self.account2["id"], "rating": 1, "content": "No property"}),
+            json.dumps({"property_id": self.property2["id"], "poster_id": self.account3["id"], "rating": 2, "content": "Bad"}),
+        ]
+        response = client.post("/api/reviews/bulk", data="\n".join(lines),
+                               headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200
+        result: dict = response.json()
+        assert (result["created"], result["updated"]) == (2, 0)
+        assert [error["index"] for error in result["errors"]] == [1, 2, 3]
+        assert result["ids"][1:4] == [None, None, None]
+
+        # The reviews and their ratings are there
+        response = client.get("/api/reviews/", params={"property_id": self.property2["id"]})
+        assert {review["id"] for review in response.json()} == {result["ids"][0], result["ids"][4]}
+        fetched_property: dict = client.get(f"/api/properties/{self.property2['id']}").json()
+        assert fetched_property["rating_histogram"] == [0, 0, 1, 0, 1, 0]
+
+        # Upserting moves an existing review, and its rating, to another property
+        response = client.post("/api/reviews/bulk", params={"upsert": True}, json=[
+            {"id": self.review1["id"], "property_id": self.property2["id"], "poster_id": self.account1["id"],
+             "rating": 3, "content": "Moved"},
+        ])
+        assert (response.json()["created"], response.json()["updated"]) == (0, 1)
+        fetched_property = client.get(f"/api/properties/{self.property1['id']}").json()
+        assert (fetched_property["review_count"], fetched_property["rating_histogram"]) == (0, [0] * 6)
+        fetched_property = client.get(f"/api/properties/{self.property2['id']}").json()
+        assert fetched_property["rating_histogram"] == [0, 0, 1, 1, 1, 0]
+
+        # Without upsert an existing id is an error for that item only
+        response = client.post("/api/reviews/bulk", json=[
+            {"id": self.review1["id"], "property_id": self.property2["id"], "poster_id": self.account1["id"],
+             "rating": 3, "content": "Again"},
+            {"property_id": self.property2["id"], "poster_id": self.account1["id"], "rating": 5, "content": "New"},
+        ])
+        assert response.json()["created"] == 1
+        assert [error["index"] for error in response.json()["errors"]] == [0]
+
+    def test_create_reviews_bulk_streamed(self, monkeypatch):
+
+        # Stream NDJSON in small pieces that split lines, with one line over the limit
+        monkeypatch.setattr(settings, "max_bulk_line_bytes", 200)
+        item: dict = {"property_id": self.property2["id"], "poster_id": self.account2["id"], "rating": 4}
+        body: bytes = "\n".join([
+            json.dumps({**item, "content": "First"}),
+            json.dumps({**item, "content": "x" * 300}),
+            "",
+            json.dumps({**item, "content": "Last"}),
+        ]).encode()
+        response = client.post("/api/reviews/bulk", data=(body[i:i + 7] for i in range(0, len(body), 7)),
+                               headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200
+        result: dict = response.json()
+        assert result["created"] == 2
+        assert result["errors"] == [{"index": 1, "detail": "Line is longer than 200 bytes"}]
+
+        # JSON arrays are parsed whole, so large ones are turned away
+        monkeypatch.setattr(settings, "max_bulk_array_bytes", 100)
+        response = client.post("/api/reviews/bulk", json=[{**item, "content": "Short"}] * 5)
+        assert response.status_code == 413
+
     ### TEST HTTP PATCH FUNCTIONS ###
 
     def test_update_property(self):
@@ -0,0 +1,79 @@
+"""
+Contains the route class shared by all routers
+"""
+
+# FastAPI imports
+from fastapi.routing import APIRoute
+
+# Starlette imports
+from starlette.concurrency import run_in_threadpool
+
+# SQLAlchemy imports
+from sqlalchemy.util import await_only, greenlet_spawn
+
+# AnyIO imports
+import anyio.from_thread
+
+# Settings import
+from .config import settings
+
+# Standard library imports
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable
+
+
+def run_in_greenlet(endpoint: Callable) -> Callable:
+    """
+    Turn a sync endpoint into an async one that runs inside a greenlet
+    when use_async_engine is set, and on the threadpool otherwise.
+
+    Database calls made by the endpoint through the async engine are then
+    awaited on the event loop instead of blocking a threadpool worker.
+    The mode is read on every call, so it can be switched in tests.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        if settings.use_async_engine:
+            return await greenlet_spawn(endpoint, *args, **kwargs)
+        return await run_in_threadpool(endpoint, *args, **kwargs)
+
+    return wrapper
+
+
+def call_async(function: Callable[..., Awaitable], *args) -> Any:
+    """
+    Call an async function from a sync endpoint and wait for its result
+
+    Awaited in the endpoint's greenlet when use_async_engine is set, and
+    handed to the event loop from the threadpool thread otherwise. Not for
+    threadpool_route endpoints, which run on the threadpool in both modes.
+    """
+    if settings.use_async_engine:
+        return await_only(function(*args))
+    return anyio.from_thread.run(function, *args)
+
+
+def threadpool_route(endpoint: Callable) -> Callable:
+    """
+    Keep a sync endpoint on the threadpool even when use_async_engine is set
+
+    For handlers doing blocking file or Azure I/O, hashing or image work,
+    which would stall every other request if run on the event loop. They
+    must take their session from get_sync_session.
+    """
+    endpoint.threadpool = True
+    return endpoint
+
+
+class AppRoute(APIRoute):
+    """
+    Route class which makes every handler async when use_async_engine is set,
+    except those marked with threadpool_route
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs) -> None:
+        if not asyncio.iscoroutinefunction(endpoint) and not getattr(endpoint, "threadpool", False):
+            endpoint = run_in_greenlet(endpoint)
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,62 @@
+"""
+Contains helpers to write a row and read it back in one round trip
+
+INSERT and UPDATE ... RETURNING hand back the columns a response needs,
+so routes don't refresh the row with another SELECT after committing.
+Updates check and bump the row version themselves, as the ORM's version
+counter would, and raise StaleDataError (a 412) if another write won.
+"""
+
+# SQLModel imports
+from sqlmodel import Session, SQLModel, insert, update
+
+# SQLAlchemy imports
+from sqlalchemy import Column
+from sqlalchemy.engine import Row
+from sqlalchemy.orm.exc import StaleDataError
+
+# Standard library imports
+import uuid
+
+
+def read_columns(model: type[SQLModel], read_model: type[SQLModel]) -> list[Column]:
+    """
+    Get the table columns behind a read model's fields, plus the row version
+    """
+    table = model.__table__
+    names: list[str] = [name for name in read_model.__fields__ if name in table.c]
+    if "version" in table.c and "version" not in names:
+        names.append("version")
+    return [table.c[name] for name in names]
+
+
+def insert_returning(session: Session, model: type[SQLModel], read_model: type[SQLModel], values: dict) -> Row:
+    """
+    Insert a row, returning the columns of its read model and its version
+    """
+    return session.execute(
+        insert(model).values(**values).returning(*read_columns(model, read_model))
+    ).one()
+
+
+def update_returning(
+    session: Session,
+    model: type[SQLModel],
+    read_model: type[SQLModel],
+    id: uuid.UUID,
+    version: int,
+    values: dict,
+) -> Row:
+    """
+    Update a row at a known version, returning the same columns as insert_returning
+    """
+    row: Row | None = session.execute(
+        update(model)
+        .where(model.id == id, model.version == version)
+        .values(**values, version=model.version + 1)
+        .returning(*read_columns(model, read_model))
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+    if row is None:
+        raise StaleDataError(f"{model.__tablename__} {id} was modified by another write")
+    return row
@@ -0,0 +1,96 @@
+"""
+Compression benchmark for a running API
+
+Fetches each endpoint's uncompressed body once, then times compressing it
+with every installed encoding at a few levels. For each one it prints the
+bytes saved per response and the CPU time it costs, and what that comes
+to at the given request rate. br and zstd are only measured when the
+brotli and zstandard packages are installed, as in the middleware.
+
+Example (with the API running and some data loaded):
+    uvicorn app.main:app --port 8000
+    python -m benchmarks.compression http://localhost:8000 --rate 500
+    python -m benchmarks.compression http://localhost:8000 -e "/api/reviews/?limit=100"
+"""
+
+# Standard library imports
+import argparse
+import statistics
+import time
+import urllib.request
+import zlib
+from typing import Callable
+
+# Endpoints measured when none are given, as in the load profile
+DEFAULT_ENDPOINTS: tuple[str, ...] = (
+    "/api/properties/?limit=100",
+    "/api/properties/?limit=100&expand=images,reviews",
+    "/api/properties/?limit=100&fields=id,name,monthly_rent",
+    "/api/reviews/?limit=100",
+    "/api/accounts/?limit=100",
+)
+
+
+def fetch(url: str) -> bytes:
+    """
+    Get the identity encoded body of a URL
+    """
+    request = urllib.request.Request(url, headers={"Accept-Encoding": "identity"})
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def encoders() -> list[tuple[str, int, Callable[[bytes], bytes]]]:
+    """
+    Get (encoding, level, compress) for each installed encoding at a few levels
+    """
+    from app.compression import _BrotliCompressor, _ZstdCompressor, brotli, zstandard
+
+    def one_shot(factory: Callable) -> Callable[[bytes], bytes]:
+        def compress(body: bytes) -> bytes:
+            compressor = factory()
+            return compressor.compress(body) + compressor.flush()
+        return compress
+
+    found: list = [("gzip", level, one_shot(lambda level=level: zlib.compressobj(level, zlib.DEFLATED, 31)))
+                   for level in (1, 6, 9)]
+    if brotli is not None:
+        found += [("br", level, one_shot(lambda level=level: _BrotliCompressor(level))) for level in (1, 4, 11)]
+    if zstandard is not None:
+        found += [("zstd", level, one_shot(lambda level=level: _ZstdCompressor(level))) for level in (1, 3, 19)]
+    return found
+
+
+def measure(count: int, compress: Callable[[bytes], bytes], body: bytes) -> tuple[int, float]:
+    """
+    Compress a body count times, returning its compressed size and the median seconds taken
+    """
+    timings: list[float] = []
+    for _ in range(count):
+        start: float = time.process_time()
+        compressed: bytes = compress(body)
+        timings.append(time.process_time() - start)
+    return len(compressed), statistics.median(timings)
+
+
+def run(base_url: str, endpoints: list[str], count: int, rate: float) -> None:
+    print(f"runs per case: {count}, rate: {rate:g} req/s per endpoint")
+    print(f"{'encoding':<9} {'bytes':>9} {'saved':>7} {'cpu/resp':>10} {'MB/s saved':>11} {'cpu cores':>10}")
+    for endpoint in endpoints:
+        body: bytes = fetch(base_url.rstrip("/") + endpoint)
+        print(f"\n{endpoint}  ({len(body)} bytes)")
+        for encoding, level, compress in encoders():
+            size, seconds = measure(count, compress, body)
+            saved: int = len(body) - size
+            print(f"{f'{encoding}-{level}':<9} {size:9d} {saved / len(body):6.1%} {seconds * 1e6:7.0f} us "
+                  f"{saved * rate / 1e6:11.2f} {seconds * rate:10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url")
+    parser.add_argument("-e", "--endpoint", action="append", help="path to measure (repeatable)")
+    parser.add_argument("-n", "--count", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=500.0, help="requests per second per endpoint (default: 500)")
+    args = parser.parse_args()
+    run(args.base_url, args.endpoint or list(DEFAULT_ENDPOINTS), args.count, args.rate)
@@ -0,0 +1,96 @@
+"""
+Load benchmark for a running API
+
+Opens many concurrent keep-alive connections against one URL and reports
+throughput and latency. Only uses the standard library, so it can run
+anywhere the API runs.
+
+Example (run the API once with USE_ASYNC_ENGINE=false and once with true):
+    uvicorn app.main:app --port 8000 --workers 1
+    python -m benchmarks.load http://localhost:8000/api/properties/ -c 500 -d 30
+"""
+
+# Standard library imports
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def worker(host: str, port: int, target: str, deadline: float, latencies: list, errors: list):
+    """
+    Send GET requests over one keep-alive connection until the deadline
+    """
+    request: bytes = f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode()
+    reader, writer = None, None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+
+            # Send the request and read the status line and headers
+            start: float = time.perf_counter()
+            writer.write(request)
+            status_line: bytes = await reader.readline()
+            headers: dict = {}
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                key, _, value = line.decode().partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            # Read the body, either fixed length or chunked
+            if "content-length" in headers:
+                await reader.readexactly(int(headers["content-length"]))
+            else:
+                while (size := int((await reader.readline()).strip(), 16)) > 0:
+                    await reader.readexactly(size + 2)
+                await reader.readline()
+
+            # Record the result
+            if status_line.split()[1] == b"200":
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status_line.decode().strip())
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            errors.append(repr(e))
+            if writer is not None:
+                writer.close()
+            reader, writer = None, None
+
+    if writer is not None:
+        writer.close()
+
+
+async def run(url: str, concurrency: int, duration: float) -> None:
+    parts = urlsplit(url)
+    target: str = parts.path + (f"?{parts.query}" if parts.query else "")
+    latencies: list = []
+    errors: list = []
+
+    # Start all the workers at once and let them run for the duration
+    deadline: float = time.perf_counter() + duration
+    await asyncio.gather(*[
+        worker(parts.hostname, parts.port or 80, target, deadline, latencies, errors)
+        for _ in range(concurrency)
+    ])
+
+    # Print a summary
+    latencies.sort()
+    print(f"url:          {url}")
+    print(f"concurrency:  {concurrency}")
+    print(f"requests:     {len(latencies)} ok, {len(errors)} errors")
+    print(f"throughput:   {len(latencies) / duration:.1f} req/s")
+    if latencies:
+        print(f"latency p50:  {statistics.median(latencies) * 1000:.1f} ms")
+        print(f"latency p99:  {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+    if errors:
+        print(f"first error:  {errors[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=500)
+    parser.add_argument("-d", "--duration", type=float, default=30.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.duration))
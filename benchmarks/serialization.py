@@ -0,0 +1,102 @@
+"""
+Response serialization benchmark, without a database
+
+Times turning a page of rows into a JSON body two ways for each list
+endpoint: the path the routes used to take (ORM objects validated against
+the response_model by FastAPI, run through jsonable_encoder and rendered
+by JSONResponse) and the fast path they take now (column tuples zipped
+with the read model's names and encoded by orjson). The rows are built in
+memory, so only serialization is measured.
+
+Example (from the repository root):
+    python -m benchmarks.serialization -n 500 --page 100
+"""
+
+# Standard library imports
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Callable
+
+# Third party imports
+import orjson
+
+
+def measure(count: int, render: Callable[[], bytes]) -> float:
+    """
+    Render a page count times, returning the median time in milliseconds
+    """
+    timings: list[float] = []
+    for _ in range(count):
+        start: float = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def run(count: int, page: int) -> None:
+
+    # Imported here so --help works without the app's dependencies. Only
+    # models are needed; app.main would connect to the database
+    import uuid
+    from datetime import date
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from app.accounts.models import Account, AccountRead
+    from app.properties.models import Property, PropertyRead
+    from app.reviews.models import Review, ReviewRead
+    from app.serialization import row_names
+    from app.writes import read_columns
+
+    owner_id, property_id = uuid.uuid4(), uuid.uuid4()
+    samples: dict[str, Callable[[int], dict]] = {
+        "accounts": lambda i: dict(fname="Bench", lname=f"Mark {i}", email=f"bench{i}@example.com"),
+        "properties": lambda i: dict(owner_id=owner_id, name=f"Bench {i}", address=f"{i} Bench St",
+                                     description="Benchmark " * 20, start_date=date(2022, 11, 30),
+                                     end_date=date(2023, 11, 30), monthly_rent=1000 + i, num_bedrooms=2,
+                                     num_bathrooms=1, review_count=4, rating_sum=14, average_rating=3.5),
+        "reviews": lambda i: dict(property_id=property_id, poster_id=owner_id, rating=i % 6,
+                                  content="Great place to live " * 10),
+    }
+    endpoints = (("accounts", Account, AccountRead), ("properties", Property, PropertyRead),
+                 ("reviews", Review, ReviewRead))
+
+    # One event loop for every call, so its setup isn't timed
+    loop = asyncio.new_event_loop()
+
+    print(f"pages per case: {count}, rows per page: {page}")
+    print(f"{'endpoint':<12} {'response_model':>16} {'orjson':>10} {'speedup':>9}")
+    for name, model, read_model in endpoints:
+
+        # The same rows as ORM objects and as the tuples a column select returns
+        objects = [model(id=uuid.uuid4(), created=date.today(), version=1, **samples[name](i)) for i in range(page)]
+        columns: list[str] = [column.key for column in read_columns(model, read_model)]
+        rows: list[tuple] = [tuple(getattr(object, column) for column in columns) for object in objects]
+        names: list[str] = row_names(model, read_model)
+        field = create_response_field(name=f"Response_{name}", type_=list[read_model])
+
+        def response_model_path() -> bytes:
+            content = loop.run_until_complete(
+                serialize_response(field=field, response_content=objects, is_coroutine=True))
+            return JSONResponse(content).body
+
+        def orjson_path() -> bytes:
+            return orjson.dumps([dict(zip(names, row)) for row in rows])
+
+        # Both paths must produce the same document
+        assert orjson.loads(response_model_path()) == orjson.loads(orjson_path())
+
+        before: float = measure(count, response_model_path)
+        after: float = measure(count, orjson_path)
+        print(f"{name:<12} {before:13.3f} ms {after:7.3f} ms {before / after:8.1f}x")
+    loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=500)
+    parser.add_argument("--page", type=int, default=100, help="rows per page (default: 100)")
+    args = parser.parse_args()
+    run(args.count, args.page)
@@ -0,0 +1,118 @@
+"""
+Write latency benchmark against the configured database
+
+Times creating and updating reviews two ways: the ORM path the routes
+used to take (add, commit, then refresh with a SELECT) and the
+INSERT/UPDATE ... RETURNING path they take now. Each write runs in its
+own transaction, like a request. The rows are deleted afterwards.
+
+Example (against a local database, from the repository root):
+    python -m benchmarks.writes -n 2000
+"""
+
+# Standard library imports
+import argparse
+import statistics
+import time
+from typing import Callable
+
+
+def measure(label: str, count: int, write: Callable[[int], None]) -> list[float]:
+    """
+    Run a write count times and print its latency percentiles
+    """
+    latencies: list[float] = []
+    for i in range(count):
+        start: float = time.perf_counter()
+        write(i)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"{label:<22} p50 {statistics.median(latencies) * 1000:6.2f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.2f} ms   "
+          f"mean {statistics.fmean(latencies) * 1000:6.2f} ms")
+    return latencies
+
+
+def run(count: int) -> None:
+
+    # Imported here so --help works without a database
+    import app.main  # noqa: F401
+    from sqlmodel import Session, delete
+    from app.database import engine
+    from app.accounts.models import Account
+    from app.properties.models import Property
+    from app.reviews.models import Review, ReviewRead
+    from app.writes import insert_returning, update_returning
+
+    # Make an account and a property for the reviews to belong to
+    with Session(engine) as session:
+        account = Account(fname="Bench", lname="Mark", email="bench@example.com")
+        session.add(account)
+        session.flush()
+        property = Property(owner_id=account.id, name="Bench", address="1 Bench St", description="Benchmark",
+                            start_date="2022-11-30", end_date="2023-11-30", monthly_rent=1000,
+                            num_bedrooms=1, num_bathrooms=1)
+        session.add(property)
+        session.commit()
+        account_id, property_id = account.id, property.id
+
+    review_ids: dict[str, list] = {"orm": [], "returning": []}
+
+    def orm_create(i: int) -> None:
+        with Session(engine) as session:
+            review = Review(property_id=property_id, poster_id=account_id, rating=i % 6, content="orm")
+            session.add(review)
+            session.commit()
+            session.refresh(review)
+            review_ids["orm"].append(review.id)
+
+    def returning_create(i: int) -> None:
+        with Session(engine) as session:
+            row = insert_returning(session, Review, ReviewRead, {
+                "property_id": property_id, "poster_id": account_id, "rating": i % 6, "content": "returning",
+            })
+            session.commit()
+            review_ids["returning"].append(row.id)
+
+    def orm_update(i: int) -> None:
+        with Session(engine) as session:
+            review = session.get(Review, review_ids["orm"][i])
+            review.content = f"orm {i}"
+            session.add(review)
+            session.commit()
+            session.refresh(review)
+
+    def returning_update(i: int) -> None:
+        with Session(engine) as session:
+            review = session.get(Review, review_ids["returning"][i])
+            update_returning(session, Review, ReviewRead, review.id, review.version, {"content": f"returning {i}"})
+            session.commit()
+
+    try:
+        # Warm up the pool and the statement caches
+        orm_create(0)
+        returning_create(0)
+
+        print(f"writes per case: {count}")
+        results: dict = {}
+        for label, write in (("create, refresh", orm_create), ("create, returning", returning_create),
+                             ("update, refresh", orm_update), ("update, returning", returning_update)):
+            results[label] = statistics.median(measure(label, count, write))
+        for action in ("create", "update"):
+            saved: float = results[f"{action}, refresh"] - results[f"{action}, returning"]
+            print(f"{action}: {saved * 1000:.2f} ms saved per write at p50")
+
+    finally:
+        # Clean up everything the benchmark wrote
+        with Session(engine) as session:
+            session.exec(delete(Review).where(Review.property_id == property_id))
+            session.exec(delete(Property).where(Property.id == property_id))
+            session.exec(delete(Account).where(Account.id == account_id))
+            session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.count)
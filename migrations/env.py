@@ -0,0 +1,55 @@
+"""
+Alembic environment, run with "alembic upgrade head"
+"""
+
+# Alembic imports
+from alembic import context
+
+# SQLModel imports
+from sqlmodel import SQLModel
+
+# Database imports
+from app.database import engine
+
+# Model imports, so every table is registered on the metadata
+from app.accounts.models import Account
+from app.properties.models import Property
+from app.property_images.models import BlobDeletion, ImageBlob, PropertyImage, PropertyImageDerivative
+from app.reviews.models import Review
+
+# Standard library imports
+from logging.config import fileConfig
+
+# Set up logging from alembic.ini
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name)
+
+
+def run_migrations_offline() -> None:
+    """
+    Emit the migration SQL to stdout instead of running it
+    """
+    context.configure(
+        url=engine.url,
+        target_metadata=SQLModel.metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """
+    Run the migrations against the configured database
+    """
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=SQLModel.metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
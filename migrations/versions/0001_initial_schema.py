@@ -0,0 +1,72 @@
+"""initial schema
+
+Tables as they were created by create_all before migrations existed.
+Databases created that way should be stamped with "alembic stamp 0001".
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('accounts',
+    sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('fname', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('lname', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('properties',
+    sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('owner_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('address', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('description', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('end_date', sa.Date(), nullable=False),
+    sa.Column('monthly_rent', sa.Integer(), nullable=False),
+    sa.Column('num_bedrooms', sa.Integer(), nullable=False),
+    sa.Column('num_bathrooms', sa.Integer(), nullable=False),
+    sa.Column('created', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['accounts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('property_images',
+    sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('property_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('path', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('path')
+    )
+    op.create_table('reviews',
+    sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('property_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('poster_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=False),
+    sa.Column('content', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['poster_id'], ['accounts.id'], ),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('reviews')
+    op.drop_table('property_images')
+    op.drop_table('properties')
+    op.drop_table('accounts')
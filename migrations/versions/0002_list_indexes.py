@@ -0,0 +1,43 @@
+"""list indexes
+
+Indexes matching the keyset pagination and foreign key filters used by the
+list routes. They are built CONCURRENTLY so they can be added to live tables
+without blocking writes, which requires running outside a transaction.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# Index name, table and columns
+indexes: list[tuple[str, str, list[str]]] = [
+    ('ix_accounts_created_id', 'accounts', ['created', 'id']),
+    ('ix_properties_created_id', 'properties', ['created', 'id']),
+    ('ix_properties_owner_id_created_id', 'properties', ['owner_id', 'created', 'id']),
+    ('ix_property_images_property_id_created_id', 'property_images', ['property_id', 'created', 'id']),
+    ('ix_reviews_created_id', 'reviews', ['created', 'id']),
+    ('ix_reviews_property_id_created_id', 'reviews', ['property_id', 'created', 'id']),
+    ('ix_reviews_poster_id_created_id', 'reviews', ['poster_id', 'created', 'id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(indexes):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,66 @@
+"""rating aggregates
+
+Adds review_count, rating_sum, rating_histogram and the generated
+average_rating column to properties, then backfills them from reviews.
+Ratings used to take any integer, so existing ones are clamped to 0-5
+first and a check constraint keeps them there, as the histogram has one
+bucket per rating.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+
+# Revision identifiers, used by Alembic
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('properties', sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('properties', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('properties', sa.Column('rating_histogram', postgresql.ARRAY(sa.Integer()), server_default='{0,0,0,0,0,0}', nullable=False))
+    op.add_column('properties', sa.Column('average_rating', sa.Float(), sa.Computed('CASE WHEN review_count > 0 THEN rating_sum::float / review_count ELSE 0 END'), nullable=True))
+
+    # Clamp ratings from before they were validated, and keep them in range
+    op.execute("UPDATE reviews SET rating = least(greatest(rating, 0), 5) WHERE rating NOT BETWEEN 0 AND 5")
+    op.create_check_constraint('ck_reviews_rating_range', 'reviews', 'rating BETWEEN 0 AND 5')
+
+    # Backfill from existing reviews
+    op.execute("""
+        UPDATE properties p
+        SET review_count = agg.review_count,
+            rating_sum = agg.rating_sum,
+            rating_histogram = agg.rating_histogram
+        FROM (
+            SELECT property_id,
+                   count(*) AS review_count,
+                   sum(rating) AS rating_sum,
+                   ARRAY[
+                       count(*) FILTER (WHERE rating = 0),
+                       count(*) FILTER (WHERE rating = 1),
+                       count(*) FILTER (WHERE rating = 2),
+                       count(*) FILTER (WHERE rating = 3),
+                       count(*) FILTER (WHERE rating = 4),
+                       count(*) FILTER (WHERE rating = 5)
+                   ]::integer[] AS rating_histogram
+            FROM reviews
+            GROUP BY property_id
+        ) agg
+        WHERE p.id = agg.property_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_constraint('ck_reviews_rating_range', 'reviews', type_='check')
+    op.drop_column('properties', 'average_rating')
+    op.drop_column('properties', 'rating_histogram')
+    op.drop_column('properties', 'rating_sum')
+    op.drop_column('properties', 'review_count')
@@ -0,0 +1,36 @@
+"""search indexes
+
+Indexes backing the property search route: keyset sorts on rent and
+rating, room count filters, and a GiST index on the availability window
+for date overlap queries. Built CONCURRENTLY outside a transaction.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_properties_monthly_rent_id', 'properties', ['monthly_rent', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_properties_average_rating_id', 'properties', ['average_rating', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_properties_num_bedrooms_num_bathrooms_monthly_rent', 'properties', ['num_bedrooms', 'num_bathrooms', 'monthly_rent'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_properties_availability', 'properties', [sa.text("daterange(start_date, greatest(start_date, end_date), '[]')")], unique=False, postgresql_using='gist', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_properties_availability', table_name='properties', postgresql_concurrently=True)
+        op.drop_index('ix_properties_num_bedrooms_num_bathrooms_monthly_rent', table_name='properties', postgresql_concurrently=True)
+        op.drop_index('ix_properties_average_rating_id', table_name='properties', postgresql_concurrently=True)
+        op.drop_index('ix_properties_monthly_rent_id', table_name='properties', postgresql_concurrently=True)
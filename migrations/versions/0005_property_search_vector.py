@@ -0,0 +1,37 @@
+"""property search vector
+
+Adds the generated full text search column to properties and a GIN index
+on it. Adding a stored generated column rewrites the table, so run this
+in a quiet period on large databases. The index is built CONCURRENTLY.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+
+# Revision identifiers, used by Alembic
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('properties', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "setweight(to_tsvector('english'::regconfig, name), 'A') || "
+        "setweight(to_tsvector('english'::regconfig, address), 'B') || "
+        "setweight(to_tsvector('english'::regconfig, description), 'C')"
+    ), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_properties_search_vector', 'properties', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_properties_search_vector', table_name='properties', postgresql_concurrently=True)
+    op.drop_column('properties', 'search_vector')
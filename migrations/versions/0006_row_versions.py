@@ -0,0 +1,31 @@
+"""row versions
+
+Adds the version column used for optimistic locking and ETags to
+accounts, properties and reviews.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('accounts', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('properties', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('reviews', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('reviews', 'version')
+    op.drop_column('properties', 'version')
+    op.drop_column('accounts', 'version')
@@ -0,0 +1,29 @@
+"""image checksums
+
+Adds the SHA-256 checksum and byte size recorded while streaming image
+uploads to storage.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('property_images', sa.Column('checksum', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('property_images', sa.Column('size', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('property_images', 'size')
+    op.drop_column('property_images', 'checksum')
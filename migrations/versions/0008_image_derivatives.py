@@ -0,0 +1,39 @@
+"""image derivatives
+
+Adds the table recording the resized copies built for each property
+image.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'property_image_derivatives',
+        sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('image_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('width', sa.Integer(), nullable=False),
+        sa.Column('height', sa.Integer(), nullable=False),
+        sa.Column('format', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('path', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['image_id'], ['property_images.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('image_id', 'width', 'format'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('property_image_derivatives')
@@ -0,0 +1,95 @@
+"""image blobs
+
+Moves image bytes to content addressed, reference counted blobs.
+
+Existing images with a checksum get a blob row pointing at one of their
+files, and their derivatives move from the image to the blob. The
+unique constraint on property_images.path goes, since images with the
+same bytes now share a path.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'image_blobs',
+        sa.Column('checksum', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('path', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('content_type', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('checksum'),
+    )
+    op.execute("""
+        INSERT INTO image_blobs (checksum, path, size, content_type, ref_count, created)
+        SELECT checksum,
+               min(path),
+               max(size),
+               CASE WHEN lower(min(path)) LIKE '%.png' THEN 'image/png' ELSE 'image/jpeg' END,
+               count(*),
+               min(created)
+        FROM property_images
+        WHERE checksum IS NOT NULL
+        GROUP BY checksum
+    """)
+
+    # Images
+    op.drop_constraint('property_images_path_key', 'property_images', type_='unique')
+    op.add_column('property_images', sa.Column('filename', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.create_foreign_key('property_images_checksum_fkey', 'property_images', 'image_blobs', ['checksum'], ['checksum'])
+    op.create_index('ix_property_images_checksum', 'property_images', ['checksum'], unique=False)
+
+    # Derivatives, keeping one per blob, width and format
+    op.add_column('property_image_derivatives', sa.Column('checksum', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.execute("""
+        UPDATE property_image_derivatives AS d
+        SET checksum = i.checksum
+        FROM property_images AS i
+        WHERE i.id = d.image_id
+    """)
+    op.execute("""
+        DELETE FROM property_image_derivatives
+        WHERE id NOT IN (
+            SELECT DISTINCT ON (checksum, width, format) id
+            FROM property_image_derivatives
+            WHERE checksum IS NOT NULL
+        )
+    """)
+    op.alter_column('property_image_derivatives', 'checksum', nullable=False)
+    op.drop_column('property_image_derivatives', 'image_id')
+    op.create_foreign_key('property_image_derivatives_checksum_fkey', 'property_image_derivatives', 'image_blobs', ['checksum'], ['checksum'])
+    op.create_unique_constraint('property_image_derivatives_checksum_width_format_key', 'property_image_derivatives', ['checksum', 'width', 'format'])
+
+
+def downgrade() -> None:
+    op.add_column('property_image_derivatives', sa.Column('image_id', sqlmodel.sql.sqltypes.GUID(), nullable=True))
+    op.execute("""
+        UPDATE property_image_derivatives AS d
+        SET image_id = (SELECT id FROM property_images AS i WHERE i.checksum = d.checksum ORDER BY id LIMIT 1)
+    """)
+    op.execute("DELETE FROM property_image_derivatives WHERE image_id IS NULL")
+    op.alter_column('property_image_derivatives', 'image_id', nullable=False)
+    op.drop_column('property_image_derivatives', 'checksum')
+    op.create_foreign_key('property_image_derivatives_image_id_fkey', 'property_image_derivatives', 'property_images', ['image_id'], ['id'])
+    op.create_unique_constraint('property_image_derivatives_image_id_width_format_key', 'property_image_derivatives', ['image_id', 'width', 'format'])
+
+    op.drop_index('ix_property_images_checksum', table_name='property_images')
+    op.drop_constraint('property_images_checksum_fkey', 'property_images', type_='foreignkey')
+    op.drop_column('property_images', 'filename')
+    op.create_unique_constraint('property_images_path_key', 'property_images', ['path'])
+
+    op.drop_table('image_blobs')
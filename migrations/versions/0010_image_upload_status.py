@@ -0,0 +1,30 @@
+"""image upload status
+
+Adds the status and declared checksum of images uploaded straight to
+storage through pre-signed URLs. Existing images are ready.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('property_images', sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), server_default='ready', nullable=False))
+    op.alter_column('property_images', 'status', server_default=None)
+    op.add_column('property_images', sa.Column('expected_checksum', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('property_images', 'expected_checksum')
+    op.drop_column('property_images', 'status')
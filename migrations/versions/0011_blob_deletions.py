@@ -0,0 +1,39 @@
+"""blob deletions
+
+Adds the queue of stored files waiting to be deleted by the background
+deletion job.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# Revision identifiers, used by Alembic
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'blob_deletions',
+        sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('path', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('checksum', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('next_attempt', sa.DateTime(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_blob_deletions_next_attempt', 'blob_deletions', ['next_attempt'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blob_deletions_next_attempt', table_name='blob_deletions')
+    op.drop_table('blob_deletions')
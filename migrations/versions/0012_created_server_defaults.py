@@ -0,0 +1,31 @@
+"""created server defaults
+
+Sets created columns to default to CURRENT_DATE in the database, so rows
+get the date they were written on rather than the date the app started,
+and writes can leave the column out and read it back with RETURNING.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# Revision identifiers, used by Alembic
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+TABLES = ['accounts', 'properties', 'reviews', 'property_images', 'image_blobs']
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.alter_column(table, 'created', server_default=sa.text('CURRENT_DATE'))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.alter_column(table, 'created', server_default=None)
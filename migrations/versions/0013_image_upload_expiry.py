@@ -0,0 +1,26 @@
+"""image upload expiry
+
+Records when a pending image's pre-signed upload URL expires, so the
+reconcile job can remove uploads that were never finished.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# Revision identifiers, used by Alembic
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('property_images', sa.Column('upload_expires', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('property_images', 'upload_expires')
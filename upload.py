@@ -1,12 +1,13 @@
 import requests
 import random
-import time
-
-url = f"https://app-sublettersapi-dev.azurewebsites.net/api/reviews/"
-# url = f"http://localhost:8000/api/reviews/"
+import json
 
+url = f"https://app-sublettersapi-dev.azurewebsites.net/api/reviews/bulk"
+# url = f"http://localhost:8000/api/reviews/bulk"
 
 
+# Send every review in one NDJSON request instead of one request each
+lines = []
 for i in range (1, 101):
     data = {
         "property_id": "f9475442-bfe7-441a-823a-39c5ea35be0c",
@@ -14,5 +15,6 @@ for i in range (1, 101):
         "rating": random.randint(1, 5),
         "content": f"This is review {i}"
     }
-    response = requests.post(url, json=data)
-    print(response.text)
\ No newline at end of file
+    lines.append(json.dumps(data))
+response = requests.post(url, data="\n".join(lines), headers={"Content-Type": "application/x-ndjson"})
+print(response.text)